@@ -1,15 +1,31 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import NoteAnalysis, NoteComparison
+from . import search
+from .models import NoteAnalysis, NoteComparison, AnalysisJob
 
 @admin.register(NoteAnalysis)
 class NoteAnalysisAdmin(admin.ModelAdmin):
     list_display = ['id', 'difficulty', 'bloom_level', 'created_at']
     list_filter = ['difficulty', 'bloom_level', 'created_at']
-    search_fields = ['summary', 'tags']
+    search_fields = ['summary']
     readonly_fields = ['created_at']
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Search the full-text index (tags, summary, key points and note) instead of LIKE scans"""
+        if not search_term:
+            return queryset, False
+        matches = search.search(search_term, limit=settings.SEARCH_ADMIN_LIMIT)
+        return queryset.filter(id__in=[analysis_id for analysis_id, _ in matches]), False
 
 @admin.register(NoteComparison)
 class NoteComparisonAdmin(admin.ModelAdmin):
     list_display = ['id', 'similarity_score', 'created_at']
     list_filter = ['similarity_score', 'created_at']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'attempts', 'file_name', 'created_at', 'updated_at']
+    list_filter = ['status', 'created_at']
+    readonly_fields = ['created_at', 'updated_at']
+    exclude = ['file_data']
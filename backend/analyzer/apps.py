@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class AnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'analyzer'
\ No newline at end of file
+    name = 'analyzer'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,73 @@
+"""
+Model fields stored compressed (see utils.compression) and used like TextField and JSONField
+Values are opaque bytes in the database, so these columns cannot be filtered or searched in SQL
+"""
+
+import json
+
+from django import forms
+from django.db import models
+
+from .utils.compression import compress, decompress
+
+
+class CompressedTextField(models.BinaryField):
+    """Text kept compressed in a binary column; reads and writes str"""
+    empty_values = [None, '']
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('editable', None)
+        if not self.editable:
+            kwargs['editable'] = False
+        return name, path, args, kwargs
+
+    def encode(self, value):
+        return value.encode('utf-8')
+
+    def decode(self, data):
+        return data.decode('utf-8')
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.decode(decompress(value))
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return self.decode(decompress(value))
+        return value
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return value
+        return compress(self.encode(value))
+
+    def get_default(self):
+        return models.Field.get_default(self)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'form_class': forms.CharField, 'widget': forms.Textarea, **kwargs})
+
+
+class CompressedJSONField(CompressedTextField):
+    """JSON kept compressed in a binary column; reads and writes Python values like JSONField"""
+    empty_strings_allowed = False
+    empty_values = [None]
+
+    def encode(self, value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'form_class': forms.JSONField, **kwargs})
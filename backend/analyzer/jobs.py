@@ -0,0 +1,176 @@
+"""
+Database-backed job queue for background analyses
+Works on SQLite and PostgreSQL without a message broker
+"""
+
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AnalysisJob
+from .services import analyze_text, extract_text, save_analysis
+from .utils.file_handler import FileHandler
+
+
+def enqueue_text(session_key, text, mode=None):
+    """Queue analysis of submitted text"""
+    return AnalysisJob.objects.create(
+        session_key=session_key,
+        mode=mode or '',
+        input_text=text,
+        max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS
+    )
+
+
+def enqueue_file(session_key, uploaded_file, mode=None):
+    """Queue extraction and analysis of an uploaded file"""
+    return AnalysisJob.objects.create(
+        session_key=session_key,
+        mode=mode or '',
+        file_name=uploaded_file.name,
+        file_data=uploaded_file.read(),
+        max_attempts=settings.ANALYSIS_JOB_MAX_ATTEMPTS
+    )
+
+
+def claim_next_job(worker_id, visibility_timeout):
+    """
+    Atomically claim the oldest available job, or return None
+    A claimed job stays invisible to other workers for visibility_timeout seconds
+    """
+    now = timezone.now()
+    claimable = Q(status=AnalysisJob.STATUS_PENDING) | Q(status=AnalysisJob.STATUS_RUNNING)
+
+    # Running jobs whose worker disappeared after their last attempt are given up on
+    AnalysisJob.objects.filter(
+        status=AnalysisJob.STATUS_RUNNING, available_at__lte=now, attempts__gte=F('max_attempts')
+    ).update(status=AnalysisJob.STATUS_FAILED, error='Timed out', updated_at=now)
+
+    candidates = AnalysisJob.objects.filter(
+        claimable, available_at__lte=now, attempts__lt=F('max_attempts')
+    ).order_by('available_at', 'id').values_list('id', flat=True)[:10]
+
+    for job_id in candidates:
+        # Compare-and-set: only one worker's UPDATE can match the row
+        claimed = AnalysisJob.objects.filter(
+            claimable, id=job_id, available_at__lte=now, attempts__lt=F('max_attempts')
+        ).update(
+            status=AnalysisJob.STATUS_RUNNING,
+            locked_by=worker_id,
+            attempts=F('attempts') + 1,
+            available_at=now + timedelta(seconds=visibility_timeout),
+            updated_at=now
+        )
+        if claimed:
+            return AnalysisJob.objects.get(id=job_id)
+    return None
+
+
+def extend_visibility(job, worker_id, visibility_timeout):
+    """Keep a running job hidden for another visibility_timeout seconds, if this worker still owns it"""
+    now = timezone.now()
+    return AnalysisJob.objects.filter(
+        id=job.id, status=AnalysisJob.STATUS_RUNNING, locked_by=worker_id
+    ).update(available_at=now + timedelta(seconds=visibility_timeout), updated_at=now)
+
+
+@contextmanager
+def heartbeat(job, worker_id, visibility_timeout):
+    """
+    Extend the job's visibility every third of visibility_timeout while the block runs,
+    so a long analysis that is still making progress is not reclaimed by another worker
+    """
+    stop = threading.Event()
+    
+    def beat():
+        try:
+            while not stop.wait(visibility_timeout / 3):
+                try:
+                    extend_visibility(job, worker_id, visibility_timeout)
+                except Exception as e:
+                    print(f"Heartbeat for job {job.id} failed: {e}")
+        finally:
+            connections.close_all()
+    
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job.id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+class JobReclaimed(Exception):
+    """Raised to roll back a result when another worker has reclaimed the job"""
+
+
+def run_job(job):
+    """Extract (for file jobs) and analyze; returns the arguments of save_analysis after session_key"""
+    if job.file_data is not None:
+        uploaded_file = SimpleUploadedFile(job.file_name, bytes(job.file_data))
+        text = extract_text(uploaded_file)
+        if not FileHandler.clean_text(text):
+            raise ValueError('No text could be extracted from the file')
+    else:
+        text = job.input_text
+    return analyze_text(text, mode=job.mode or None)
+
+
+def complete_job(job, worker_id, note_analysis):
+    """Mark a job done, unless another worker has reclaimed it in the meantime"""
+    return AnalysisJob.objects.filter(
+        id=job.id, status=AnalysisJob.STATUS_RUNNING, locked_by=worker_id
+    ).update(
+        status=AnalysisJob.STATUS_DONE,
+        analysis=note_analysis,
+        file_data=None,  # The upload is no longer needed
+        error='',
+        updated_at=timezone.now()
+    )
+
+
+def fail_job(job, worker_id, error, retry_delay, retryable=True):
+    """Schedule a retry with exponential backoff, or fail the job for good"""
+    now = timezone.now()
+    if retryable and job.attempts < job.max_attempts:
+        delay = retry_delay * (2 ** (job.attempts - 1))
+        updates = {'status': AnalysisJob.STATUS_PENDING, 'available_at': now + timedelta(seconds=delay)}
+    else:
+        updates = {'status': AnalysisJob.STATUS_FAILED, 'file_data': None}
+    return AnalysisJob.objects.filter(
+        id=job.id, status=AnalysisJob.STATUS_RUNNING, locked_by=worker_id
+    ).update(error=str(error)[:1000], updated_at=now, **updates)
+
+
+def process_job(job, worker_id, retry_delay, visibility_timeout=None):
+    """Run a claimed job and record the outcome; with visibility_timeout, keep the claim alive meanwhile"""
+    try:
+        if visibility_timeout:
+            with heartbeat(job, worker_id, visibility_timeout):
+                result = run_job(job)
+        else:
+            result = run_job(job)
+    except ValueError as e:
+        # Unsupported or empty files will not succeed on a retry
+        fail_job(job, worker_id, e, retry_delay, retryable=False)
+        return False
+    except Exception as e:
+        fail_job(job, worker_id, e, retry_delay)
+        return False
+    try:
+        # The analysis is only kept if this worker still owns the job
+        with transaction.atomic():
+            note_analysis = save_analysis(job.session_key, *result)
+            if not complete_job(job, worker_id, note_analysis):
+                raise JobReclaimed
+    except JobReclaimed:
+        print(f"Job {job.id} was reclaimed by another worker, discarding its result")
+        return False
+    return True
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analyzer import tagging
+from analyzer.models import AnalysisTag, NoteAnalysis
+
+
+class Command(BaseCommand):
+    help = 'Fill the normalized tag index (AnalysisTag) from the tags of existing analyses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Analyses per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Delete the whole index first')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        if options['rebuild']:
+            deleted, _ = AnalysisTag.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} tag entries")
+
+        analyses = NoteAnalysis.objects.only('id', 'session_key', 'tags').order_by('id')
+        last_id, done = 0, 0
+        while True:
+            with transaction.atomic():
+                batch = list(analyses.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                tagging.index_analyses(batch)
+            last_id = batch[-1].id
+            done += len(batch)
+            if done % (options['batch_size'] * 50) == 0:
+                self.stdout.write(f"{done} analyses")
+        self.stdout.write(
+            f"Indexed the tags of {done} analyses ({AnalysisTag.objects.count()} entries) in {time.monotonic() - start:.1f} s"
+        )
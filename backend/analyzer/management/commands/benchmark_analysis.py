@@ -0,0 +1,67 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.utils.file_handler import FileHandler
+from analyzer.utils.groq_ai import GroqAIProcessor, ANALYSIS_MODES
+
+SAMPLE_NOTE = """
+Photosynthesis is the process by which green plants, algae and some bacteria convert light energy
+into chemical energy. It takes place mainly in the chloroplasts of leaf cells, where chlorophyll
+absorbs red and blue light. The light-dependent reactions in the thylakoid membranes split water,
+release oxygen and produce ATP and NADPH. The Calvin cycle in the stroma then uses that ATP and
+NADPH to fix carbon dioxide into glucose through the enzyme RuBisCO. The overall rate depends on
+light intensity, carbon dioxide concentration and temperature, and C4 and CAM plants have evolved
+adaptations that reduce photorespiration in hot or dry climates.
+"""
+
+
+class Command(BaseCommand):
+    help = 'Compare tokens and latency of the staged (three-call) and combined (one-call) analysis modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Text file to analyze instead of the built-in sample note')
+        parser.add_argument('--runs', type=int, default=3, help='Runs per mode (default: 3)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if not settings.GROQ_API_KEY and settings.EXTERNAL_SERVICES != 'replay':
+            raise CommandError('GROQ_API_KEY must be set to benchmark the Groq API (or use EXTERNAL_SERVICES=replay)')
+
+        text = SAMPLE_NOTE
+        if options['file']:
+            with open(options['file'], 'r', encoding='utf-8') as f:
+                text = f.read()
+        text = FileHandler.clean_text(text)
+
+        report = {mode: self._benchmark(text, mode, options['runs']) for mode in ANALYSIS_MODES}
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{'mode':<10} {'requests':>9} {'prompt tok':>11} {'output tok':>11} {'total tok':>10} {'latency s':>10}")
+        for mode, row in report.items():
+            self.stdout.write(
+                f"{mode:<10} {row['requests']:>9.1f} {row['prompt_tokens']:>11.0f} "
+                f"{row['completion_tokens']:>11.0f} {row['total_tokens']:>10.0f} {row['latency_seconds']:>10.2f}"
+            )
+
+    def _benchmark(self, text, mode, runs):
+        """Average tokens and wall-clock latency of one analysis mode over several runs"""
+        totals = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        latency = 0.0
+        for _ in range(runs):
+            processor = GroqAIProcessor()
+            processor.use_cache = False  # Measure real API calls, not cache hits
+            start = time.perf_counter()
+            processor.run_analysis(text, mode=mode)
+            latency += time.perf_counter() - start
+            for field in totals:
+                totals[field] += processor.usage[field]
+
+        row = {field: value / runs for field, value in totals.items()}
+        row['latency_seconds'] = latency / runs
+        return row
@@ -0,0 +1,226 @@
+import io
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from analyzer.models import NoteAnalysis
+from analyzer.serializers import NoteAnalysisListSerializer, NoteAnalysisSerializer
+from analyzer.utils.cloud_ocr import FreeOCRExtractor
+from analyzer.utils.file_handler import FileHandler
+from analyzer.utils.groq_ai import GroqAIProcessor
+
+from .benchmark_pdf_extraction import LINE, generate_pdf
+
+
+def generate_text(chars):
+    """Messy extracted text: ragged whitespace, blank lines, stray null and replacement characters"""
+    block = f"  {LINE}\n\n\t{LINE}\x00  �\n"
+    return (block * (chars // len(block) + 1))[:chars]
+
+
+def generate_photo(width, height):
+    """A JPEG 'photo' of a page of text lines on off-white paper"""
+    image = Image.new('RGB', (width, height), (235, 235, 230))
+    draw = ImageDraw.Draw(image)
+    for y in range(height // 8, height - height // 8, max(height // 40, 4)):
+        draw.rectangle((width // 8, y, width - width // 8, y + max(height // 120, 1)), fill=(20, 20, 30))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def generate_ocr_text(lines):
+    """Raw OCR output: short lines, blank lines, pipes and zeros for _clean_ocr_text to fix"""
+    return '\n'.join(f"  |{number} {LINE[:60]} 0ne \n" for number in range(lines))
+
+
+def generate_quiz(questions):
+    """Quiz questions shaped like the model's"""
+    return [
+        {
+            'question': f"Question {number}: {LINE}",
+            'options': ['A) Light', 'B) Water', 'C) Glucose', 'D) Oxygen'],
+            'correct_answer': 'A',
+            'explanation': LINE * 2,
+            'difficulty': 'Medium'
+        }
+        for number in range(questions)
+    ]
+
+
+def generate_llm_reply(payload):
+    """A model reply with prose around a JSON payload"""
+    return f"Here is the result you asked for:\n{json.dumps(payload, indent=2)}\nLet me know if you need more."
+
+
+def stub_client(content):
+    """Client that returns a canned reply without network or mock overhead"""
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+    )
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: response)))
+
+
+def generate_history(rows):
+    """Unsaved NoteAnalysis rows shaped like real results"""
+    now = timezone.now()
+    return [
+        NoteAnalysis(
+            id=number,
+            session_key='benchmark',
+            original_text=LINE * 100,
+            summary=LINE * 5,
+            key_points=[LINE] * 8,
+            difficulty='Medium',
+            bloom_level='Understand',
+            topic_graph=[{'id': f't{n}', 'label': f'Topic {n}', 'children': ['A', 'B', 'C']} for n in range(8)],
+            quiz_questions=generate_quiz(5),
+            tags=['biology', 'plants', 'energy'],
+            learning_objectives=[LINE] * 4,
+            prerequisites=[LINE] * 3,
+            applications=[LINE] * 3,
+            created_at=now
+        )
+        for number in range(rows)
+    ]
+
+
+def clean_text_case(chars):
+    text = generate_text(chars)
+    return lambda: FileHandler.clean_text(text, max_length=None)
+
+
+def pdf_case(pages):
+    data = generate_pdf(pages)
+    unlimited = {'PDF_MAX_CHARS': 10 ** 9, 'PDF_MAX_PAGES': 10 ** 6, 'PDF_EXTRACTION_PROCESSES': 1}
+
+    def run():
+        with override_settings(**unlimited):
+            FileHandler._extract_from_pdf(data)
+    return run
+
+
+def image_case(width, height):
+    data = generate_photo(width, height)
+    extractor = FreeOCRExtractor()
+    return lambda: extractor._optimize_image_for_ocr(data)
+
+
+def clean_ocr_text_case(lines):
+    text = generate_ocr_text(lines)
+    extractor = FreeOCRExtractor(providers=[])
+    return lambda: extractor._clean_ocr_text(text)
+
+
+def json_case(payload, pattern):
+    processor = GroqAIProcessor()
+    processor.client = stub_client(generate_llm_reply(payload))
+    return lambda: processor._complete_json('prompt', 0.3, pattern)
+
+
+def serializer_case(rows):
+    history = generate_history(rows)
+    return lambda: NoteAnalysisSerializer(history, many=True).data
+
+
+def list_serializer_case(rows):
+    history = generate_history(rows)
+    for analysis in history:
+        analysis.summary_preview = analysis.summary[:300]
+    return lambda: NoteAnalysisListSerializer(history, many=True).data
+
+
+# name -> factory that builds the fixture and returns the function to time
+CASES = {
+    'clean_text/10k': lambda: clean_text_case(10_000),
+    'clean_text/1m': lambda: clean_text_case(1_000_000),
+    'extract_pdf/10p': lambda: pdf_case(10),
+    'extract_pdf/100p': lambda: pdf_case(100),
+    'extract_pdf/300p': lambda: pdf_case(300),
+    'optimize_image/0.5mp': lambda: image_case(800, 600),
+    'optimize_image/3mp': lambda: image_case(2000, 1500),
+    'optimize_image/12mp': lambda: image_case(4000, 3000),
+    'clean_ocr_text/1k_lines': lambda: clean_ocr_text_case(1000),
+    'json_regex/object': lambda: json_case({'summary': LINE * 5, 'key_points': [LINE] * 8, 'tags': ['a', 'b']}, r'\{.*\}'),
+    'json_regex/array_10': lambda: json_case(generate_quiz(10), r'\[.*\]'),
+    'json_regex/array_200': lambda: json_case(generate_quiz(200), r'\[.*\]'),
+    'serializer/100_rows': lambda: serializer_case(100),
+    'serializer/1000_rows': lambda: serializer_case(1000),
+    'serializer/compact_1000': lambda: list_serializer_case(1000),
+}
+
+
+def measure(function, repeat):
+    """Median and best wall time over repeat runs, plus peak Python heap of one more run"""
+    function()  # Warm up caches and lazy imports
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Time the extraction, cleaning, parsing and serialization hot paths offline and compare with a saved baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', default='', help='Only run cases whose name contains this text')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case (default: 5)')
+        parser.add_argument('--save', metavar='PATH', help='Write the results as a JSON baseline')
+        parser.add_argument('--compare', metavar='PATH', help='Compare with a baseline saved by --save')
+        parser.add_argument('--max-regression', type=float, default=None,
+                            help='Fail when a case is this many percent slower than the baseline')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        names = [name for name in CASES if options['filter'] in name]
+        if not names:
+            raise CommandError(f"No benchmark matches '{options['filter']}'")
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare'], 'r', encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+
+        report = {name: measure(CASES[name](), options['repeat']) for name in names}
+        for name, row in report.items():
+            if name in baseline:
+                row['change_pct'] = round((row['median_ms'] / baseline[name]['median_ms'] - 1) * 100, 1)
+
+        if options['save']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['save'])), exist_ok=True)
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump({'repeat': options['repeat'], 'results': report}, f, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"{'case':<24} {'median ms':>10} {'min ms':>10} {'peak KB':>10} {'vs base':>8}")
+            for name, row in report.items():
+                change = f"{row['change_pct']:+.1f}%" if 'change_pct' in row else '-'
+                self.stdout.write(
+                    f"{name:<24} {row['median_ms']:>10.2f} {row['min_ms']:>10.2f} {row['peak_kb']:>10.1f} {change:>8}"
+                )
+
+        if options['max_regression'] is not None:
+            slower = [name for name, row in report.items() if row.get('change_pct', 0) > options['max_regression']]
+            if slower:
+                raise CommandError(f"Slower than baseline by more than {options['max_regression']}%: {', '.join(slower)}")
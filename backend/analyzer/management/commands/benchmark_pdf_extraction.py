@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from analyzer.utils.file_handler import FileHandler
+
+LINE = "Photosynthesis converts light energy into chemical energy stored in glucose molecules. "
+
+
+def generate_pdf(pages, lines_per_page=40):
+    """Build an in-memory PDF with roughly 3,500 characters of text per page"""
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        for line in range(lines_per_page):
+            page.insert_text((40, 40 + line * 18), f"{page_number}.{line} {LINE}", fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def legacy_extract(data):
+    """The previous implementation: temp file on disk, then quadratic string building"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'upload.pdf')
+        with open(path, 'wb') as f:
+            f.write(data)
+        doc = fitz.open(path)
+        text = ""
+        for page in doc:
+            text += page.get_text()
+        doc.close()
+    return text
+
+
+def measure(function, data):
+    """Wall time and peak Python heap allocation of one extraction"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    text = function(data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': round(elapsed, 3), 'peak_mb': round(peak / 1024 / 1024, 2), 'chars': len(text)}
+
+
+class Command(BaseCommand):
+    help = 'Measure latency and peak memory of PDF extraction before and after the streaming rewrite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[300, 600], help='Page counts to test')
+        parser.add_argument('--processes', type=int, default=4, help='Processes for the parallel path')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        report = {}
+        for pages in options['pages']:
+            data = generate_pdf(pages)
+            # Extract everything so the three paths do the same amount of work
+            unlimited = {'PDF_MAX_CHARS': 10 ** 9, 'PDF_MAX_PAGES': 10 ** 6}
+            with override_settings(PDF_EXTRACTION_PROCESSES=1, **unlimited):
+                serial = measure(FileHandler._extract_from_pdf, data)
+            with override_settings(
+                PDF_EXTRACTION_PROCESSES=options['processes'], PDF_PARALLEL_MIN_PAGES=1, **unlimited
+            ):
+                parallel = measure(FileHandler._extract_from_pdf, data)
+            report[pages] = {
+                'legacy': measure(legacy_extract, data),
+                'streaming': serial,
+                'parallel': parallel,
+                # Default settings stop once PDF_MAX_CHARS of text has been collected
+                'early_stop': measure(FileHandler._extract_from_pdf, data),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"{'pages':>6} {'path':<10} {'seconds':>8} {'peak MB':>8} {'chars':>10}")
+        for pages, paths in report.items():
+            for path, row in paths.items():
+                self.stdout.write(f"{pages:>6} {path:<10} {row['seconds']:>8.3f} {row['peak_mb']:>8.2f} {row['chars']:>10}")
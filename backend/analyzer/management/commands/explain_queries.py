@@ -0,0 +1,89 @@
+import json
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from analyzer import tagging
+from analyzer.models import AnalysisTag, NoteAnalysis
+from analyzer.pagination import encode_cursor, keyset_query
+from analyzer.serializers import NoteAnalysisListSerializer
+from analyzer.services import analysis_history, comparison_history
+
+from .seed_history import session_key
+
+# Plan fragments that mean a table is read in full, or sorted instead of read in index order
+FULL_SCAN_PATTERNS = {
+    'postgresql': [r'Seq Scan on analyzer_\w+'],
+    'sqlite': [r'SCAN analyzer_\w+(?! USING)'],
+}
+SORT_PATTERNS = {
+    'postgresql': [r'\bSort\b'],
+    'sqlite': [r'USE TEMP B-TREE FOR ORDER BY'],
+}
+# Queries ordered by an aggregate sort their few grouped rows, which is expected
+AGGREGATE_QUERIES = {'tag_facets'}
+
+
+def plan_problems(plan, vendor, allow_sort=False):
+    """Lines of a plan that match FULL_SCAN_PATTERNS, or SORT_PATTERNS unless allow_sort"""
+    patterns = FULL_SCAN_PATTERNS.get(vendor, []) + ([] if allow_sort else SORT_PATTERNS.get(vendor, []))
+    return [line.strip() for line in plan.splitlines() if any(re.search(pattern, line) for pattern in patterns)]
+
+
+def hot_queries(session):
+    """The queries behind the history, detail, tag filter and facet lookups, as the API runs them"""
+    fields = NoteAnalysisListSerializer.Meta.fields
+    history = analysis_history(session, fields)
+    queries = {'history_first_page': keyset_query(history, limit=settings.HISTORY_PAGE_SIZE)}
+
+    first_page = list(keyset_query(history, limit=settings.HISTORY_PAGE_SIZE))
+    if len(first_page) > settings.HISTORY_PAGE_SIZE:
+        cursor = encode_cursor(first_page[settings.HISTORY_PAGE_SIZE - 1])
+        queries['history_next_page'] = keyset_query(history, cursor, settings.HISTORY_PAGE_SIZE)
+    queries['comparison_page'] = keyset_query(comparison_history(session), limit=settings.HISTORY_COMPARISON_PAGE_SIZE)
+    if first_page:
+        queries['analysis_detail'] = NoteAnalysis.objects.filter(session_key=session, id=first_page[0].id)
+    filtered = tagging.filter_analyses(history, session, tags=['topic_0'], difficulty='Medium')
+    queries['history_tag_filter'] = keyset_query(filtered, limit=settings.HISTORY_PAGE_SIZE)
+    queries['tag_facets'] = AnalysisTag.objects.filter(session_key=session).values('name').annotate(
+        count=Count('id')
+    ).order_by('-count', 'name')[:settings.TAG_FACET_LIMIT]
+    return queries
+
+
+class Command(BaseCommand):
+    help = 'Print the database plans of the history, detail, tag and facet queries and flag full scans and sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', default=session_key(0),
+                            help='Session to query (default: the busiest session made by seed_history)')
+        parser.add_argument('--analyze', action='store_true', help='Run the queries (EXPLAIN ANALYZE with buffers on Postgres)')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error when a plan scans or sorts a table')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        explain_options = {}
+        if options['analyze'] and vendor == 'postgresql':
+            explain_options = {'analyze': True, 'buffers': True}
+
+        report = {}
+        for name, queryset in hot_queries(options['session']).items():
+            plan = queryset.explain(**explain_options)
+            report[name] = {'plan': plan, 'problems': plan_problems(plan, vendor, allow_sort=name in AGGREGATE_QUERIES)}
+
+        if options['json']:
+            self.stdout.write(json.dumps({'vendor': vendor, 'queries': report}, indent=2))
+        else:
+            for name, row in report.items():
+                verdict = 'FULL SCAN / SORT' if row['problems'] else 'index range scan'
+                self.stdout.write(f"== {name}: {verdict}")
+                self.stdout.write(row['plan'])
+                self.stdout.write('')
+
+        flagged = [name for name, row in report.items() if row['problems']]
+        if flagged and options['fail_on_scan']:
+            raise CommandError(f"Queries that scan or sort a table: {', '.join(flagged)}")
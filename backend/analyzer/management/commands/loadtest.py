@@ -0,0 +1,199 @@
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark_analysis import SAMPLE_NOTE
+from .benchmark_hot_paths import generate_photo
+from .benchmark_pdf_extraction import generate_pdf
+
+DEFAULT_MIX = 'analyze_text=4,analyze_pdf=1,analyze_image=1,compare=1,history=3'
+
+# What the API returns when the LLM or OCR could not answer (see GroqAIProcessor._fallback_*)
+FALLBACK_MARKERS = (
+    'This comprehensive analysis system is currently unavailable',
+    'Quiz generation unavailable',
+)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def parse_mix(value):
+    """'analyze_text=4,history=3' -> {'analyze_text': 4.0, 'history': 3.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ENDPOINTS:
+            raise CommandError(f"Unknown endpoint '{name.strip()}'. Choose from: {', '.join(ENDPOINTS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def is_fallback(body):
+    """Whether a successful response carries a fallback instead of a model answer"""
+    if not isinstance(body, dict):
+        return False
+    text = json.dumps([body.get('summary'), body.get('quiz_questions'), body.get('comparison_summary')])
+    return any(marker in text for marker in FALLBACK_MARKERS)
+
+
+class Fixtures:
+    """Request payloads, generated once"""
+
+    def __init__(self, unique):
+        self.unique = unique
+        self.pdf = generate_pdf(5)
+        self.image = generate_photo(1600, 1200)
+
+    def note(self):
+        # A nonce defeats the server's result cache when measuring uncached throughput
+        return f"{SAMPLE_NOTE}\n{uuid.uuid4()}" if self.unique else SAMPLE_NOTE
+
+
+def analyze_text(session, base_url, fixtures, timeout):
+    return session.post(f'{base_url}/api/analyze-text/', json={'text': fixtures.note()}, timeout=timeout)
+
+
+def analyze_pdf(session, base_url, fixtures, timeout):
+    files = {'file': ('notes.pdf', fixtures.pdf, 'application/pdf')}
+    return session.post(f'{base_url}/api/analyze-file/', files=files, timeout=timeout)
+
+
+def analyze_image(session, base_url, fixtures, timeout):
+    files = {'file': ('notes.jpg', fixtures.image, 'image/jpeg')}
+    return session.post(f'{base_url}/api/analyze-file/', files=files, timeout=timeout)
+
+
+def compare(session, base_url, fixtures, timeout):
+    data = {'note1': fixtures.note(), 'note2': 'Cellular respiration breaks glucose down to release energy as ATP.'}
+    return session.post(f'{base_url}/api/compare-notes/', json=data, timeout=timeout)
+
+
+def history(session, base_url, fixtures, timeout):
+    return session.get(f'{base_url}/api/analysis-history/', timeout=timeout)
+
+
+ENDPOINTS = {
+    'analyze_text': analyze_text,
+    'analyze_pdf': analyze_pdf,
+    'analyze_image': analyze_image,
+    'compare': compare,
+    'history': history,
+}
+
+
+def summarize(samples, duration):
+    """Latency percentiles, throughput, error and fallback rates of a list of samples"""
+    latencies = sorted(sample['latency'] for sample in samples)
+    errors = sum(1 for sample in samples if sample['error'])
+    fallbacks = sum(1 for sample in samples if sample['fallback'])
+    statuses = defaultdict(int)
+    for sample in samples:
+        statuses[str(sample['status'])] += 1
+    ms = lambda value: None if value is None else round(value * 1000, 1)
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / duration, 2) if duration else 0,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'fallback_rate': round(fallbacks / len(samples), 4) if samples else 0,
+        'status_counts': dict(statuses),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Replay a mix of API traffic against a running server at a target rate and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help='Base URL of the running server')
+        parser.add_argument('--rate', type=float, default=2.0, help='Target requests per second (Poisson arrivals)')
+        parser.add_argument('--duration', type=float, default=60.0, help='Seconds to send traffic for')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Endpoint weights (default: {DEFAULT_MIX})')
+        parser.add_argument('--max-in-flight', type=int, default=64, help='Client-side cap on concurrent requests')
+        parser.add_argument('--sessions', type=int, default=20, help='Simulated users, each with its own cookie jar')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Per-request timeout in seconds')
+        parser.add_argument('--unique', action='store_true', help='Make every note unique to bypass the result cache')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for arrivals and the endpoint mix')
+        parser.add_argument('--output', metavar='PATH', help='Also write the JSON report to this file')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        base_url = options['url'].rstrip('/')
+        rng = random.Random(options['seed'])
+        fixtures = Fixtures(options['unique'])
+        sessions = [requests.Session() for _ in range(options['sessions'])]
+        samples = []
+        samples_lock = threading.Lock()
+
+        def send(name, session, scheduled_at):
+            status, error, fallback = None, False, False
+            try:
+                response = ENDPOINTS[name](session, base_url, fixtures, options['timeout'])
+                status = response.status_code
+                error = status >= 400
+                if not error:
+                    fallback = is_fallback(response.json())
+            except requests.RequestException as e:
+                status, error = type(e).__name__, True
+            # Measured from when the request should have been sent, so a saturated
+            # client does not hide queueing delay (coordinated omission)
+            latency = time.monotonic() - scheduled_at
+            with samples_lock:
+                samples.append({'endpoint': name, 'latency': latency, 'status': status, 'error': error, 'fallback': fallback})
+
+        names, weights = list(mix), list(mix.values())
+        executor = ThreadPoolExecutor(max_workers=options['max_in_flight'])
+        start = time.monotonic()
+        next_at = start
+        while next_at - start < options['duration']:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            name = rng.choices(names, weights)[0]
+            executor.submit(send, name, rng.choice(sessions), next_at)
+            next_at += rng.expovariate(options['rate'])
+        executor.shutdown(wait=True)
+        duration = time.monotonic() - start
+
+        by_endpoint = defaultdict(list)
+        for sample in samples:
+            by_endpoint[sample['endpoint']].append(sample)
+        report = {
+            'config': {key: options[key] for key in ('url', 'rate', 'duration', 'mix', 'max_in_flight', 'unique', 'seed')},
+            'overall': summarize(samples, duration),
+            'endpoints': {name: summarize(by_endpoint[name], duration) for name in mix if by_endpoint[name]},
+        }
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'endpoint':<14} {'requests':>8} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'fallback':>8}"
+        )
+        for name, row in [*report['endpoints'].items(), ('overall', report['overall'])]:
+            self.stdout.write(
+                f"{name:<14} {row['requests']:>8} {row['throughput_rps']:>7.2f} {row['p50_ms'] or 0:>9.1f} "
+                f"{row['p95_ms'] or 0:>9.1f} {row['p99_ms'] or 0:>9.1f} {row['error_rate']:>7.1%} {row['fallback_rate']:>8.1%}"
+            )
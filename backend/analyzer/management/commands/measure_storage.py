@@ -0,0 +1,123 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from analyzer.models import NoteAnalysis, NoteComparison
+from analyzer.serializers import NoteAnalysisSerializer
+
+from .explain_queries import hot_queries
+from .seed_history import session_key
+
+
+def column_sizes(model):
+    """Average stored bytes per column (after TOAST compression on Postgres)"""
+    quote = connection.ops.quote_name
+    columns = [field.column for field in model._meta.concrete_fields if field.column != 'id']
+    if connection.vendor == 'postgresql':
+        size = 'AVG(pg_column_size({}))'
+    else:
+        size = 'AVG(LENGTH(CAST({} AS BLOB)))'
+    sql = 'SELECT COUNT(*), {} FROM {}'.format(
+        ', '.join(size.format(quote(column)) for column in columns), quote(model._meta.db_table)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        rows, *averages = cursor.fetchone()
+    sizes = {column: round(float(average or 0), 1) for column, average in zip(columns, averages)}
+    return {'rows': rows, 'avg_row_bytes': round(sum(sizes.values()), 1), 'avg_column_bytes': sizes}
+
+
+def table_bytes(model):
+    """Total on-disk size of a table with its indexes and TOAST (Postgres), or None"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_total_relation_size(%s)', [model._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def database_bytes():
+    """Bytes in use by the database; SQLite keeps freed pages in its file until VACUUM"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_database_size(current_database())')
+            return cursor.fetchone()[0]
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA page_count')
+            pages = cursor.fetchone()[0]
+            cursor.execute('PRAGMA freelist_count')
+            pages -= cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return pages * cursor.fetchone()[0]
+    return None
+
+
+def median_ms(function, repeat):
+    function()  # Warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+class Command(BaseCommand):
+    help = 'Report stored bytes per row and column and the latency of the history and detail queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', default=session_key(0),
+                            help='Session to query (default: the busiest session made by seed_history)')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query (default: 50)')
+        parser.add_argument('--save', metavar='PATH', help='Write the report as JSON')
+        parser.add_argument('--compare', metavar='PATH', help='Show changes against a report saved by --save')
+
+    def handle(self, *args, **options):
+        session, repeat = options['session'], options['repeat']
+        report = {
+            'vendor': connection.vendor,
+            'database_bytes': database_bytes(),
+            'tables': {
+                model.__name__: {**column_sizes(model), 'total_bytes': table_bytes(model)}
+                for model in (NoteAnalysis, NoteComparison)
+            },
+            'latency_ms': {name: median_ms(lambda q=queryset: list(q.all()), repeat) for name, queryset in hot_queries(session).items()},
+        }
+        detail = NoteAnalysis.objects.filter(session_key=session).order_by('-created_at', '-id').first()
+        if detail is not None:
+            # Loading and serializing every column, as the detail endpoint does
+            report['latency_ms']['analysis_detail_response'] = median_ms(
+                lambda: NoteAnalysisSerializer(NoteAnalysis.objects.get(id=detail.id)).data, repeat
+            )
+
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        def change(current, before):
+            if before in (None, 0) or current is None:
+                return ''
+            return f" ({(current / before - 1) * 100:+.1f}%)"
+
+        self.stdout.write(f"Database: {report['database_bytes']} bytes"
+                          + (change(report['database_bytes'], baseline['database_bytes']) if baseline else ''))
+        for name, table in report['tables'].items():
+            before = baseline['tables'].get(name) if baseline else None
+            self.stdout.write(
+                f"{name}: {table['rows']} rows, {table['avg_row_bytes']} bytes per row"
+                + (change(table['avg_row_bytes'], before['avg_row_bytes']) if before else '')
+            )
+            for column, size in table['avg_column_bytes'].items():
+                previous = before['avg_column_bytes'].get(column) if before else None
+                self.stdout.write(f"  {column:<22} {size:>10.1f}{change(size, previous)}")
+        for name, value in report['latency_ms'].items():
+            previous = baseline['latency_ms'].get(name) if baseline else None
+            self.stdout.write(f"{name:<26} {value:>8.3f} ms{change(value, previous)}")
@@ -0,0 +1,90 @@
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from analyzer.jobs import claim_next_job, process_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued background analyses from the database job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.ANALYSIS_JOB_CONCURRENCY,
+            help='Jobs processed in parallel by this worker'
+        )
+        parser.add_argument(
+            '--visibility-timeout', type=int, default=settings.ANALYSIS_JOB_VISIBILITY_TIMEOUT,
+            help='Seconds a claimed job stays hidden from other workers after its last heartbeat before it can be retried'
+        )
+        parser.add_argument(
+            '--retry-delay', type=int, default=settings.ANALYSIS_JOB_RETRY_DELAY,
+            help='Base delay in seconds before a failed job is retried (doubles per attempt)'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=2.0,
+            help='Seconds to wait when the queue is empty'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is empty instead of polling forever'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.stop = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+            signal.signal(signal.SIGINT, lambda *_: self.stop.set())
+
+        worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        concurrency = max(1, options['concurrency'])
+        self.stdout.write(f"Processing analysis jobs with {concurrency} thread(s)")
+        if concurrency == 1:
+            self._work(f"{worker_prefix}:0")
+        else:
+            threads = [
+                threading.Thread(target=self._work, args=(f"{worker_prefix}:{index}",), daemon=True)
+                for index in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker stopped: {self.processed} job(s) done, {self.failed} failed attempt(s)"
+        ))
+
+    def _work(self, worker_id):
+        """Claim and process jobs until stopped (or until the queue is empty with --once)"""
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                job = claim_next_job(worker_id, self.options['visibility_timeout'])
+                if job is None:
+                    if self.options['once']:
+                        return
+                    self.stop.wait(self.options['poll_interval'])
+                    continue
+
+                succeeded = process_job(
+                    job, worker_id, self.options['retry_delay'], self.options['visibility_timeout']
+                )
+                with self.lock:
+                    if succeeded:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
@@ -0,0 +1,94 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analyzer import search, tagging
+from analyzer.models import NoteAnalysis, NoteComparison
+
+from .benchmark_pdf_extraction import LINE
+
+SEED_PREFIX = 'seed-'
+DIFFICULTIES = ['Easy', 'Medium', 'Hard']
+BLOOM_LEVELS = ['Remember', 'Understand', 'Apply', 'Analyze', 'Evaluate', 'Create']
+TAG_WORDS = [f'topic_{number}' for number in range(500)]
+
+
+def skewed_index(rng, size):
+    """Index in [0, size) where low indexes are far more likely, like real sessions and tags"""
+    return int(size * rng.random() ** 3)
+
+
+def session_key(index):
+    return f'{SEED_PREFIX}{index:08d}'
+
+
+def generate_analysis(rng, sessions, text_chars):
+    tags = list(dict.fromkeys(TAG_WORDS[skewed_index(rng, len(TAG_WORDS))] for _ in range(rng.randint(3, 8))))
+    return NoteAnalysis(
+        session_key=session_key(skewed_index(rng, sessions)),
+        original_text=(LINE * (text_chars // len(LINE) + 1))[:text_chars],
+        summary=LINE * 6,
+        key_points=[LINE] * 8,
+        difficulty=rng.choice(DIFFICULTIES),
+        bloom_level=rng.choice(BLOOM_LEVELS),
+        topic_graph=[{'id': f't{n}', 'label': f'Topic {n}', 'children': ['A', 'B']} for n in range(5)],
+        quiz_questions=[{'question': LINE, 'options': ['A', 'B', 'C', 'D'], 'correct_answer': 'A'}] * 3,
+        tags=tags,
+        learning_objectives=[LINE] * 4,
+        prerequisites=[LINE] * 2,
+        applications=[LINE] * 3
+    )
+
+
+def generate_comparison(rng, sessions, text_chars):
+    return NoteComparison(
+        session_key=session_key(skewed_index(rng, sessions)),
+        note1_text=LINE * (text_chars // len(LINE) // 2 + 1),
+        note2_text=LINE * (text_chars // len(LINE) // 2 + 1),
+        similarity_score=round(rng.uniform(0, 100), 1),
+        comparison_summary=LINE * 3
+    )
+
+
+class Command(BaseCommand):
+    help = 'Insert a large synthetic history (skewed across sessions and tags) for checking query plans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyses', type=int, default=1_000_000, help='Analyses to insert (default: 1,000,000)')
+        parser.add_argument('--comparisons', type=int, default=None, help='Comparisons to insert (default: a tenth of --analyses)')
+        parser.add_argument('--sessions', type=int, default=50_000, help='Distinct sessions to spread rows over')
+        parser.add_argument('--text-chars', type=int, default=2000, help='Length of each note text')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded rows first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['clear']:
+            for model in (NoteAnalysis, NoteComparison):
+                deleted, _ = model.objects.filter(session_key__startswith=SEED_PREFIX).delete()
+                self.stdout.write(f"Deleted {deleted} seeded {model.__name__} rows")
+
+        comparisons = options['comparisons'] if options['comparisons'] is not None else options['analyses'] // 10
+        for model, count, generate in (
+            (NoteAnalysis, options['analyses'], generate_analysis),
+            (NoteComparison, comparisons, generate_comparison),
+        ):
+            start = time.monotonic()
+            inserted = 0
+            while inserted < count:
+                size = min(options['batch_size'], count - inserted)
+                with transaction.atomic():
+                    rows = model.objects.bulk_create(
+                        [generate(rng, options['sessions'], options['text_chars']) for _ in range(size)]
+                    )
+                    if model is NoteAnalysis:
+                        # bulk_create sends no post_save
+                        search.index_analyses(rows)
+                        tagging.index_analyses(rows)
+                inserted += size
+                if inserted % (options['batch_size'] * 20) == 0 or inserted == count:
+                    self.stdout.write(f"{model.__name__}: {inserted}/{count}")
+            self.stdout.write(f"Inserted {count} {model.__name__} rows in {time.monotonic() - start:.1f} s")
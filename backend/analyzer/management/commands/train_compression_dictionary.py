@@ -0,0 +1,91 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analyzer.fields import CompressedJSONField, CompressedTextField
+from analyzer.models import NoteAnalysis, NoteComparison
+from analyzer.utils.compression import (
+    DICTIONARY_DIR, MAX_DICTIONARY_BYTES, NO_DICTIONARY, RAW, compress, dictionary_path, train_dictionary
+)
+
+
+def compressed_fields(model):
+    return [field for field in model._meta.concrete_fields if isinstance(field, CompressedTextField)]
+
+
+def database_samples(limit):
+    """Stored values of the compressed columns, in the form they are compressed"""
+    for model in (NoteAnalysis, NoteComparison):
+        fields = compressed_fields(model)
+        rows = model.objects.order_by('-id').only(*(field.name for field in fields))[:limit]
+        for row in rows.iterator(chunk_size=500):
+            for field in fields:
+                value = getattr(row, field.name)
+                if value is not None:
+                    yield field.encode(value).decode('utf-8')
+
+
+def recording_samples():
+    """Analyses recorded from Groq (STANDIN_RECORDINGS_DIR/groq.jsonl), one sample per field"""
+    path = os.path.join(settings.STANDIN_RECORDINGS_DIR, 'groq.jsonl')
+    if not os.path.exists(path):
+        return
+    encoder = CompressedJSONField()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                content = json.loads(json.loads(line)['content'])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if not isinstance(content, dict):
+                continue
+            for value in content.values():
+                yield value if isinstance(value, str) else encoder.encode(value).decode('utf-8')
+
+
+class Command(BaseCommand):
+    help = 'Train a preset compression dictionary on stored notes and save it under the next free id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['db', 'recordings', 'both'], default='db',
+                            help='Train on stored rows, on recorded Groq analyses, or on both (default: db)')
+        parser.add_argument('--samples', type=int, default=5000, help='Most recent rows per model to read')
+        parser.add_argument('--size', type=int, default=MAX_DICTIONARY_BYTES, help='Dictionary size in bytes')
+        parser.add_argument('--id', type=int, help='Dictionary id to write (default: the next free one)')
+
+    def handle(self, *args, **options):
+        samples = []
+        if options['source'] in ('db', 'both'):
+            samples.extend(database_samples(options['samples']))
+        if options['source'] in ('recordings', 'both'):
+            samples.extend(recording_samples())
+        if len(samples) < 2:
+            raise CommandError('Not enough samples to train a dictionary')
+
+        dictionary_id = options['id']
+        if dictionary_id is None:
+            dictionary_id = 1
+            while dictionary_path(dictionary_id).exists():
+                dictionary_id += 1
+        if not NO_DICTIONARY < dictionary_id < RAW:
+            raise CommandError(f'Dictionary ids run from {NO_DICTIONARY + 1} to {RAW - 1}')
+        if dictionary_path(dictionary_id).exists():
+            raise CommandError(f'Dictionary {dictionary_id} exists; rows compressed with it depend on it never changing')
+
+        start = time.monotonic()
+        dictionary = train_dictionary(samples, min(options['size'], MAX_DICTIONARY_BYTES))
+        DICTIONARY_DIR.mkdir(parents=True, exist_ok=True)
+        dictionary_path(dictionary_id).write_bytes(dictionary)
+        self.stdout.write(f"Trained a {len(dictionary)} byte dictionary on {len(samples)} samples "
+                          f"in {time.monotonic() - start:.1f} s: {dictionary_path(dictionary_id)}")
+
+        raw = sum(len(sample.encode('utf-8')) for sample in samples)
+        for name, compare_id in (('no dictionary', NO_DICTIONARY), (f'dictionary {dictionary_id}', dictionary_id)):
+            stored = sum(len(compress(sample.encode('utf-8'), compare_id)) for sample in samples)
+            self.stdout.write(f"{name:<16} {stored}/{raw} bytes ({stored / raw:.1%})")
+        if options['source'] != 'db':
+            self.stdout.write("Recordings are synthetic: train with --source db before using this in production")
+        self.stdout.write(f"Set COMPRESSION_DICTIONARY={dictionary_id} to compress new writes with it")
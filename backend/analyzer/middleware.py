@@ -0,0 +1,90 @@
+"""
+Request-level middleware
+"""
+
+import json
+import time
+
+from django.conf import settings
+
+from .utils import metrics, profiling
+
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class RequestMetricsMiddleware:
+    """Latency histogram of every request, labelled by URL name, method and status"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        # Streaming responses are timed until their headers are ready, not until the last event
+        match = getattr(request, 'resolver_match', None)
+        metrics.observe(
+            'http_request_seconds',
+            time.perf_counter() - start,
+            view=match.url_name if match and match.url_name else 'unmatched',
+            method=request.method if request.method in KNOWN_METHODS else 'other',
+            status=response.status_code
+        )
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests flagged with the admin-only X-Profile header or picked by sampling
+    (see utils.profiling), and logs every request slower than SLOW_REQUEST_SECONDS with
+    its per-stage breakdown and SQL query counts
+    Streaming responses are covered until their headers are ready
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = profiling.should_profile(request)
+        profiler = profiling.get_profiler() if trigger else None
+        queries = profiling.QueryLog()
+
+        with metrics.breakdown() as stages, profiling.record_queries(queries):
+            start = time.perf_counter()
+            if profiler:
+                try:
+                    profiler.start()
+                except profiling.ProfilerBusy as e:
+                    # Serve the request unprofiled rather than fail it
+                    print(f"Profiling skipped: {e}")
+                    profiler = trigger = None
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.stop()
+            elapsed = time.perf_counter() - start
+
+        slow = elapsed >= settings.SLOW_REQUEST_SECONDS
+        if not trigger and not slow:
+            return response
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 1),
+            # Stages on pool threads overlap, so their sum can exceed the duration
+            'stages': stages.as_dict(),
+            'queries': queries.summary(),
+        }
+        if trigger:
+            artifact_id = profiling.save_artifact(
+                {**record, 'trigger': trigger, 'mode': settings.PROFILING_MODE, 'top': profiler.top()}, profiler
+            )
+            if trigger == 'header':
+                response['X-Profile-Id'] = artifact_id
+            record['profile_id'] = artifact_id
+        if slow:
+            print(f"Slow request: {json.dumps(record)}")
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0004_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='noteanalysis',
+            index=models.Index(fields=['session_key', '-created_at', '-id'], name='analysis_session_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notecomparison',
+            index=models.Index(fields=['session_key', '-created_at', '-id'], name='comparison_session_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:58
+
+from django.db import migrations, models
+
+
+def create_tags_gin_index(apps, schema_editor):
+    """GIN index for tag containment lookups (tags @> '["biology"]'); Postgres only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS analysis_tags_gin_idx '
+        'ON analyzer_noteanalysis USING gin (tags jsonb_path_ops)'
+    )
+
+
+def drop_tags_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS analysis_tags_gin_idx')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, and keeps the table writable
+    atomic = False
+
+    dependencies = [
+        ('analyzer', '0005_history_keyset_indexes'),
+    ]
+
+    operations = [
+        # The (session_key, -created_at, -id) indexes start with session_key, so its own index is redundant
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='session_key',
+            field=models.CharField(default='anonymous', max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='notecomparison',
+            name='session_key',
+            field=models.CharField(default='anonymous', max_length=40),
+        ),
+        migrations.RunPython(create_tags_gin_index, drop_tags_gin_index),
+    ]
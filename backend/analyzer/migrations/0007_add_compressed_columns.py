@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:10
+
+import analyzer.fields
+from django.db import migrations, models
+
+
+# First of three steps moving the large columns to compressed ones: add them alongside
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0006_postgres_tuning'),
+    ]
+
+    operations = [
+        # Nullable until 0008 has filled them; the old columns too, so 0009 can be reversed
+        migrations.AddField(
+            model_name='noteanalysis',
+            name='original_text_compressed',
+            field=analyzer.fields.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='noteanalysis',
+            name='key_points_compressed',
+            field=analyzer.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='noteanalysis',
+            name='topic_graph_compressed',
+            field=analyzer.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='noteanalysis',
+            name='quiz_questions_compressed',
+            field=analyzer.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='noteanalysis',
+            name='learning_objectives_compressed',
+            field=analyzer.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='noteanalysis',
+            name='prerequisites_compressed',
+            field=analyzer.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='noteanalysis',
+            name='applications_compressed',
+            field=analyzer.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='notecomparison',
+            name='note1_text_compressed',
+            field=analyzer.fields.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='notecomparison',
+            name='note2_text_compressed',
+            field=analyzer.fields.CompressedTextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='original_text',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='key_points',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='topic_graph',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='quiz_questions',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='learning_objectives',
+            field=models.JSONField(default=list, null=True),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='prerequisites',
+            field=models.JSONField(default=list, null=True),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='applications',
+            field=models.JSONField(default=list, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notecomparison',
+            name='note1_text',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='notecomparison',
+            name='note2_text',
+            field=models.TextField(null=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:10
+
+from django.db import migrations, transaction
+
+# Columns moved to compressed storage, per model
+COLUMNS = {
+    'noteanalysis': [
+        'original_text', 'key_points', 'topic_graph', 'quiz_questions',
+        'learning_objectives', 'prerequisites', 'applications',
+    ],
+    'notecomparison': ['note1_text', 'note2_text'],
+}
+BATCH_SIZE = 1000
+
+
+def copy_columns(apps, schema_editor, source_suffix, target_suffix):
+    """Copy every row's columns in id order, one short transaction per batch"""
+    database = schema_editor.connection.alias
+    for model_name, names in COLUMNS.items():
+        model = apps.get_model('analyzer', model_name)
+        sources = [name + source_suffix for name in names]
+        targets = [name + target_suffix for name in names]
+        last_id = 0
+        while True:
+            with transaction.atomic(using=database):
+                rows = list(
+                    model.objects.using(database).filter(id__gt=last_id).order_by('id').only(*sources)[:BATCH_SIZE]
+                )
+                if not rows:
+                    break
+                for row in rows:
+                    for source, target in zip(sources, targets):
+                        # The field classes do the conversion: compress on the way in, decompress on the way out
+                        setattr(row, target, getattr(row, source))
+                model.objects.using(database).bulk_update(rows, targets)
+            last_id = rows[-1].id
+
+
+def compress_columns(apps, schema_editor):
+    copy_columns(apps, schema_editor, '', '_compressed')
+
+
+def decompress_columns(apps, schema_editor):
+    copy_columns(apps, schema_editor, '_compressed', '')
+
+
+# Second step: fill the compressed columns from the old ones
+class Migration(migrations.Migration):
+
+    # Batches commit as they go, so a large table is not rewritten in one long transaction
+    atomic = False
+
+    dependencies = [
+        ('analyzer', '0007_add_compressed_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(compress_columns, decompress_columns),
+    ]
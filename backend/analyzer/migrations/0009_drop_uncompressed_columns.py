@@ -0,0 +1,141 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:10
+
+import analyzer.fields
+from django.db import migrations
+
+
+# Last step: drop the uncompressed columns and give the compressed ones their names
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0008_compress_note_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='noteanalysis',
+            name='original_text',
+        ),
+        migrations.RemoveField(
+            model_name='noteanalysis',
+            name='key_points',
+        ),
+        migrations.RemoveField(
+            model_name='noteanalysis',
+            name='topic_graph',
+        ),
+        migrations.RemoveField(
+            model_name='noteanalysis',
+            name='quiz_questions',
+        ),
+        migrations.RemoveField(
+            model_name='noteanalysis',
+            name='learning_objectives',
+        ),
+        migrations.RemoveField(
+            model_name='noteanalysis',
+            name='prerequisites',
+        ),
+        migrations.RemoveField(
+            model_name='noteanalysis',
+            name='applications',
+        ),
+        migrations.RemoveField(
+            model_name='notecomparison',
+            name='note1_text',
+        ),
+        migrations.RemoveField(
+            model_name='notecomparison',
+            name='note2_text',
+        ),
+        migrations.RenameField(
+            model_name='noteanalysis',
+            old_name='original_text_compressed',
+            new_name='original_text',
+        ),
+        migrations.RenameField(
+            model_name='noteanalysis',
+            old_name='key_points_compressed',
+            new_name='key_points',
+        ),
+        migrations.RenameField(
+            model_name='noteanalysis',
+            old_name='topic_graph_compressed',
+            new_name='topic_graph',
+        ),
+        migrations.RenameField(
+            model_name='noteanalysis',
+            old_name='quiz_questions_compressed',
+            new_name='quiz_questions',
+        ),
+        migrations.RenameField(
+            model_name='noteanalysis',
+            old_name='learning_objectives_compressed',
+            new_name='learning_objectives',
+        ),
+        migrations.RenameField(
+            model_name='noteanalysis',
+            old_name='prerequisites_compressed',
+            new_name='prerequisites',
+        ),
+        migrations.RenameField(
+            model_name='noteanalysis',
+            old_name='applications_compressed',
+            new_name='applications',
+        ),
+        migrations.RenameField(
+            model_name='notecomparison',
+            old_name='note1_text_compressed',
+            new_name='note1_text',
+        ),
+        migrations.RenameField(
+            model_name='notecomparison',
+            old_name='note2_text_compressed',
+            new_name='note2_text',
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='original_text',
+            field=analyzer.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='key_points',
+            field=analyzer.fields.CompressedJSONField(),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='topic_graph',
+            field=analyzer.fields.CompressedJSONField(),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='quiz_questions',
+            field=analyzer.fields.CompressedJSONField(),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='learning_objectives',
+            field=analyzer.fields.CompressedJSONField(default=list),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='prerequisites',
+            field=analyzer.fields.CompressedJSONField(default=list),
+        ),
+        migrations.AlterField(
+            model_name='noteanalysis',
+            name='applications',
+            field=analyzer.fields.CompressedJSONField(default=list),
+        ),
+        migrations.AlterField(
+            model_name='notecomparison',
+            name='note1_text',
+            field=analyzer.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='notecomparison',
+            name='note2_text',
+            field=analyzer.fields.CompressedTextField(),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:40
+
+from django.conf import settings
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+# Frozen copy of analyzer.search as of this migration, so later edits to it do not change what runs here
+TABLE = 'analyzer_analysis_search'
+COLUMNS = ['tags', 'summary', 'key_points', 'original_text']
+
+
+def document(analysis):
+    """(id, session_key, text per COLUMNS) of an analysis, as indexed"""
+    return (
+        analysis.id,
+        analysis.session_key,
+        ' '.join(str(tag) for tag in analysis.tags or []),
+        analysis.summary or '',
+        '\n'.join(str(point) for point in analysis.key_points or []),
+        analysis.original_text or '',
+    )
+
+
+def index_documents(documents, connection):
+    """Add the index entries of documents made by document()"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            vector = ' || '.join(
+                f"setweight(to_tsvector(%s::regconfig, %s), '{weight}')" for weight in 'ABCD'
+            )
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (analysis_id, session_key, document) VALUES (%s, %s, {vector}) '
+                'ON CONFLICT (analysis_id) DO UPDATE SET session_key = EXCLUDED.session_key, document = EXCLUDED.document',
+                [(analysis_id, session_key, *[value for text in texts for value in (settings.SEARCH_CONFIG, text)])
+                 for analysis_id, session_key, *texts in documents]
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row[0],) for row in documents])
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, session_key, {', '.join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+                documents
+            )
+
+
+def create_search_index(apps, schema_editor):
+    """Create the Postgres tsvector or SQLite FTS5 index and fill it from existing analyses"""
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return  # Other databases search with LIKE
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+                'analysis_id bigint PRIMARY KEY REFERENCES analyzer_noteanalysis (id) '
+                'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+                'session_key varchar(40) NOT NULL, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS analysis_search_document_idx ON {TABLE} USING gin (document)')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS analysis_search_session_idx ON {TABLE} (session_key)')
+        else:
+            # rowid is the analysis id; session_key is indexed too, so a session filter is part of MATCH
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                f"session_key, {', '.join(COLUMNS)}, tokenize='porter unicode61')"
+            )
+    
+    NoteAnalysis = apps.get_model('analyzer', 'NoteAnalysis')
+    fields = ['session_key', 'tags', 'summary', 'key_points', 'original_text']
+    last_id = 0
+    while True:
+        with transaction.atomic(using=connection.alias):
+            rows = list(
+                NoteAnalysis.objects.using(connection.alias).filter(id__gt=last_id).order_by('id').only(*fields)[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            index_documents([document(row) for row in rows], connection)
+        last_id = rows[-1].id
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor in ('postgresql', 'sqlite'):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+# The search index lives outside the models: a vendor-specific table kept by analyzer.search
+class Migration(migrations.Migration):
+
+    # Batches commit as they go
+    atomic = False
+
+    dependencies = [
+        ('analyzer', '0009_drop_uncompressed_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analyzer', '0010_analysis_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.CharField(max_length=40)),
+                ('name', models.CharField(max_length=100)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_entries', to='analyzer.noteanalysis')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session_key', 'name', 'analysis'], name='analysis_tag_session_idx')],
+                'constraints': [models.UniqueConstraint(fields=('analysis', 'name'), name='analysis_tag_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:40
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+MAX_TAG_LENGTH = 100  # AnalysisTag.name
+
+
+def normalize(tag):
+    """Same as analyzer.tagging.normalize, frozen for this migration"""
+    return ' '.join(str(tag).split()).lower()[:MAX_TAG_LENGTH]
+
+
+def fill_tags(apps, schema_editor):
+    """Index the tags of every existing analysis in id order, one short transaction per batch"""
+    database = schema_editor.connection.alias
+    NoteAnalysis = apps.get_model('analyzer', 'NoteAnalysis')
+    AnalysisTag = apps.get_model('analyzer', 'AnalysisTag')
+    last_id = 0
+    while True:
+        with transaction.atomic(using=database):
+            rows = list(
+                NoteAnalysis.objects.using(database).filter(id__gt=last_id).order_by('id')
+                .only('id', 'session_key', 'tags')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            AnalysisTag.objects.using(database).filter(analysis_id__in=[row.id for row in rows]).delete()
+            AnalysisTag.objects.using(database).bulk_create([
+                AnalysisTag(analysis_id=row.id, session_key=row.session_key, name=name)
+                for row in rows
+                for name in dict.fromkeys(normalize(tag) for tag in row.tags or [])
+                if name
+            ])
+        last_id = rows[-1].id
+
+
+# Fill the tag index for analyses saved before it existed; new saves update it themselves
+class Migration(migrations.Migration):
+
+    # Batches commit as they go, like 0008
+    atomic = False
+
+    dependencies = [
+        ('analyzer', '0011_analysis_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_tags, migrations.RunPython.noop),
+    ]
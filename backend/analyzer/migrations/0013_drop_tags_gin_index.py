@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:50
+
+from django.db import migrations
+
+
+def drop_tags_gin_index(apps, schema_editor):
+    """Tag filters use the AnalysisTag table since 0011, so nothing reads this index; Postgres only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS analysis_tags_gin_idx')
+
+
+def create_tags_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS analysis_tags_gin_idx '
+        'ON analyzer_noteanalysis USING gin (tags jsonb_path_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    # DROP INDEX CONCURRENTLY cannot run inside a transaction, and keeps the table writable
+    atomic = False
+
+    dependencies = [
+        ('analyzer', '0012_backfill_analysis_tags'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_tags_gin_index, create_tags_gin_index),
+    ]
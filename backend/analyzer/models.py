@@ -1,38 +1,95 @@
 from django.db import models
+from django.utils import timezone
+
+from .fields import CompressedJSONField, CompressedTextField
 
 class NoteAnalysis(models.Model):
     """Store note analysis results"""
-    session_key = models.CharField(max_length=40, db_index=True, default='anonymous')  # Session-based isolation
-    original_text = models.TextField()
-    summary = models.TextField()
-    key_points = models.JSONField()
+    session_key = models.CharField(max_length=40, default='anonymous')  # Session-based isolation, indexed in Meta
+    original_text = CompressedTextField()
+    summary = models.TextField()  # Plain text: previewed and searched in SQL
+    key_points = CompressedJSONField()
     difficulty = models.CharField(max_length=20)
     bloom_level = models.CharField(max_length=20)
-    topic_graph = models.JSONField()
-    quiz_questions = models.JSONField()
-    tags = models.JSONField()
-    learning_objectives = models.JSONField(default=list)
-    prerequisites = models.JSONField(default=list)
-    applications = models.JSONField(default=list)
+    topic_graph = CompressedJSONField()
+    quiz_questions = CompressedJSONField()
+    tags = models.JSONField()  # Plain JSON: filtered with containment lookups
+    learning_objectives = CompressedJSONField(default=list)
+    prerequisites = CompressedJSONField(default=list)
+    applications = CompressedJSONField(default=list)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        # History pages are keyset scans of one session in this order
+        indexes = [models.Index(fields=['session_key', '-created_at', '-id'], name='analysis_session_recent_idx')]
     
     def __str__(self):
         return f"Analysis {self.id} - {self.difficulty} - {self.bloom_level}"
 
+class AnalysisTag(models.Model):
+    """One normalized tag of an analysis, kept in step with NoteAnalysis.tags (see tagging.py)"""
+    analysis = models.ForeignKey(NoteAnalysis, on_delete=models.CASCADE, related_name='tag_entries')
+    session_key = models.CharField(max_length=40)  # Copied from the analysis so facets never join it
+    name = models.CharField(max_length=100)
+    
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['analysis', 'name'], name='analysis_tag_unique')]
+        # Tag filters and per-session tag counts are ranges of this index
+        indexes = [models.Index(fields=['session_key', 'name', 'analysis'], name='analysis_tag_session_idx')]
+    
+    def __str__(self):
+        return f"{self.name} - Analysis {self.analysis_id}"
+
 class NoteComparison(models.Model):
     """Store note comparison results"""
-    session_key = models.CharField(max_length=40, db_index=True, default='anonymous')  # Session-based isolation
-    note1_text = models.TextField()
-    note2_text = models.TextField()
+    session_key = models.CharField(max_length=40, default='anonymous')  # Session-based isolation, indexed in Meta
+    note1_text = CompressedTextField()
+    note2_text = CompressedTextField()
     similarity_score = models.FloatField()
     comparison_summary = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['session_key', '-created_at', '-id'], name='comparison_session_recent_idx')]
+    
+    def __str__(self):
+        return f"Comparison {self.id} - {self.similarity_score}% similarity"
+
+class AnalysisJob(models.Model):
+    """Queued analysis processed by the `process_analysis_jobs` worker"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    session_key = models.CharField(max_length=40, db_index=True, default='anonymous')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    mode = models.CharField(max_length=20, blank=True)  # Empty means settings.ANALYSIS_MODE
+    input_text = models.TextField(blank=True)  # Submitted text for text jobs
+    file_name = models.CharField(max_length=255, blank=True)
+    file_data = models.BinaryField(null=True, blank=True)  # Raw upload for file jobs
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not claimable before this time: retry backoff for pending jobs,
+    # visibility timeout for running jobs whose worker may have died
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    analysis = models.ForeignKey(NoteAnalysis, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'available_at'])]
     
     def __str__(self):
-        return f"Comparison {self.id} - {self.similarity_score}% similarity"
\ No newline at end of file
+        return f"Job {self.id} - {self.status}"
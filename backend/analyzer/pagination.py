@@ -0,0 +1,52 @@
+"""
+Keyset (cursor) pagination on (created_at, id), newest first
+Each page is one indexed range scan, however deep the client has paged
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(item):
+    """Opaque cursor pointing just after item"""
+    position = json.dumps([item.created_at.isoformat(), item.id])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of a cursor made by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        created_at = parse_datetime(created_at)
+        if created_at is None or not isinstance(item_id, int):
+            raise ValueError(cursor)
+        return created_at, item_id
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def keyset_query(queryset, cursor=None, limit=20):
+    """The query behind keyset_page: rows after cursor in (-created_at, -id) order, plus one"""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        # created_at <= x bounds the index range; the OR only drops the few rows tied on x
+        queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=item_id))
+    # One extra row tells whether there is another page without a COUNT query
+    return queryset[:limit + 1]
+
+
+def keyset_page(queryset, cursor=None, limit=20):
+    """The page after cursor as (items, next_cursor); next_cursor is None on the last page"""
+    items = list(keyset_query(queryset, cursor, limit))
+    if len(items) > limit:
+        return items[:limit], encode_cursor(items[limit - 1])
+    return items, None
@@ -0,0 +1,156 @@
+"""
+Full-text search over analyses: tags, summary, key points and the original note
+Postgres keeps a weighted tsvector per analysis behind a GIN index and SQLite an FTS5 table;
+other databases fall back to LIKE on the summary. The index is filled from Python values
+when an analysis is saved (see signals.py), as the note and key points are stored compressed.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import NoteAnalysis
+
+TABLE = 'analyzer_analysis_search'
+MAX_TERMS = 16  # Words and phrases used from one query
+
+# Columns most significant first: Postgres weights A-D, FTS5 bm25 weights
+COLUMNS = ['tags', 'summary', 'key_points', 'original_text']
+BM25_WEIGHTS = [10.0, 4.0, 2.0, 1.0]
+
+
+def document(analysis):
+    """(id, session_key, text per COLUMNS) of an analysis, as indexed"""
+    return (
+        analysis.id,
+        analysis.session_key,
+        ' '.join(str(tag) for tag in analysis.tags or []),
+        analysis.summary or '',
+        '\n'.join(str(point) for point in analysis.key_points or []),
+        analysis.original_text or '',
+    )
+
+
+def create_index(using):
+    if using.vendor == 'postgresql':
+        with using.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+                'analysis_id bigint PRIMARY KEY REFERENCES analyzer_noteanalysis (id) '
+                'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+                'session_key varchar(40) NOT NULL, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS analysis_search_document_idx ON {TABLE} USING gin (document)')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS analysis_search_session_idx ON {TABLE} (session_key)')
+    elif using.vendor == 'sqlite':
+        with using.cursor() as cursor:
+            # rowid is the analysis id; session_key is indexed too, so a session filter is part of MATCH
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                f"session_key, {', '.join(COLUMNS)}, tokenize='porter unicode61')"
+            )
+
+
+def drop_index(using):
+    if using.vendor in ('postgresql', 'sqlite'):
+        with using.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def index_documents(documents, using=connection):
+    """Add or replace the index entries of documents made by document()"""
+    documents = list(documents)
+    if not documents:
+        return
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            vector = ' || '.join(
+                f"setweight(to_tsvector(%s::regconfig, %s), '{weight}')" for weight in 'ABCD'
+            )
+            config = settings.SEARCH_CONFIG
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (analysis_id, session_key, document) VALUES (%s, %s, {vector}) '
+                'ON CONFLICT (analysis_id) DO UPDATE SET session_key = EXCLUDED.session_key, document = EXCLUDED.document',
+                [(analysis_id, session_key, *[value for text in texts for value in (config, text)])
+                 for analysis_id, session_key, *texts in documents]
+            )
+        elif using.vendor == 'sqlite':
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row[0],) for row in documents])
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, session_key, {', '.join(COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+                documents
+            )
+
+
+def index_analyses(analyses):
+    index_documents(document(analysis) for analysis in analyses)
+
+
+def remove_analyses(ids):
+    ids = list(ids)
+    if ids and connection.vendor in ('postgresql', 'sqlite'):
+        column = 'analysis_id' if connection.vendor == 'postgresql' else 'rowid'
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE {column} = %s', [(analysis_id,) for analysis_id in ids])
+
+
+def query_parts(query):
+    """(included, excluded) phrases of a query; each phrase is a list of words"""
+    included, excluded = [], []
+    for negated, phrase, word in re.findall(r'(-?)(?:"([^"]*)"?|(\S+))', query):
+        words = re.findall(r'\w+', phrase or word)
+        if words:
+            (excluded if negated else included).append(words)
+    return included[:MAX_TERMS], excluded[:MAX_TERMS]
+
+
+def fts5_query(query, session_key=None):
+    """FTS5 MATCH expression for a query, or None when it has nothing to look for"""
+    included, excluded = query_parts(query)
+    if not included:
+        return None
+    quote = lambda words: '"' + ' '.join(words) + '"'
+    expression = ' AND '.join(quote(words) for words in included)
+    for words in excluded:
+        expression = f'({expression}) NOT {quote(words)}'
+    expression = f"{{{' '.join(COLUMNS)}}} : ({expression})"
+    if session_key is not None:
+        session_words = re.findall(r'\w+', session_key) or ['-']
+        expression = f'session_key : {quote(session_words)} AND {expression}'
+    return expression
+
+
+def search(query, session_key=None, limit=20):
+    """[(analysis id, rank)] best match first; rank is higher for better matches"""
+    if connection.vendor == 'postgresql':
+        session_filter = 'AND s.session_key = %s' if session_key is not None else ''
+        sql = (
+            f'SELECT s.analysis_id, ts_rank(s.document, q) AS rank '
+            f'FROM {TABLE} s, websearch_to_tsquery(%s::regconfig, %s) q '
+            f'WHERE s.document @@ q {session_filter} ORDER BY rank DESC, s.analysis_id DESC LIMIT %s'
+        )
+        params = [settings.SEARCH_CONFIG, query, *([session_key] if session_key is not None else []), limit]
+    elif connection.vendor == 'sqlite':
+        expression = fts5_query(query, session_key)
+        if expression is None:
+            return []
+        bm25 = f"bm25({TABLE}, 0.0, {', '.join(str(weight) for weight in BM25_WEIGHTS)})"
+        # bm25 is lower for better matches
+        sql = f'SELECT rowid, -{bm25} AS rank FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY {bm25}, rowid DESC LIMIT %s'
+        params = [expression, limit]
+    else:
+        included, _ = query_parts(query)
+        if not included:
+            return []
+        analyses = NoteAnalysis.objects.all()
+        if session_key is not None:
+            analyses = analyses.filter(session_key=session_key)
+        for words in included:
+            analyses = analyses.filter(summary__icontains=' '.join(words))
+        return [(analysis_id, 0.0) for analysis_id in analyses.order_by('-created_at', '-id').values_list('id', flat=True)[:limit]]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(analysis_id, float(rank)) for analysis_id, rank in cursor.fetchall()]
@@ -1,22 +1,92 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import NoteAnalysis, NoteComparison
+from .fields import CompressedJSONField, CompressedTextField
+from .models import NoteAnalysis, NoteComparison, AnalysisJob
+from .utils.groq_ai import ANALYSIS_MODES
 
-class NoteAnalysisSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer that takes an optional `fields` argument to return only some fields"""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        # Compressed columns hold text and JSON like the fields they replace
+        CompressedTextField: serializers.CharField,
+        CompressedJSONField: serializers.JSONField,
+    }
+    
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class NoteAnalysisSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = NoteAnalysis
         fields = '__all__'
 
-class NoteComparisonSerializer(serializers.ModelSerializer):
+class NoteAnalysisListSerializer(DynamicFieldsModelSerializer):
+    """Compact history entry: the note, quiz and other heavy columns are left out"""
+    summary_preview = serializers.CharField(read_only=True)  # Annotated by the query
+    
+    class Meta:
+        model = NoteAnalysis
+        fields = ['id', 'summary_preview', 'difficulty', 'bloom_level', 'tags', 'created_at']
+
+class NoteComparisonSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = NoteComparison
         fields = '__all__'
 
+class NoteComparisonListSerializer(DynamicFieldsModelSerializer):
+    """Compact history entry without the two compared notes"""
+    
+    class Meta:
+        model = NoteComparison
+        fields = ['id', 'similarity_score', 'comparison_summary', 'created_at']
+
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    
+    class Meta:
+        model = AnalysisJob
+        fields = ['job_id', 'status', 'attempts', 'max_attempts', 'error', 'created_at', 'updated_at']
+
 class TextInputSerializer(serializers.Serializer):
-    text = serializers.CharField()
+    text = serializers.CharField(max_length=settings.ANALYSIS_MAX_DOCUMENT_CHARS)  # Nothing past it is analyzed
+    mode = serializers.ChoiceField(choices=ANALYSIS_MODES, required=False)
+    background = serializers.BooleanField(required=False, allow_null=True)
 
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
+    mode = serializers.ChoiceField(choices=ANALYSIS_MODES, required=False)
+    background = serializers.BooleanField(required=False, allow_null=True)
 
 class ComparisonInputSerializer(serializers.Serializer):
     note1 = serializers.CharField()
-    note2 = serializers.CharField()
\ No newline at end of file
+    note2 = serializers.CharField()
+    llm_summary = serializers.BooleanField(required=False, allow_null=True)  # None means COMPARISON_LLM_SUMMARY
+
+class BatchComparisonInputSerializer(serializers.Serializer):
+    """Notes given as text or as ids of the session's analyses; references are indexes into them"""
+    notes = serializers.ListField(
+        child=serializers.CharField(max_length=settings.COMPARISON_BATCH_MAX_NOTE_CHARS), required=False
+    )
+    analysis_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    references = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False, default=list)
+    cluster_threshold = serializers.FloatField(min_value=0, max_value=100, required=False)
+    top_k = serializers.IntegerField(min_value=0, required=False, default=5)
+    llm_summaries = serializers.BooleanField(required=False, default=False)
+    
+    def validate(self, data):
+        if ('notes' in data) == ('analysis_ids' in data):
+            raise serializers.ValidationError('Send either notes or analysis_ids')
+        count = len(data.get('notes') or data.get('analysis_ids') or [])
+        if not 2 <= count <= settings.COMPARISON_BATCH_MAX_NOTES:
+            raise serializers.ValidationError(f'Send between 2 and {settings.COMPARISON_BATCH_MAX_NOTES} notes')
+        if sum(len(note) for note in data.get('notes', [])) > settings.COMPARISON_BATCH_MAX_TOTAL_CHARS:
+            raise serializers.ValidationError({'notes': f'At most {settings.COMPARISON_BATCH_MAX_TOTAL_CHARS} characters in total'})
+        if any(index >= count for index in data['references']):
+            raise serializers.ValidationError({'references': f'Indexes must be below {count}'})
+        if data['llm_summaries'] and data['top_k'] > settings.COMPARISON_BATCH_MAX_SUMMARIES:
+            raise serializers.ValidationError({'top_k': f'At most {settings.COMPARISON_BATCH_MAX_SUMMARIES} with llm_summaries'})
+        return data
\ No newline at end of file
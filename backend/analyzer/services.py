@@ -0,0 +1,215 @@
+"""
+Analysis pipeline shared by the API views and the background job worker
+"""
+
+import re
+
+from django.conf import settings
+from django.db.models.functions import Substr
+
+from .models import NoteAnalysis, NoteComparison
+from .utils import metrics, result_cache, similarity
+from .utils.file_handler import FileHandler
+from .utils.groq_ai import GroqAIProcessor
+
+
+def extract_text(uploaded_file):
+    """Extract raw text from an uploaded PDF, TXT or image file"""
+    from .utils.cloud_ocr import free_ocr
+
+    if free_ocr.is_image_file(uploaded_file.name):
+        # Use FREE OCR for images - no cost!
+        with metrics.timer('stage_seconds', stage='extract_image'):
+            return free_ocr.extract_text_from_image(uploaded_file)
+    # Use file handler for PDF/TXT
+    with metrics.timer('stage_seconds', stage='extract_document'):
+        return FileHandler.extract_text_from_file(uploaded_file)
+
+
+def clean_document(text, max_chars=None):
+    """Clean extracted text, keeping long documents up to max_chars (default ANALYSIS_MAX_DOCUMENT_CHARS)"""
+    with metrics.timer('stage_seconds', stage='clean_text'):
+        return FileHandler.clean_text(text, max_length=max_chars or settings.ANALYSIS_MAX_DOCUMENT_CHARS)
+
+
+def is_long_document(cleaned_text):
+    """Whether the text needs map-reduce analysis over several chunks"""
+    return len(cleaned_text) > settings.ANALYSIS_CHUNK_SIZE
+
+
+def is_too_long_for_request(text):
+    """Whether analyzing the text would not fit in a request, so it should go to the job worker"""
+    return settings.ANALYSIS_QUEUE_LONG_DOCUMENTS and len(' '.join(text.split())) > settings.ANALYSIS_SYNC_MAX_CHARS
+
+
+def run_analysis(ai_processor, text, cleaned_text, mode=None, max_chars=None):
+    """Analyze a document, using map-reduce over chunks when it is too long for one prompt"""
+    if not is_long_document(cleaned_text):
+        return ai_processor.run_analysis(cleaned_text, mode=mode)
+    # Chunk the raw text so page and paragraph boundaries are still visible
+    max_chars = max_chars or settings.ANALYSIS_MAX_DOCUMENT_CHARS
+    chunks = []
+    total = 0
+    for chunk in FileHandler.split_into_chunks(text, settings.ANALYSIS_CHUNK_SIZE):
+        if total + len(chunk) > max_chars:
+            break
+        chunks.append(chunk)
+        total += len(chunk)
+    return ai_processor.run_chunked_analysis(chunks, mode=mode)
+
+
+def analyze_text(text, mode=None, max_chars=None):
+    """
+    Run the AI analysis on extracted text, without saving it
+    Returns (cleaned_text, analysis, topic_graph, quiz_questions), the arguments of save_analysis.
+    max_chars defaults to ANALYSIS_MAX_DOCUMENT_CHARS; requests pass ANALYSIS_SYNC_MAX_CHARS.
+    """
+    cleaned_text = clean_document(text, max_chars)
+    analysis, topic_graph, quiz_questions = run_analysis(
+        GroqAIProcessor(), text, cleaned_text, mode=mode, max_chars=max_chars
+    )
+    return cleaned_text, analysis, topic_graph, quiz_questions
+
+
+def create_analysis(session_key, text, mode=None, max_chars=None):
+    """Run the AI analysis on extracted text and save it with session isolation"""
+    return save_analysis(session_key, *analyze_text(text, mode=mode, max_chars=max_chars))
+
+
+def save_analysis(session_key, cleaned_text, analysis, topic_graph, quiz_questions):
+    """Persist the results of the analysis stages"""
+    with metrics.timer('stage_seconds', stage='save_analysis'):
+        return NoteAnalysis.objects.create(
+            session_key=session_key,
+            original_text=cleaned_text,
+            summary=analysis['summary'],
+            key_points=analysis['key_points'],
+            difficulty=analysis['difficulty'],
+            bloom_level=analysis['bloom_level'],
+            topic_graph=topic_graph,
+            quiz_questions=quiz_questions,
+            tags=analysis['tags'],
+            learning_objectives=analysis.get('learning_objectives', []),
+            prerequisites=analysis.get('prerequisites', []),
+            applications=analysis.get('applications', [])
+        )
+
+
+def swap_note_labels(text):
+    """Exchange "Note A" and "Note B" in a summary written for the notes in the other order"""
+    return re.sub(r'\bNote ([AB])\b', lambda match: 'Note ' + ('B' if match.group(1) == 'A' else 'A'), text)
+
+
+def compare_notes(note1, note2, summarize=None):
+    """
+    Similarity score computed locally (utils.similarity) and a prose summary, written by
+    the LLM when summarize (default COMPARISON_LLM_SUMMARY) and it answers, else from key terms.
+    Both are cached for the unordered pair, so comparing B to A after A to B is free.
+    """
+    if summarize is None:
+        summarize = settings.COMPARISON_LLM_SUMMARY
+    first, second = sorted((note1, note2))
+    swapped = first != note1
+    
+    cache_key = result_cache.make_key('similarity', similarity.ENGINE, similarity.VERSION, first, second)
+    local = result_cache.get(cache_key)
+    if local is None:
+        with metrics.timer('stage_seconds', stage='similarity'):
+            local = {
+                'similarity_score': similarity.score(similarity.similarity(first, second)),
+                'terms': similarity.key_terms(first, second),
+            }
+        result_cache.set(cache_key, local)
+    
+    summary = None
+    if summarize:
+        summary = GroqAIProcessor().summarize_comparison(first, second, local['similarity_score'])
+    if summary is None:
+        summary = similarity.describe(local['similarity_score'], local['terms'])
+    terms = local['terms']
+    if swapped:
+        summary = swap_note_labels(summary)
+        terms = {**terms, 'first': terms['second'], 'second': terms['first']}
+    return {'similarity_score': local['similarity_score'], 'comparison_summary': summary, 'terms': terms}
+
+
+def compare_batch(texts, references=(), cluster_threshold=None, top_k=5, summarize=False):
+    """
+    All-pairs comparison of texts from one similarity matrix (TF-IDF over the batch, so words
+    every note shares count less), with clusters, each text's nearest reference and the top_k
+    most similar pairs. Only those pairs get a prose summary, from the LLM when summarize.
+    """
+    if cluster_threshold is None:
+        cluster_threshold = settings.COMPARISON_CLUSTER_THRESHOLD
+    with metrics.timer('stage_seconds', stage='similarity_matrix'):
+        matrix = similarity.similarity_matrix(texts)
+    
+    result = {
+        'matrix': [[similarity.score(value) for value in row] for row in matrix],
+        'clusters': similarity.clusters(matrix, cluster_threshold / 100),
+    }
+    if references:
+        result['nearest_reference'] = [
+            {'index': index, 'reference': reference, 'similarity_score': similarity.score(value)}
+            for index, reference, value in similarity.nearest_references(matrix, references)
+        ]
+    
+    pairs = similarity.top_pairs(matrix, top_k)
+    # Asked exactly as compare_notes asks (sorted notes, pairwise score), so the LLM answers are shared
+    ordered = [sorted((texts[first], texts[second])) for first, second, _ in pairs]
+    summaries = [None] * len(pairs)
+    if summarize and pairs:
+        summaries = GroqAIProcessor().summarize_comparisons(
+            [(note1, note2, similarity.score(similarity.similarity(note1, note2))) for note1, note2 in ordered]
+        )
+    result['top_pairs'] = []
+    for (first, second, value), (note1, _), summary in zip(pairs, ordered, summaries):
+        if summary is None:
+            summary = similarity.describe(similarity.score(value), similarity.key_terms(texts[first], texts[second]))
+        elif note1 != texts[first]:
+            summary = swap_note_labels(summary)
+        result['top_pairs'].append({
+            'first': first, 'second': second, 'similarity_score': similarity.score(value), 'comparison_summary': summary
+        })
+    return result
+
+
+def text_preview(text, length=500):
+    """Shorten extracted text for display"""
+    return text[:length] + '...' if len(text) > length else text
+
+
+def analysis_response(note_analysis, extracted_text=None):
+    """Build the API response body for a saved analysis"""
+    response_data = {
+        'id': note_analysis.id,
+        'summary': note_analysis.summary,
+        'key_points': note_analysis.key_points,
+        'difficulty': note_analysis.difficulty,
+        'bloom_level': note_analysis.bloom_level,
+        'topic_graph': note_analysis.topic_graph,
+        'quiz_questions': note_analysis.quiz_questions,
+        'tags': note_analysis.tags,
+        'learning_objectives': note_analysis.learning_objectives,
+        'prerequisites': note_analysis.prerequisites,
+        'applications': note_analysis.applications,
+        'created_at': note_analysis.created_at
+    }
+    if extracted_text is not None:
+        response_data['extracted_text'] = text_preview(extracted_text)
+    return response_data
+
+
+def analysis_history(session_key, fields):
+    """A session's analyses with only the columns behind the compact list fields loaded"""
+    analyses = NoteAnalysis.objects.filter(session_key=session_key).only(
+        'id', 'created_at', *[field for field in fields if field != 'summary_preview']
+    )
+    if 'summary_preview' in fields:
+        analyses = analyses.annotate(summary_preview=Substr('summary', 1, settings.HISTORY_SUMMARY_PREVIEW_CHARS))
+    return analyses
+
+
+def comparison_history(session_key):
+    """A session's comparisons without the two compared notes"""
+    return NoteComparison.objects.filter(session_key=session_key).defer('note1_text', 'note2_text')
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import search, tagging
+from .models import NoteAnalysis
+
+
+@receiver(post_save, sender=NoteAnalysis)
+def index_analysis(sender, instance, **kwargs):
+    """Keep the full-text and tag indexes in step with saved analyses (bulk_create callers index their own)"""
+    search.index_analyses([instance])
+    tagging.index_analyses([instance])
+
+
+@receiver(post_delete, sender=NoteAnalysis)
+def remove_analysis(sender, instance, **kwargs):
+    search.remove_analyses([instance.pk])
@@ -0,0 +1,125 @@
+"""
+Server-Sent Events stream of an analysis, emitted as each part is produced
+"""
+
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.http import StreamingHttpResponse
+
+from .services import (
+    clean_document, extract_text, is_long_document, run_analysis, save_analysis, text_preview
+)
+from .utils import metrics
+from .utils.groq_ai import GroqAIProcessor, COMBINED_SCHEMA, get_stage_executor
+
+ANALYSIS_SECTIONS = [section for section in COMBINED_SCHEMA if section not in ('topic_graph', 'quiz_questions')]
+
+_FINISHED = object()
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def event_stream_response(events):
+    """Wrap an event generator in an unbuffered text/event-stream response"""
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx-style proxies from buffering the stream
+    return response
+
+
+def _produce(task, events):
+    """Run a stage on a pool thread, forwarding its (event, data) pairs to the stream"""
+    try:
+        for event in task():
+            events.put(event)
+    except Exception as e:
+        print(f"Streaming stage failed: {e}")
+    finally:
+        events.put((_FINISHED, None))
+        connections.close_all()
+
+
+def stream_analysis(session_key, text=None, uploaded_file=None, mode=None):
+    """
+    Yield SSE events for an analysis: extracted_text, summary_delta (tokens),
+    section (one per analysis field), topic_graph, quiz, then done with the saved id
+    """
+    try:
+        if uploaded_file is not None:
+            yield sse_event('status', {'stage': 'extracting'})
+            text = extract_text(uploaded_file)
+        # A stream cannot be handed to the job worker, so it analyzes what fits in a request
+        cleaned_text = clean_document(text, settings.ANALYSIS_SYNC_MAX_CHARS)
+        if not cleaned_text:
+            yield sse_event('error', {'error': 'No text could be extracted from the file'})
+            return
+        yield sse_event('extracted_text', {'preview': text_preview(cleaned_text), 'length': len(cleaned_text)})
+
+        processor = GroqAIProcessor()
+        long_document = is_long_document(cleaned_text)
+        if long_document:
+            # Chunks are analyzed and merged before anything can be reported. The chunked run waits
+            # on stage pool tasks, so it gets a thread of its own instead of a stage pool worker
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream-chunked')
+            tasks = [lambda: zip(('analysis', 'topic_graph', 'quiz'), run_analysis(
+                processor, text, cleaned_text, mode, max_chars=settings.ANALYSIS_SYNC_MAX_CHARS
+            ))]
+        elif (mode or settings.ANALYSIS_MODE) == 'combined':
+            executor = get_stage_executor()
+            tasks = [lambda: zip(('analysis', 'topic_graph', 'quiz'), processor.analyze_combined(cleaned_text))]
+        else:
+            executor = get_stage_executor()
+            tasks = [
+                lambda: processor.stream_analyze_note(cleaned_text),
+                lambda: [('topic_graph', processor.generate_topic_graph(cleaned_text))],
+                lambda: [('quiz', processor.generate_quiz(cleaned_text))],
+            ]
+
+        events = queue.Queue()
+        for task in tasks:
+            executor.submit(metrics.in_context(_produce), task, events)
+        if long_document:
+            executor.shutdown(wait=False)  # The thread exits once the task is done
+
+        results = {}
+        running = len(tasks)
+        while running:
+            try:
+                event, data = events.get(timeout=settings.SSE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Comment lines keep proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+
+            if event is _FINISHED:
+                running -= 1
+            elif event == 'summary_delta':
+                yield sse_event('summary_delta', {'text': data})
+            elif event == 'analysis':
+                results[event] = data
+                for section in ANALYSIS_SECTIONS:
+                    if section in data:
+                        yield sse_event('section', {'section': section, 'value': data[section]})
+            else:
+                results[event] = data
+                yield sse_event(event, data)
+
+        note_analysis = save_analysis(
+            session_key,
+            cleaned_text,
+            results.get('analysis') or processor._fallback_analysis(),
+            results.get('topic_graph') or processor._fallback_graph(),
+            results.get('quiz') or processor._fallback_quiz()
+        )
+        yield sse_event('done', {'id': note_analysis.id, 'created_at': note_analysis.created_at})
+
+    except Exception as e:
+        yield sse_event('error', {'error': f'Analysis failed: {str(e)}'})
@@ -0,0 +1,67 @@
+"""
+Normalized tag index of analyses (AnalysisTag), filled when an analysis is saved
+Tag, difficulty and Bloom level filters and the per-session facet counts run in the database
+"""
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import AnalysisTag
+
+MAX_TAG_LENGTH = AnalysisTag._meta.get_field('name').max_length
+
+
+def normalize(tag):
+    """Case- and whitespace-insensitive form of a tag, as stored in AnalysisTag.name"""
+    return ' '.join(str(tag).split()).lower()[:MAX_TAG_LENGTH]
+
+
+def tag_entries(analysis):
+    names = dict.fromkeys(normalize(tag) for tag in analysis.tags or [])
+    return [AnalysisTag(analysis_id=analysis.id, session_key=analysis.session_key, name=name) for name in names if name]
+
+
+def index_analyses(analyses, batch_size=1000):
+    """Replace the tag entries of saved analyses with their current tags"""
+    analyses = list(analyses)
+    if not analyses:
+        return
+    AnalysisTag.objects.filter(analysis_id__in=[analysis.id for analysis in analyses]).delete()
+    AnalysisTag.objects.bulk_create(
+        [entry for analysis in analyses for entry in tag_entries(analysis)], batch_size=batch_size
+    )
+
+
+def filter_analyses(analyses, session_key, tags=(), difficulty=None, bloom_level=None):
+    """Analyses having every tag in tags (normalized) and the given difficulty and Bloom level"""
+    for tag in tags:
+        analyses = analyses.filter(
+            id__in=AnalysisTag.objects.filter(session_key=session_key, name=normalize(tag)).values('analysis_id')
+        )
+    if difficulty:
+        analyses = analyses.filter(difficulty=difficulty)
+    if bloom_level:
+        analyses = analyses.filter(bloom_level=bloom_level)
+    return analyses
+
+
+def facets(analyses, session_key, filtered=False):
+    """Tag, difficulty and Bloom level counts over analyses, most common first"""
+    entries = AnalysisTag.objects.filter(session_key=session_key)
+    if filtered:
+        entries = entries.filter(analysis__in=analyses.values('id'))
+    counts = lambda rows, field: [{'value': row[field], 'count': row['count']} for row in rows]
+    return {
+        'tags': counts(
+            entries.values('name').annotate(count=Count('id')).order_by('-count', 'name')[:settings.TAG_FACET_LIMIT],
+            'name'
+        ),
+        'difficulty': counts(
+            analyses.order_by().values('difficulty').annotate(count=Count('id')).order_by('-count', 'difficulty'),
+            'difficulty'
+        ),
+        'bloom_level': counts(
+            analyses.order_by().values('bloom_level').annotate(count=Count('id')).order_by('-count', 'bloom_level'),
+            'bloom_level'
+        ),
+    }
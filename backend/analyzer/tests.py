@@ -1,8 +1,68 @@
-from django.test import TestCase
+import importlib
+import json
+import marshal
+import os
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import groq
+import httpx
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import NoteAnalysis, NoteComparison
+from . import jobs, search, serializers
+from collections import Counter
+from .models import AnalysisTag, NoteAnalysis, NoteComparison, AnalysisJob
+from .streaming import stream_analysis
+from .utils import compression, map_reduce, metrics, profiling, similarity, standin
+from .utils.cloud_ocr import CircuitBreaker, FreeOCRExtractor
+from .utils.image_preprocessing import PreparedImage, preprocess_image
+from .utils.ocr_providers import OCRProvider, OCRSpaceProvider, load_providers
+from .utils.file_handler import FileHandler
+from .utils.groq_ai import GroqAIProcessor
+from .utils.groq_client import ResilientGroqClient, RateLimiter, RateLimitTimeout, parse_duration
+
+
+def fake_groq_client(content):
+    """Build a stand-in Groq client whose completions return content, or content(prompt) for a function"""
+    client = mock.MagicMock()
+    if callable(content):
+        client.chat.completions.create.side_effect = lambda messages, **kwargs: mock.MagicMock(
+            choices=[mock.MagicMock(message=mock.MagicMock(content=content(messages[0]['content'])))]
+        )
+    else:
+        client.chat.completions.create.return_value.choices = [
+            mock.MagicMock(message=mock.MagicMock(content=content))
+        ]
+    return client
+
+def staged_reply(prompt):
+    """A schema-valid reply to a staged prompt (see COMBINED_RESULT)"""
+    if 'mind map' in prompt:
+        return json.dumps(COMBINED_RESULT['topic_graph'])
+    if 'multiple choice' in prompt:
+        return json.dumps(COMBINED_RESULT['quiz_questions'])
+    return json.dumps({
+        section: value for section, value in COMBINED_RESULT.items() if section not in ('topic_graph', 'quiz_questions')
+    })
 
 class AnalyzerAPITestCase(APITestCase):
     
@@ -36,6 +96,15 @@ class AnalyzerAPITestCase(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('analyses', response.data)
         self.assertIn('comparisons', response.data)
+    
+    def test_health_check_survives_ocr_status_errors(self):
+        """Test the health check still answers 200 when the OCR status cannot be read"""
+        with mock.patch('analyzer.views.free_ocr.get_ocr_status', side_effect=KeyError('provider')):
+            response = self.client.get(reverse('health-check'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'healthy')
+        self.assertFalse(response.data['ocr']['available'])
 
 class ModelsTestCase(TestCase):
     
@@ -66,4 +135,1631 @@ class ModelsTestCase(TestCase):
         )
         
         self.assertEqual(str(comparison), f"Comparison {comparison.id} - 75.5% similarity")
-        self.assertEqual(comparison.similarity_score, 75.5)
\ No newline at end of file
+        self.assertEqual(comparison.similarity_score, 75.5)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResultCacheTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.processor = GroqAIProcessor()
+        self.processor.client = fake_groq_client('[{"id": "a", "label": "A", "children": []}]')
+    
+    def test_repeated_text_is_served_from_cache(self):
+        """Test identical text only reaches the LLM once"""
+        first = self.processor.generate_topic_graph("Photosynthesis notes")
+        second = self.processor.generate_topic_graph("Photosynthesis notes")
+        
+        self.assertEqual(first, second)
+        self.assertEqual(self.processor.client.chat.completions.create.call_count, 1)
+    
+    def test_cache_key_includes_text_and_model(self):
+        """Test different text or model misses the cache"""
+        self.processor.generate_topic_graph("Photosynthesis notes")
+        self.processor.generate_topic_graph("Respiration notes")
+        self.processor.model = "another-model"
+        self.processor.generate_topic_graph("Photosynthesis notes")
+        
+        self.assertEqual(self.processor.client.chat.completions.create.call_count, 3)
+    
+    def test_fallback_is_not_cached(self):
+        """Test unparseable responses are not stored in the cache"""
+        self.processor.client = fake_groq_client('no json here')
+        self.processor.generate_quiz("Photosynthesis notes")
+        self.processor.generate_quiz("Photosynthesis notes")
+        
+        self.assertEqual(self.processor.client.chat.completions.create.call_count, 2)
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ANALYSIS_CONCURRENT_STAGES=True
+)
+class ConcurrentStagesTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.processor = GroqAIProcessor()
+        self.processor.client = mock.MagicMock()
+    
+    def test_stages_run_in_parallel(self):
+        """Test all three stages are in flight at the same time"""
+        barrier = threading.Barrier(3, timeout=5)
+        
+        def create(messages, **kwargs):
+            barrier.wait()  # Raises BrokenBarrierError if the stages ran one by one
+            content = staged_reply(messages[0]['content'])
+            return mock.MagicMock(choices=[mock.MagicMock(message=mock.MagicMock(content=content))])
+        
+        self.processor.client.chat.completions.create.side_effect = create
+        analysis, topic_graph, quiz = self.processor.run_analysis("Photosynthesis notes")
+        
+        self.assertEqual(analysis['summary'], COMBINED_RESULT['summary'])
+        self.assertEqual(topic_graph[0]['id'], 'photo')
+        self.assertEqual(quiz[0]['question'], 'Where?')
+    
+    def test_failing_stage_keeps_its_own_fallback(self):
+        """Test one failing stage does not affect the others"""
+        def create(messages, **kwargs):
+            if 'mind map' in messages[0]['content']:
+                raise RuntimeError("boom")
+            content = staged_reply(messages[0]['content'])
+            return mock.MagicMock(choices=[mock.MagicMock(message=mock.MagicMock(content=content))])
+        
+        self.processor.client.chat.completions.create.side_effect = create
+        _, topic_graph, quiz = self.processor.run_analysis("Photosynthesis notes")
+        
+        self.assertEqual(topic_graph, self.processor._fallback_graph())
+        self.assertEqual(quiz, COMBINED_RESULT['quiz_questions'])
+    
+    def test_reply_not_matching_stage_schema_is_not_cached(self):
+        """Test parseable JSON of the wrong shape falls back and is asked for again, not cached"""
+        self.processor.client = fake_groq_client('{"foo": 1}')
+        first = self.processor.analyze_note("Photosynthesis notes")
+        self.processor.analyze_note("Photosynthesis notes")
+        self.assertEqual(first, self.processor._fallback_analysis())
+        self.assertEqual(self.processor.client.chat.completions.create.call_count, 2)
+        self.assertIsNone(self.processor.summarize_comparison('Note one', 'Note two', 10.0))
+
+COMBINED_RESULT = {
+    "summary": "Plants turn light into chemical energy.",
+    "key_points": ["Chlorophyll absorbs light."],
+    "difficulty": "Medium",
+    "bloom_level": "Understand",
+    "tags": ["biology"],
+    "learning_objectives": ["Explain photosynthesis."],
+    "prerequisites": ["Cell biology."],
+    "applications": ["Agriculture."],
+    "topic_graph": [{"id": "photo", "label": "Photosynthesis", "children": ["Calvin cycle"]}],
+    "quiz_questions": [{"question": "Where?", "options": ["A", "B", "C", "D"], "correct_answer": "A"}],
+}
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CombinedAnalysisTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.processor = GroqAIProcessor()
+    
+    def test_combined_mode_uses_one_request(self):
+        """Test a valid combined response needs a single LLM call"""
+        self.processor.client = fake_groq_client(json.dumps(COMBINED_RESULT))
+        analysis, topic_graph, quiz = self.processor.run_analysis("Photosynthesis notes", mode='combined')
+        
+        self.assertEqual(self.processor.client.chat.completions.create.call_count, 1)
+        self.assertEqual(analysis['summary'], COMBINED_RESULT['summary'])
+        self.assertEqual(topic_graph, COMBINED_RESULT['topic_graph'])
+        self.assertEqual(quiz, COMBINED_RESULT['quiz_questions'])
+    
+    def test_only_invalid_sections_are_rerequested(self):
+        """Test the repair request asks only for the invalid sections"""
+        broken = dict(COMBINED_RESULT, difficulty="Impossible")
+        del broken['quiz_questions']
+        repair = {"difficulty": "Hard", "quiz_questions": COMBINED_RESULT['quiz_questions']}
+        self.processor.client = mock.MagicMock()
+        self.processor.client.chat.completions.create.side_effect = [
+            mock.MagicMock(choices=[mock.MagicMock(message=mock.MagicMock(content=json.dumps(broken)))]),
+            mock.MagicMock(choices=[mock.MagicMock(message=mock.MagicMock(content=json.dumps(repair)))]),
+        ]
+        
+        analysis, _, quiz = self.processor.analyze_combined("Photosynthesis notes")
+        repair_prompt = self.processor.client.chat.completions.create.call_args_list[1].kwargs['messages'][0]['content']
+        
+        self.assertIn("ONLY these keys: difficulty, quiz_questions", repair_prompt)
+        self.assertEqual(analysis['difficulty'], "Hard")
+        self.assertEqual(quiz, COMBINED_RESULT['quiz_questions'])
+    
+    def test_analyze_text_rejects_unknown_mode(self):
+        """Test the analyze endpoint validates the requested mode"""
+        response = self.client.post(
+            reverse('analyze-text'), {'text': 'Notes', 'mode': 'everything'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+class AnalysisJobTestCase(APITestCase):
+    
+    def test_background_analysis_is_processed_by_worker(self):
+        """Test a queued analysis is picked up by the worker and exposed on the status endpoint"""
+        response = self.client.post(
+            reverse('analyze-text'), {'text': 'Notes about photosynthesis', 'background': True}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        job_url = reverse('analysis-job', args=[response.data['job_id']])
+        self.assertEqual(self.client.get(job_url).data['status'], 'pending')
+        
+        call_command('process_analysis_jobs', once=True, concurrency=1, stdout=StringIO())
+        
+        job_response = self.client.get(job_url)
+        self.assertEqual(job_response.data['status'], 'done')
+        self.assertEqual(job_response.data['result']['id'], NoteAnalysis.objects.get().id)
+    
+    @override_settings(ANALYSIS_SYNC_MAX_CHARS=3000, ANALYSIS_CHUNK_SIZE=1000)
+    def test_document_too_long_for_a_request_is_queued(self):
+        """Test long texts are analyzed only in part by default, and go to the worker when queueing is on"""
+        text = long_document(paragraphs=20)
+        with mock.patch.object(GroqAIProcessor, 'run_chunked_analysis', wraps=GroqAIProcessor().run_chunked_analysis) as chunked:
+            response = self.client.post(reverse('analyze-text'), {'text': text}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(sum(len(chunk) for chunk in chunked.call_args.args[0]), 3000)
+        self.assertFalse(AnalysisJob.objects.exists())
+        
+        with override_settings(ANALYSIS_QUEUE_LONG_DOCUMENTS=True):
+            response = self.client.post(reverse('analyze-text'), {'text': text}, format='json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(AnalysisJob.objects.get().input_text, text.strip())
+            
+            response = self.client.post(reverse('analyze-text'), {'text': text, 'background': False}, format='json')
+            self.assertEqual(response.status_code, 200)
+        
+        too_long = 'x' * (settings.ANALYSIS_MAX_DOCUMENT_CHARS + 1)
+        self.assertFalse(serializers.TextInputSerializer(data={'text': too_long}).is_valid())
+    
+    def test_job_status_is_session_isolated(self):
+        """Test jobs from another session are not visible"""
+        job = jobs.enqueue_text('someone-else', 'Notes')
+        response = self.client.get(reverse('analysis-job', args=[job.id]))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_claimed_job_is_hidden_until_visibility_timeout(self):
+        """Test a claimed job is reclaimed only after its visibility timeout expires"""
+        job = jobs.enqueue_text('session', 'Notes')
+        self.assertEqual(jobs.claim_next_job('worker-1', 60).id, job.id)
+        self.assertIsNone(jobs.claim_next_job('worker-2', 60))
+        
+        AnalysisJob.objects.filter(id=job.id).update(available_at=timezone.now() - timedelta(seconds=1))
+        reclaimed = jobs.claim_next_job('worker-2', 60)
+        
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertEqual(reclaimed.locked_by, 'worker-2')
+        # The first worker can no longer complete the reclaimed job, and its analysis is not kept
+        self.assertEqual(jobs.complete_job(job, 'worker-1', None), 0)
+        self.assertFalse(jobs.process_job(job, 'worker-1', retry_delay=0))
+        self.assertFalse(NoteAnalysis.objects.exists())
+        self.assertEqual(AnalysisJob.objects.get(id=job.id).status, AnalysisJob.STATUS_RUNNING)
+    
+    def test_running_job_keeps_its_claim(self):
+        """Test a long job extends its visibility while it runs, and only for the worker that owns it"""
+        job = jobs.enqueue_text('session', 'Notes')
+        claimed = jobs.claim_next_job('worker-1', 60)
+        AnalysisJob.objects.filter(id=job.id).update(available_at=timezone.now() + timedelta(seconds=1))
+        
+        self.assertEqual(jobs.extend_visibility(claimed, 'worker-1', 600), 1)
+        self.assertGreater(AnalysisJob.objects.get(id=job.id).available_at, timezone.now() + timedelta(seconds=500))
+        self.assertIsNone(jobs.claim_next_job('worker-2', 60))
+        self.assertEqual(jobs.extend_visibility(claimed, 'worker-2', 600), 0)
+        
+        beats = threading.Event()
+        def slow_analysis(text, mode=None):
+            beats.wait(5)
+            return text, {}, [], []
+        with mock.patch('analyzer.jobs.extend_visibility', side_effect=lambda *args: beats.set()) as extend, \
+             mock.patch('analyzer.jobs.analyze_text', side_effect=slow_analysis), \
+             mock.patch('analyzer.jobs.save_analysis'), mock.patch('analyzer.jobs.complete_job', return_value=1):
+            self.assertTrue(jobs.process_job(claimed, 'worker-1', retry_delay=0, visibility_timeout=0.03))
+        extend.assert_called_with(claimed, 'worker-1', 0.03)
+    
+    def test_failed_job_is_retried_then_failed(self):
+        """Test failures are retried with backoff until max_attempts is reached"""
+        job = AnalysisJob.objects.create(session_key='session', input_text='Notes', max_attempts=2)
+        
+        with mock.patch('analyzer.jobs.analyze_text', side_effect=RuntimeError('Groq down')):
+            jobs.process_job(jobs.claim_next_job('worker', 60), 'worker', retry_delay=0)
+            job.refresh_from_db()
+            self.assertEqual(job.status, AnalysisJob.STATUS_PENDING)
+            
+            jobs.process_job(jobs.claim_next_job('worker', 60), 'worker', retry_delay=0)
+            job.refresh_from_db()
+            self.assertEqual(job.status, AnalysisJob.STATUS_FAILED)
+            self.assertEqual(job.error, 'Groq down')
+
+def parse_sse(content):
+    """Split a text/event-stream body into (event, data) pairs, skipping comments"""
+    events = []
+    for block in content.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StreamingAnalysisTestCase(APITestCase):
+    
+    def setUp(self):
+        cache.clear()
+    
+    def fake_create(self, messages, stream=False, **kwargs):
+        prompt = messages[0]['content']
+        if stream:
+            reply = json.dumps({key: COMBINED_RESULT[key] for key in COMBINED_RESULT if key not in ('topic_graph', 'quiz_questions')})
+            return iter(
+                mock.MagicMock(choices=[mock.MagicMock(delta=mock.MagicMock(content=reply[i:i + 7]))])
+                for i in range(0, len(reply), 7)
+            )
+        content = json.dumps(COMBINED_RESULT['topic_graph'] if 'mind map' in prompt else COMBINED_RESULT['quiz_questions'])
+        return mock.MagicMock(choices=[mock.MagicMock(message=mock.MagicMock(content=content))])
+    
+    def test_stream_emits_events_as_work_completes(self):
+        """Test the stream carries the preview, summary tokens, sections, graph, quiz and saved id"""
+        processor = GroqAIProcessor()
+        processor.client = mock.MagicMock()
+        processor.client.chat.completions.create.side_effect = self.fake_create
+        with mock.patch('analyzer.streaming.GroqAIProcessor', return_value=processor):
+            response = self.client.post(reverse('analyze-text-stream'), {'text': 'Photosynthesis notes'}, format='json')
+            events = parse_sse(b''.join(response.streaming_content).decode())
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        names = [event for event, _ in events]
+        self.assertEqual(names[0], 'extracted_text')
+        self.assertEqual(names[-1], 'done')
+        self.assertIn('topic_graph', names)
+        self.assertIn('quiz', names)
+        summary = ''.join(data['text'] for event, data in events if event == 'summary_delta')
+        self.assertEqual(summary, COMBINED_RESULT['summary'])
+        self.assertGreater(names.count('summary_delta'), 1)
+        sections = [data['section'] for event, data in events if event == 'section']
+        self.assertIn('key_points', sections)
+        self.assertEqual(events[-1][1]['id'], NoteAnalysis.objects.get().id)
+
+    @override_settings(ANALYSIS_CHUNK_SIZE=3000, ANALYSIS_SYNC_MAX_CHARS=30000)
+    def test_long_stream_does_not_wait_on_its_own_stage_pool(self):
+        """Test a chunked stream finishes even when the stage pool has a single worker"""
+        processor = GroqAIProcessor()
+        processor.client = fake_groq_client(staged_reply)
+        stage_pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(stage_pool.shutdown, wait=False)
+        events = []
+        with mock.patch('analyzer.streaming.GroqAIProcessor', return_value=processor), \
+             mock.patch('analyzer.streaming.get_stage_executor', return_value=stage_pool), \
+             mock.patch('analyzer.utils.groq_ai.get_stage_executor', return_value=stage_pool), \
+             mock.patch('analyzer.streaming.save_analysis', return_value=mock.Mock(id=1, created_at=None)):
+            stream = stream_analysis('session', text=long_document(paragraphs=10), mode='staged')
+            consumer = threading.Thread(target=lambda: events.extend(stream), daemon=True)
+            consumer.start()
+            consumer.join(30)
+        
+        self.assertFalse(consumer.is_alive())
+        self.assertEqual(events[-1].split('\n')[0], 'event: done')
+
+def groq_status_error(status_code, headers=None):
+    """Build the exception the Groq SDK raises for an HTTP error status"""
+    response = httpx.Response(
+        status_code, headers=headers or {}, request=httpx.Request('POST', 'https://api.groq.com/openai/v1/chat/completions')
+    )
+    error_class = groq.RateLimitError if status_code == 429 else groq.APIStatusError
+    return error_class('error', response=response, body=None)
+
+@override_settings(GROQ_MAX_RETRIES=3, GROQ_DEADLINE=30)
+class ResilientGroqClientTestCase(TestCase):
+    
+    def setUp(self):
+        metrics.reset()
+        self.sdk = mock.MagicMock()
+        self.client = ResilientGroqClient(self.sdk)
+        self.raw_create = self.sdk.chat.completions.with_raw_response.create
+    
+    @mock.patch('analyzer.utils.groq_client.time.sleep')
+    def test_retries_rate_limits_and_server_errors(self, sleep):
+        """Test 429 and 5xx responses are retried, honouring retry-after"""
+        self.raw_create.side_effect = [
+            groq_status_error(429, {'retry-after': '2'}),
+            groq_status_error(503),
+            mock.MagicMock(headers={}, parse=mock.MagicMock(return_value='completion')),
+        ]
+        
+        result = self.client.chat.completions.create(messages=[{'role': 'user', 'content': 'hi'}], model='m')
+        
+        self.assertEqual(result, 'completion')
+        self.assertEqual(sleep.call_args_list[0].args[0], 2.0)
+        self.assertEqual(metrics.get('groq_retries_total', reason='429'), 1)
+        self.assertEqual(metrics.get('groq_retries_total', reason='503'), 1)
+    
+    @mock.patch('analyzer.utils.groq_client.time.sleep')
+    def test_client_errors_are_not_retried(self, sleep):
+        """Test a 400 response fails immediately"""
+        self.raw_create.side_effect = groq_status_error(400)
+        with self.assertRaises(groq.APIStatusError):
+            self.client.chat.completions.create(messages=[], model='m')
+        self.assertEqual(self.raw_create.call_count, 1)
+        sleep.assert_not_called()
+    
+    @override_settings(GROQ_TIMEOUT=60, GROQ_DEADLINE=100, GROQ_MIN_ATTEMPT_SECONDS=5)
+    def test_attempt_timeout_is_cut_to_the_deadline(self):
+        """Test an attempt never gets more than the time left, and none starts when too little is left"""
+        clock = [1000.0]
+        def create(**kwargs):
+            clock[0] += kwargs['timeout']  # Each attempt hangs until its timeout
+            raise groq.APITimeoutError(request=httpx.Request('POST', 'https://api.groq.com'))
+        self.raw_create.side_effect = create
+        
+        with mock.patch('analyzer.utils.groq_client.time.monotonic', side_effect=lambda: clock[0]), \
+             mock.patch('analyzer.utils.groq_client.time.sleep', side_effect=lambda seconds: None), \
+             mock.patch('analyzer.utils.groq_client.random.uniform', return_value=0):
+            with self.assertRaises(groq.APITimeoutError):
+                self.client.chat.completions.create(messages=[], model='m')
+        
+        self.assertEqual([call.kwargs['timeout'] for call in self.raw_create.call_args_list], [60, 40])
+        self.assertLessEqual(clock[0] - 1000.0, 100)
+    
+    def test_rate_limiter_follows_response_headers(self):
+        """Test an exhausted bucket makes callers wait for the advertised refill"""
+        limiter = RateLimiter()
+        limiter.update({
+            'x-ratelimit-limit-tokens': '6000',
+            'x-ratelimit-remaining-tokens': '0',
+            'x-ratelimit-reset-tokens': '1m0s',
+        })
+        
+        self.assertAlmostEqual(limiter.tokens.wait_time(1000), 10, delta=0.1)
+        with self.assertRaises(RateLimitTimeout):
+            limiter.acquire(1000, deadline=0)
+        self.assertEqual(parse_duration('2m59.5s'), 179.5)
+    
+    def test_stage_results_and_fallbacks_are_counted(self):
+        """Test metrics distinguish real results from fallbacks"""
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            cache.clear()
+            processor = GroqAIProcessor()
+            processor.client = fake_groq_client('[{"id": "a", "label": "A", "children": []}]')
+            processor.generate_topic_graph("Notes")
+            processor.client = fake_groq_client('not json')
+            processor.generate_quiz("Notes")
+        
+        self.assertEqual(metrics.get('groq_stage_results_total', stage='topic_graph', outcome='result'), 1)
+        self.assertEqual(metrics.get('groq_stage_results_total', stage='quiz', outcome='fallback'), 1)
+
+def long_document(paragraphs=40, edit=None):
+    """Generate a long multi-paragraph document, optionally editing one paragraph"""
+    texts = [
+        f"Paragraph {index} explains how stage {index} of the process converts energy. " * 12
+        for index in range(paragraphs)
+    ]
+    if edit is not None:
+        texts[edit] += "An extra sentence added in a later revision."
+    return '\n\n'.join(texts)
+
+class LongDocumentTestCase(TestCase):
+    
+    def test_chunks_follow_paragraph_boundaries(self):
+        """Test chunks stay within the size limit and never split a paragraph"""
+        chunks = FileHandler.split_into_chunks(long_document(), chunk_size=3000)
+        
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(all(len(chunk) <= 3000 for chunk in chunks))
+        self.assertTrue(all(chunk.startswith('Paragraph') for chunk in chunks))
+    
+    def test_editing_one_paragraph_keeps_other_chunks(self):
+        """Test an edit only changes the chunk around it, so other chunk results stay cached"""
+        before = FileHandler.split_into_chunks(long_document(), chunk_size=3000)
+        after = FileHandler.split_into_chunks(long_document(edit=20), chunk_size=3000)
+        
+        self.assertGreaterEqual(len(set(before) & set(after)), len(before) - 2)
+    
+    def test_clean_text_truncation_can_be_disabled(self):
+        """Test clean_text keeps long text when max_length is None"""
+        text = long_document()
+        self.assertTrue(FileHandler.clean_text(text).endswith('[truncated]'))
+        self.assertEqual(len(FileHandler.clean_text(text, max_length=None)), len(' '.join(text.split())))
+    
+    def test_reduce_merges_and_deduplicates(self):
+        """Test key points, tags and topic graphs are merged across chunks"""
+        analyses = [
+            {'key_points': ['Light is absorbed.'], 'tags': ['Biology', 'light'], 'difficulty': 'Hard', 'bloom_level': 'Apply'},
+            {'key_points': ['light is absorbed', 'Glucose is made.'], 'tags': ['biology'], 'difficulty': 'Hard', 'bloom_level': 'Remember'},
+        ]
+        merged = map_reduce.merge_analyses(analyses)
+        graph = map_reduce.merge_topic_graphs([
+            [{'id': 'photo', 'label': 'Photosynthesis', 'children': ['Light']}],
+            [{'id': 'photosynthesis', 'label': 'photosynthesis', 'children': ['Light', 'Calvin cycle']}],
+        ])
+        
+        self.assertEqual(merged['key_points'], ['Light is absorbed.', 'Glucose is made.'])
+        self.assertEqual(merged['tags'], ['Biology', 'light'])
+        self.assertEqual(merged['difficulty'], 'Hard')
+        self.assertEqual(merged['bloom_level'], 'Apply')
+        self.assertEqual(graph, [{'id': 'photo', 'label': 'Photosynthesis', 'children': ['Light', 'Calvin cycle']}])
+    
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        ANALYSIS_CHUNK_SIZE=3000
+    )
+    def test_reupload_only_reprocesses_changed_chunks(self):
+        """Test a slightly edited document only sends its changed chunks to the LLM"""
+        from .services import run_analysis
+        cache.clear()
+        processor = GroqAIProcessor()
+        processor.client = fake_groq_client(staged_reply)
+        
+        text = long_document()
+        run_analysis(processor, text, FileHandler.clean_text(text, max_length=None), mode='staged')
+        first_calls = processor.client.chat.completions.create.call_count
+        
+        edited = long_document(edit=20)
+        run_analysis(processor, edited, FileHandler.clean_text(edited, max_length=None), mode='staged')
+        second_calls = processor.client.chat.completions.create.call_count - first_calls
+        
+        self.assertGreater(first_calls, 3 * 5)
+        self.assertLessEqual(second_calls, 3 * 2 + 1)  # Up to two chunks' stages plus the summary merge
+
+    def test_failed_chunks_are_left_out_of_the_merge(self):
+        """Test fallback content of a failed chunk never reaches the merged result"""
+        processor = GroqAIProcessor()
+        processor.client = None
+        real = (
+            {'summary': 'Light is absorbed.', 'key_points': ['Chlorophyll absorbs light.'], 'tags': ['biology'],
+             'difficulty': 'Hard', 'bloom_level': 'Apply'},
+            [{'id': 'light', 'label': 'Light', 'children': []}],
+            [{'question': 'What absorbs light?', 'options': ['A', 'B', 'C', 'D'], 'correct_answer': 'A'}],
+        )
+        def run_analysis(chunk, mode=None):
+            if chunk == 'broken':
+                raise RuntimeError('boom')
+            if chunk == 'fallback':
+                return processor._fallback_analysis(), processor._fallback_graph(), processor._fallback_quiz()
+            return real
+        processor.run_analysis = run_analysis
+        
+        analysis, topic_graph, quiz = processor.run_chunked_analysis(['good', 'broken', 'fallback'])
+        
+        self.assertEqual(analysis['summary'], 'Light is absorbed.')
+        self.assertEqual(analysis['tags'], ['biology'])
+        self.assertEqual(analysis['key_points'], ['Chlorophyll absorbs light.'])
+        self.assertEqual(topic_graph, real[1])
+        self.assertEqual(quiz, real[2])
+        
+        self.assertEqual(
+            processor.run_chunked_analysis(['broken', 'fallback']),
+            (processor._fallback_analysis(), processor._fallback_graph(), processor._fallback_quiz())
+        )
+
+class PDFExtractionTestCase(TestCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .management.commands.benchmark_pdf_extraction import generate_pdf
+        cls.pdf = generate_pdf(6, lines_per_page=5)
+    
+    def test_pdf_is_read_from_memory_page_by_page(self):
+        """Test PDFs are extracted without touching storage, one string per page"""
+        with mock.patch('django.core.files.storage.default_storage.save', side_effect=AssertionError):
+            text = FileHandler.extract_text_from_file(SimpleUploadedFile('notes.pdf', self.pdf))
+        
+        self.assertEqual(len(text.split('\f')), 6)
+        self.assertEqual(len(list(FileHandler.iter_pdf_pages(self.pdf, 2, 4))), 2)
+    
+    @override_settings(PDF_MAX_CHARS=1)
+    def test_extraction_stops_once_enough_text_is_collected(self):
+        """Test extraction stops early instead of reading every page"""
+        text = FileHandler._extract_from_pdf(self.pdf)
+        self.assertEqual(len(text.split('\f')), 1)
+    
+    @override_settings(PDF_EXTRACTION_PROCESSES=2, PDF_PARALLEL_MIN_PAGES=1, PDF_PAGES_PER_TASK=2)
+    def test_parallel_extraction_matches_serial(self):
+        """Test the process pool returns the same pages in the same order"""
+        parallel = FileHandler._extract_from_pdf(self.pdf)
+        with override_settings(PDF_EXTRACTION_PROCESSES=1):
+            serial = FileHandler._extract_from_pdf(self.pdf)
+        self.assertEqual(parallel, serial)
+
+
+class InMemoryUploadTestCase(TestCase):
+    
+    def test_large_txt_upload_is_read_from_django_temp_file(self):
+        """Test large text uploads are read in place instead of copied to storage"""
+        upload = TemporaryUploadedFile('notes.txt', 'text/plain', 0, 'utf-8')
+        upload.write('Café notes'.encode('utf-8'))
+        upload.flush()
+        with mock.patch('django.core.files.storage.default_storage.save', side_effect=AssertionError):
+            text = FileHandler.extract_text_from_file(upload)
+        upload.close()
+        self.assertEqual(text, 'Café notes')
+    
+    def test_image_is_optimized_and_sent_from_memory(self):
+        """Test image OCR sends in-memory bytes without writing any file"""
+        from PIL import Image
+        from io import BytesIO
+        buffer = BytesIO()
+        Image.new('L', (100, 50), color=255).save(buffer, 'PNG')
+        upload = SimpleUploadedFile('notes.png', buffer.getvalue(), content_type='image/png')
+        
+        response = mock.Mock()
+        response.json.return_value = {'ParsedResults': [{'ParsedText': 'Hello   world'}]}
+        with mock.patch('django.core.files.storage.default_storage.save', side_effect=AssertionError), \
+             mock.patch('analyzer.utils.standin.requests.post', return_value=response) as post:
+            text = FreeOCRExtractor([OCRSpaceProvider('ocr_space_free')]).extract_text_from_image(upload)
+        
+        filename, data, mime_type = post.call_args.kwargs['files']['file']
+        self.assertEqual((filename, mime_type), ('image.png', 'image/png'))
+        self.assertEqual(Image.open(BytesIO(data)).size, (600, 300))
+        self.assertIn('Hello', text)
+
+class FunctionProvider(OCRProvider):
+    """OCR provider backed by a plain function, named after it"""
+    
+    def __init__(self, function, **kwargs):
+        super().__init__(function.__name__, **kwargs)
+        self.function = function
+    
+    def extract(self, image_data):
+        return self.function(image_data)
+
+class OCRProviderRaceTestCase(TestCase):
+    
+    def make_extractor(self, *functions):
+        return FreeOCRExtractor([FunctionProvider(function) for function in functions])
+    
+    @override_settings(OCR_HEDGE_DELAY=0.05)
+    def test_slow_primary_is_hedged_by_next_provider(self):
+        """Test a hanging primary does not delay the answer beyond the hedge delay"""
+        release = threading.Event()
+        def primary(image_data):
+            release.wait(5)
+            return 'late text'
+        def secondary(image_data):
+            return 'hedged text'
+        
+        started = time.monotonic()
+        text = self.make_extractor(primary, secondary)._race_providers(PreparedImage({'PNG': b'image'}))
+        release.set()
+        
+        self.assertEqual(text, 'hedged text')
+        self.assertLess(time.monotonic() - started, 1)
+    
+    @override_settings(OCR_HEDGE_DELAY=10, OCR_BREAKER_MIN_CALLS=2, OCR_BREAKER_COOLDOWN=60)
+    def test_failing_provider_opens_its_circuit(self):
+        """Test failures launch the next provider at once and a dead provider gets skipped"""
+        calls = []
+        def broken(image_data):
+            calls.append('broken')
+            raise requests.ConnectionError('down')
+        def backup(image_data):
+            return 'backup text'
+        extractor = self.make_extractor(broken, backup)
+        
+        for _ in range(3):
+            self.assertEqual(extractor._race_providers(PreparedImage({'PNG': b'image'})), 'backup text')
+        
+        self.assertEqual(calls, ['broken', 'broken'])
+        status_report = extractor.get_ocr_status()
+        self.assertEqual(status_report['providers']['broken']['state'], 'open')
+        self.assertEqual(status_report['providers']['broken']['error_rate'], 1.0)
+        self.assertTrue(status_report['available'])
+        self.assertEqual(status_report['primary'], 'backup')
+    
+    @override_settings(OCR_BREAKER_MIN_CALLS=1, OCR_BREAKER_COOLDOWN=0)
+    def test_open_circuit_allows_one_trial_call_after_cooldown(self):
+        """Test a recovered provider closes its circuit after a successful trial"""
+        breaker = CircuitBreaker('provider')
+        breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())  # Only one trial at a time
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    @override_settings(OCR_HEDGE_DELAY=0.01, OCR_BREAKER_MIN_CALLS=1, OCR_BREAKER_COOLDOWN=0)
+    def test_cancelled_trial_frees_the_trial_slot(self):
+        """Test a trial call still queued when another provider wins does not block later trials"""
+        def recovering(image_data):
+            return 'trial text'
+        def working(image_data):
+            return 'working text'
+        extractor = self.make_extractor(recovering, working)
+        breaker = extractor.breakers['recovering']
+        breaker.record(False, 0.1)
+        
+        class QueueingExecutor:
+            """Runs calls to the working provider at once and leaves the others queued"""
+            def submit(self, function, provider, image_data):
+                future = Future()
+                if provider.name == 'working':
+                    future.set_result(function(provider, image_data))
+                return future
+        
+        with mock.patch('analyzer.utils.cloud_ocr.get_ocr_executor', return_value=QueueingExecutor()):
+            text = extractor._race_providers(PreparedImage({'PNG': b'image'}))
+        self.assertEqual(text, 'working text')
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(breaker.allow_request(), CircuitBreaker.TRIAL)
+
+class OCRProviderRegistryTestCase(TestCase):
+    
+    PROVIDERS = [
+        {'NAME': 'remote', 'BACKEND': 'analyzer.utils.ocr_providers.OCRSpaceProvider', 'PRIORITY': 10, 'COST': 1},
+        {'NAME': 'disabled', 'BACKEND': 'analyzer.utils.ocr_providers.APINinjasProvider', 'ENABLED': False},
+        {'NAME': 'local', 'BACKEND': 'analyzer.utils.ocr_providers.TesseractProvider', 'PRIORITY': 0, 'HEDGE_DELAY': 8},
+        {'NAME': 'cheap', 'BACKEND': 'analyzer.utils.ocr_providers.FreeOCRWebProvider', 'PRIORITY': 10, 'COST': 0},
+    ]
+    
+    def test_local_engine_goes_first_when_installed(self):
+        """Test providers are built from settings and ordered by priority, then cost"""
+        with mock.patch('analyzer.utils.ocr_providers.shutil.which', return_value='/usr/bin/tesseract'):
+            providers = load_providers(self.PROVIDERS)
+        
+        self.assertEqual([provider.name for provider in providers], ['local', 'cheap', 'remote'])
+        self.assertFalse(providers[0].remote)
+        self.assertEqual(providers[0].hedge_delay, 8)
+    
+    def test_missing_local_engine_is_skipped(self):
+        """Test remote services are used when no OCR binary is installed"""
+        with mock.patch('analyzer.utils.ocr_providers.shutil.which', return_value=None):
+            providers = load_providers(self.PROVIDERS)
+        
+        self.assertEqual([provider.name for provider in providers], ['cheap', 'remote'])
+        status_report = FreeOCRExtractor(providers).get_ocr_status()
+        self.assertEqual(status_report['primary'], 'cheap')
+        self.assertTrue(status_report['providers']['remote']['remote'])
+    
+    def test_local_engine_runs_binary_in_process_pool(self):
+        """Test the local provider pipes image bytes through the OCR binary"""
+        import os
+        import tempfile
+        from .utils.ocr_providers import TesseractProvider
+        with tempfile.TemporaryDirectory() as directory:
+            command = os.path.join(directory, 'fake-tesseract')
+            with open(command, 'w') as script:
+                script.write('#!/bin/sh\ncat > /dev/null\necho "local $4 text"\n')
+            os.chmod(command, 0o755)
+            
+            provider = TesseractProvider('local', command=command, language='deu')
+            self.assertTrue(provider.is_available())
+            self.assertEqual(provider.extract(b'image').strip(), 'local deu text')
+
+
+def photo_of_page(width, height, margin=0.2):
+    """Encode an RGB 'photo' of a grey page with dark text lines inside a margin"""
+    from io import BytesIO
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', (width, height), (235, 235, 230))
+    draw = ImageDraw.Draw(image)
+    for y in range(int(height * margin), int(height * (1 - margin)), max(height // 40, 4)):
+        draw.rectangle((int(width * margin), y, int(width * (1 - margin)), y + max(height // 120, 1)), fill=(20, 20, 30))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
+
+class ImagePreprocessingTestCase(TestCase):
+    
+    @override_settings(OCR_MAX_PIXELS=1_000_000)
+    def test_large_photo_is_shrunk_to_pixel_budget_and_cropped(self):
+        """Test a big colour photo becomes a small grayscale image without its margins"""
+        photo = photo_of_page(4000, 3000)
+        prepared = preprocess_image(photo)
+        
+        width, height = prepared.size
+        self.assertLessEqual(width * height, 1_000_000 * 0.7)  # Margins cropped after downsampling
+        self.assertLess(len(prepared.for_provider(OCRSpaceProvider('ocr'))), len(photo) // 4)
+        self.assertEqual(set(prepared.encodings), {'PNG', 'JPEG'})
+    
+    @override_settings(OCR_BINARIZE=True)
+    def test_binarized_image_is_sent_as_png(self):
+        """Test black and white output picks the smaller lossless encoding"""
+        from io import BytesIO
+        from PIL import Image
+        prepared = preprocess_image(photo_of_page(1200, 900))
+        data = prepared.for_provider(OCRSpaceProvider('ocr'))
+        
+        self.assertEqual(data, prepared.encodings['PNG'])
+        self.assertEqual(Image.open(BytesIO(data)).mode, '1')
+    
+    @override_settings(OCR_MAX_INPUT_PIXELS=1_000_000)
+    def test_decompression_bomb_is_rejected(self):
+        """Test oversized images are refused from their header, before decoding"""
+        upload = SimpleUploadedFile('bomb.jpg', photo_of_page(2000, 1000))
+        with self.assertRaisesMessage(ValueError, 'Image is too large to process'):
+            FreeOCRExtractor([OCRSpaceProvider('ocr')]).extract_text_from_image(upload)
+    
+    def test_provider_upload_limit_is_respected(self):
+        """Test providers are skipped when the image exceeds their upload limit"""
+        def small_uploads_only(image_data):
+            return 'text'
+        def any_size(image_data):
+            return 'other text'
+        limited = FunctionProvider(small_uploads_only)
+        limited.max_bytes = 4
+        extractor = FreeOCRExtractor([limited, FunctionProvider(any_size)])
+        report = {'bytes_sent': 0, 'provider': None}
+        
+        text = extractor._race_providers(PreparedImage({'PNG': b'image', 'JPEG': b'jpeg-image'}), report)
+        
+        self.assertEqual(text, 'other text')
+        self.assertEqual(report, {'bytes_sent': 5, 'provider': 'any_size'})
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OCRCacheTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+        def provider(image_data):
+            self.calls.append(image_data)
+            return f'Slide text {len(self.calls)}'
+        self.extractor = FreeOCRExtractor([FunctionProvider(provider)])
+    
+    def upload(self, data):
+        return SimpleUploadedFile('slide.jpg', data, content_type='image/jpeg')
+    
+    def resized_copy(self, data, size):
+        from io import BytesIO
+        from PIL import Image
+        buffer = BytesIO()
+        Image.open(BytesIO(data)).resize(size).save(buffer, 'PNG')
+        return buffer.getvalue()
+    
+    def test_same_bytes_skip_ocr(self):
+        """Test an identical upload is answered from the cache"""
+        photo = photo_of_page(800, 600)
+        first = self.extractor.extract_text_from_image(self.upload(photo))
+        second = self.extractor.extract_text_from_image(self.upload(photo))
+        
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 1)
+    
+    @override_settings(OCR_CACHE_PERCEPTUAL=True)
+    def test_resized_copy_matches_perceptual_hash(self):
+        """Test a re-encoded, resized copy hits the cache while a different page does not"""
+        photo = photo_of_page(800, 600)
+        self.extractor.extract_text_from_image(self.upload(photo))
+        copy = self.extractor.extract_text_from_image(self.upload(self.resized_copy(photo, (640, 480))))
+        self.assertEqual(copy, 'Slide text 1')
+        self.assertEqual(len(self.calls), 1)
+        
+        other = self.extractor.extract_text_from_image(self.upload(photo_of_page(800, 600, margin=0.35)))
+        self.assertEqual(other, 'Slide text 2')
+    
+    def test_perceptual_hash_is_off_by_default(self):
+        """Test only exact bytes match unless perceptual matching is enabled"""
+        photo = photo_of_page(800, 600)
+        self.extractor.extract_text_from_image(self.upload(photo))
+        self.extractor.extract_text_from_image(self.upload(self.resized_copy(photo, (640, 480))))
+        self.assertEqual(len(self.calls), 2)
+
+class HotPathBenchmarkTestCase(TestCase):
+    
+    def test_baseline_round_trip(self):
+        """Test the benchmark saves a baseline and reports changes against it"""
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            call_command('benchmark_hot_paths', filter='clean_text/10k', repeat=1, save=path, stdout=StringIO())
+            out = StringIO()
+            call_command('benchmark_hot_paths', filter='clean_text/10k', repeat=1, compare=path, json=True, stdout=out)
+        
+        row = json.loads(out.getvalue())['clean_text/10k']
+        self.assertIn('change_pct', row)
+        self.assertGreater(row['peak_kb'], 0)
+
+NO_LATENCY = {
+    'groq': {'LATENCY': 'none', 'SCALE': 1, 'MEDIAN_MS': 0, 'SIGMA': 0.5, 'ERROR_RATE': 0, 'TIMEOUT_RATE': 0},
+    'ocr': {'LATENCY': 'none', 'SCALE': 1, 'MEDIAN_MS': 0, 'SIGMA': 0.5, 'ERROR_RATE': 0, 'TIMEOUT_RATE': 0},
+}
+
+@override_settings(
+    EXTERNAL_SERVICES='replay', STANDIN=NO_LATENCY,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class StandInTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        standin.reset()
+        self.processor = GroqAIProcessor()
+        self.processor.client = ResilientGroqClient(standin.ReplayGroqClient())
+    
+    def test_replay_serves_recorded_completions_for_new_notes(self):
+        """Test every stage is answered from recordings matched by prompt template"""
+        with mock.patch('analyzer.utils.standin.requests.post', side_effect=AssertionError):
+            analysis, topic_graph, quiz = self.processor.run_analysis('Mitochondria make ATP.', mode='staged')
+        
+        self.assertIn('Photosynthesis', analysis['summary'])
+        self.assertEqual(topic_graph[0]['id'], 'photosynthesis')
+        self.assertEqual(len(quiz), 4)
+        self.assertEqual(self.processor.usage['requests'], 3)
+        self.assertGreater(self.processor.usage['total_tokens'], 0)
+    
+    def test_replay_streams_summary(self):
+        """Test streamed completions are replayed chunk by chunk"""
+        events = list(self.processor.stream_analyze_note('Mitochondria make ATP.'))
+        deltas = ''.join(data for event, data in events if event == 'summary_delta')
+        self.assertGreater(len([event for event, _ in events if event == 'summary_delta']), 1)
+        self.assertEqual(deltas, events[-1][1]['summary'])
+    
+    def test_injected_failures_are_reproducible(self):
+        """Test the same seed fails the same requests, independent of call order"""
+        config = {**NO_LATENCY, 'groq': {**NO_LATENCY['groq'], 'ERROR_RATE': 0.3, 'TIMEOUT_RATE': 0.1}}
+        with override_settings(STANDIN=config):
+            def outcomes(keys):
+                standin.reset()
+                simulation = standin.get_simulation('groq')
+                return {key: simulation.outcome(simulation.random_for(key)) for key in keys}
+            keys = [f'request-{number}' for number in range(200)]
+            first, second = outcomes(keys), outcomes(list(reversed(keys)))
+        
+        self.assertEqual(first, second)
+        failures = Counter(first.values())
+        self.assertTrue(40 < failures['error'] < 80 and 5 < failures['timeout'] < 40)
+    
+    @override_settings(GROQ_MAX_RETRIES=6)
+    def test_injected_errors_go_through_client_retries(self):
+        """Test simulated 429 and 503 responses are retried like real ones"""
+        metrics.reset()
+        config = {**NO_LATENCY, 'groq': {**NO_LATENCY['groq'], 'ERROR_RATE': 0.3}}
+        with override_settings(STANDIN=config, GROQ_BACKOFF_BASE=0), mock.patch('analyzer.utils.groq_client.time.sleep'):
+            results = [self.processor.generate_quiz(f'Note {number}') for number in range(10)]
+        
+        self.assertTrue(all(len(quiz) == 4 for quiz in results))
+        self.assertGreater(metrics.get('groq_retries_total', reason='429') + metrics.get('groq_retries_total', reason='503'), 0)
+    
+    def test_replayed_results_are_not_served_live(self):
+        """Test canned replay responses are cached apart from real results"""
+        replayed = self.processor.generate_quiz('Mitochondria make ATP.')
+        ocr_keys = FreeOCRExtractor._cache_keys(b'image')
+        
+        live_quiz = [{'question': 'Where is ATP made?', 'options': ['A', 'B', 'C', 'D'], 'correct_answer': 'A'}]
+        with override_settings(EXTERNAL_SERVICES='live'):
+            processor = GroqAIProcessor()
+            processor.client = fake_groq_client(json.dumps(live_quiz))
+            self.assertEqual(processor.generate_quiz('Mitochondria make ATP.'), live_quiz)
+            live_keys = FreeOCRExtractor._cache_keys(b'image')
+        
+        self.assertNotEqual(replayed, live_quiz)
+        self.assertEqual(processor.client.chat.completions.create.call_count, 1)
+        self.assertEqual([key.replace('replay:', '', 1) for key in ocr_keys], live_keys)
+        self.assertTrue(all(key.startswith('replay:') for key in ocr_keys))
+    
+    @override_settings(GROQ_API_KEY='')
+    def test_benchmark_runs_on_replay_without_api_key(self):
+        """Test benchmark_analysis needs no API key when replaying recordings"""
+        out = StringIO()
+        call_command('benchmark_analysis', runs=1, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['staged']['requests'], 3)
+        self.assertGreater(report['combined']['total_tokens'], 0)
+    
+    def test_ocr_replay_and_record(self):
+        """Test OCR requests are replayed offline and recorded when live"""
+        import tempfile
+        text = FreeOCRExtractor([OCRSpaceProvider('ocr_space_free')])._race_providers(PreparedImage({'PNG': b'image'}))
+        self.assertIn('Calvin cycle', text)
+        
+        response = mock.Mock(status_code=200, text='live text', headers={'Content-Type': 'text/plain'})
+        with tempfile.TemporaryDirectory() as directory, \
+             override_settings(EXTERNAL_SERVICES='record', STANDIN_RECORDINGS_DIR=directory), \
+             mock.patch('analyzer.utils.standin.requests.post', return_value=response):
+            standin.reset()
+            standin.http_post('https://example.com/ocr', files={'file': ('a.png', b'image', 'image/png')}, timeout=5)
+            with open(f'{directory}/ocr.jsonl') as f:
+                entry = json.loads(f.readline())
+        self.assertEqual((entry['url'], entry['body']), ('https://example.com/ocr', 'live text'))
+
+@override_settings(
+    EXTERNAL_SERVICES='replay', STANDIN=NO_LATENCY,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+class LoadTestCommandTestCase(LiveServerTestCase):
+    
+    def test_report_has_percentiles_per_endpoint(self):
+        """Test a short run against a live server reports every endpoint in the mix"""
+        standin.reset()
+        out = StringIO()
+        call_command(
+            'loadtest', url=self.live_server_url, rate=20, duration=1, mix='analyze_text=1,compare=1,history=1',
+            sessions=3, json=True, stdout=out
+        )
+        report = json.loads(out.getvalue())
+        
+        self.assertEqual(set(report['endpoints']), {'analyze_text', 'compare', 'history'})
+        overall = report['overall']
+        self.assertGreater(overall['requests'], 5)
+        self.assertEqual(overall['error_rate'], 0)
+        self.assertEqual(overall['fallback_rate'], 0)
+        self.assertLessEqual(overall['p50_ms'], overall['p95_ms'])
+        self.assertLessEqual(overall['p95_ms'], overall['p99_ms'])
+    
+    def test_percentile_uses_nearest_rank(self):
+        """Test percentiles of a known distribution"""
+        from .management.commands.loadtest import percentile
+        values = list(range(1, 101))
+        self.assertEqual((percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)), (50, 95, 99))
+        self.assertIsNone(percentile([], 0.5))
+
+class MetricsTestCase(APITestCase):
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='secret')
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+    
+    def test_histogram_buckets(self):
+        """Test observations land in the first bucket they fit and are summed"""
+        metrics.observe('stage_seconds', 0.003, stage='json_parse')
+        metrics.observe('stage_seconds', 0.2, stage='json_parse')
+        metrics.observe('stage_seconds', 500, stage='json_parse')
+        
+        histogram = metrics.get_histogram('stage_seconds', stage='json_parse')
+        self.assertEqual(histogram['count'], 3)
+        self.assertEqual(histogram['counts'][0], 1)
+        self.assertEqual(histogram['counts'][metrics.DEFAULT_BUCKETS.index(0.25)], 1)
+        self.assertEqual(sum(histogram['counts']), 2)  # 500 s only counts towards +Inf
+        self.assertAlmostEqual(histogram['sum'], 500.203)
+    
+    def test_render_adds_up_every_worker(self):
+        """Test a scrape sums this process with the files written by other workers"""
+        metrics.increment('groq_stage_results_total', 2, stage='quiz', outcome='result')
+        metrics.observe('stage_seconds', 0.02, stage='save_analysis')
+        other_worker = {
+            'counters': [['groq_stage_results_total', [['outcome', 'result'], ['stage', 'quiz']], 3]],
+            'histograms': [['stage_seconds', [['stage', 'save_analysis']], {
+                'buckets': list(metrics.DEFAULT_BUCKETS),
+                'counts': [1] + [0] * (len(metrics.DEFAULT_BUCKETS) - 1),
+                'sum': 0.001, 'count': 1,
+            }]],
+        }
+        with open(os.path.join(self.directory, 'metrics-999999.json'), 'w') as f:
+            json.dump(other_worker, f)
+        
+        text = metrics.render()
+        
+        self.assertIn('# TYPE groq_stage_results_total counter', text)
+        self.assertIn('groq_stage_results_total{outcome="result",stage="quiz"} 5', text)
+        self.assertIn('stage_seconds_bucket{stage="save_analysis",le="0.005"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="save_analysis",le="0.025"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="save_analysis",le="+Inf"} 2', text)
+        self.assertIn('stage_seconds_count{stage="save_analysis"} 2', text)
+    
+    def test_endpoint_reports_request_latency_and_stage_timings(self):
+        """Test /api/metrics/ serves the Prometheus format after an analysis"""
+        with mock.patch('analyzer.services.GroqAIProcessor') as processor_class:
+            processor = processor_class.return_value
+            processor.run_analysis.return_value = (
+                {'summary': 'S', 'key_points': [], 'difficulty': 'Easy', 'bloom_level': 'Remember', 'tags': []}, [], []
+            )
+            self.client.post(reverse('analyze-text'), {'text': 'Photosynthesis makes glucose.'}, format='json')
+        
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('http_request_seconds_count{method="POST",status="200",view="analyze-text"} 1', text)
+        self.assertIn('stage_seconds_count{stage="save_analysis"} 1', text)
+    
+    def test_endpoint_requires_token_when_configured(self):
+        """Test scrapes are refused without the configured bearer token"""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_endpoint_needs_a_token_outside_debug(self):
+        """Test metrics are not public in production when no token is configured"""
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN='', DEBUG=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_200_OK)
+    
+    @unittest.skipIf(metrics.fcntl is None, 'Files of exited processes are only merged where fcntl exists')
+    def test_exited_workers_are_merged_into_the_retired_total(self):
+        """Test a dead worker's file is folded into retired.json and its counts are kept"""
+        dead_worker = {'counters': [['jobs_total', [['outcome', 'done']], 4]], 'histograms': []}
+        for name in ('metrics-999999-aaaa.json', 'metrics-999998-bbbb.json'):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                json.dump(dead_worker, f)
+        metrics.increment('jobs_total', outcome='done')
+        
+        with mock.patch('analyzer.utils.metrics._is_running', side_effect=lambda pid: pid == os.getpid()):
+            first = metrics.collect()[0]
+            second = metrics.collect()[0]
+        
+        key = ('jobs_total', (('outcome', 'done'),))
+        self.assertEqual(first[key], 9)
+        self.assertEqual(second[key], 9)
+        remaining = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        self.assertEqual(len(remaining), 2)
+        self.assertIn('retired.json', remaining)
+        self.assertTrue(remaining[0].startswith(f'metrics-{os.getpid()}-'))
+    
+    def test_groq_errors_and_tokens_are_counted(self):
+        """Test failed completions are counted by type and token usage by stage"""
+        processor = GroqAIProcessor()
+        processor.use_cache = False
+        processor.client = mock.MagicMock()
+        processor.client.chat.completions.create.side_effect = [
+            RuntimeError('boom'),
+            mock.MagicMock(
+                choices=[mock.MagicMock(message=mock.MagicMock(content='[{"id": "a", "label": "A", "children": []}]'))],
+                usage=mock.MagicMock(prompt_tokens=120, completion_tokens=30, total_tokens=150)
+            ),
+        ]
+        
+        processor.generate_quiz('text')
+        processor.generate_topic_graph('text')
+        
+        self.assertEqual(metrics.get('groq_errors_total', stage='quiz', error='RuntimeError'), 1)
+        self.assertEqual(metrics.get('groq_tokens_total', stage='topic_graph', type='prompt'), 120)
+        self.assertEqual(metrics.get('groq_tokens_total', stage='topic_graph', type='completion'), 30)
+        self.assertEqual(metrics.get_histogram('groq_request_seconds', stage='topic_graph')['count'], 1)
+
+class ProfilingTestCase(APITestCase):
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(
+            PROFILING_DIR=directory.name, PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATE=0, SLOW_REQUEST_SECONDS=60
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+    
+    @override_settings(PROFILING_MODE='cprofile')
+    def test_flagged_request_saves_downloadable_profile(self):
+        """Test the X-Profile header saves a profile with SQL counts that admins can download"""
+        response = self.client.get(reverse('analysis-history'), HTTP_X_PROFILE='secret')
+        profile_id = response['X-Profile-Id']
+        
+        listing = self.client.get(reverse('profile-list'), HTTP_X_PROFILE='secret').data['profiles']
+        self.assertEqual([record['id'] for record in listing], [profile_id])
+        self.assertEqual(listing[0]['trigger'], 'header')
+        self.assertGreater(listing[0]['queries']['count'], 0)
+        self.assertTrue(listing[0]['top'])
+        
+        download = self.client.get(reverse('profile-download', args=[profile_id]), HTTP_X_PROFILE='secret')
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        stats = marshal.loads(b''.join(download.streaming_content))
+        self.assertTrue(any(function == 'get' for (_, _, function) in stats))
+    
+    @override_settings(PROFILING_MODE='cprofile')
+    def test_request_is_served_when_profiler_is_busy(self):
+        """Test a flagged request while another is being profiled is served without a profile"""
+        busy = profiling.DeterministicProfiler()
+        busy.start()
+        try:
+            response = self.client.get(reverse('analysis-history'), HTTP_X_PROFILE='secret')
+        finally:
+            busy.stop()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.list_artifacts(), [])
+    
+    def test_sampler_only_records_the_request_thread(self):
+        """Test stacks of other threads do not leak into a request's sampled profile"""
+        release = threading.Event()
+        def unrelated_request():
+            release.wait(5)
+        other = threading.Thread(target=unrelated_request)
+        other.start()
+        sampler = profiling.StackSampler(0.001)
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+        release.set()
+        other.join()
+        self.assertTrue(sampler.stacks)
+        self.assertFalse(any('unrelated_request' in stack for stack in sampler.stacks))
+    
+    def test_header_without_token_is_ignored(self):
+        """Test anonymous users cannot trigger profiling or list profiles"""
+        response = self.client.get(reverse('analysis-history'), HTTP_X_PROFILE='guess')
+        
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.client.get(reverse('profile-list')).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(profiling.list_artifacts(), [])
+    
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_stage_breakdown(self):
+        """Test a request over the threshold logs its stages and query counts as JSON"""
+        with mock.patch('analyzer.services.GroqAIProcessor') as processor_class, \
+                mock.patch('analyzer.middleware.print', create=True) as log:
+            processor_class.return_value.run_analysis.return_value = (
+                {'summary': 'S', 'key_points': [], 'difficulty': 'Easy', 'bloom_level': 'Remember', 'tags': []}, [], []
+            )
+            self.client.post(reverse('analyze-text'), {'text': 'Photosynthesis makes glucose.'}, format='json')
+        
+        entry = json.loads(log.call_args.args[0].split('Slow request: ', 1)[1])
+        self.assertEqual(entry['path'], reverse('analyze-text'))
+        self.assertEqual(entry['stages']['save_analysis']['calls'], 1)
+        self.assertGreater(entry['queries']['count'], 0)
+    
+    def test_breakdown_includes_stages_run_on_pool_threads(self):
+        """Test LLM stages run concurrently still count towards the request's breakdown"""
+        processor = GroqAIProcessor()
+        processor.use_cache = False
+        processor.client = fake_groq_client('{"summary": "S"}')
+        
+        with metrics.breakdown() as stages:
+            processor.run_analysis('Photosynthesis makes glucose.', mode='staged')
+        
+        breakdown = stages.as_dict()
+        for stage in ('analysis', 'topic_graph', 'quiz'):
+            self.assertEqual(breakdown[f'groq_request:{stage}']['calls'], 1)
+
+class HistoryPaginationTestCase(APITestCase):
+    
+    def setUp(self):
+        self.client.get(reverse('analysis-history'))
+        self.session_key = self.client.session.session_key
+        for number in range(25):
+            NoteAnalysis.objects.create(
+                session_key=self.session_key, original_text='Full note ' * 100, summary=f'Summary {number} ' * 50,
+                key_points=['Point'], difficulty='Easy', bloom_level='Remember', topic_graph=[], quiz_questions=[],
+                tags=['biology']
+            )
+        # Ties on created_at must still page without gaps or repeats
+        NoteAnalysis.objects.filter(session_key=self.session_key).update(created_at=timezone.now())
+    
+    def test_cursor_pages_cover_history_once(self):
+        """Test following next_cursor returns every analysis exactly once, newest first"""
+        seen, cursor, pages = [], None, 0
+        while True:
+            params = {'limit': 10, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(reverse('analysis-history'), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [entry['id'] for entry in response.data['analyses']]
+            pages += 1
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+        
+        expected = list(NoteAnalysis.objects.filter(session_key=self.session_key).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 3)
+    
+    def test_list_is_compact_and_skips_heavy_columns(self):
+        """Test list entries carry a summary preview and the query never reads the note text"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('analysis-history'))
+        
+        entry = response.data['analyses'][0]
+        self.assertEqual(set(entry), {'id', 'summary_preview', 'difficulty', 'bloom_level', 'tags', 'created_at'})
+        self.assertEqual(len(entry['summary_preview']), settings.HISTORY_SUMMARY_PREVIEW_CHARS)
+        history_sql = [query['sql'] for query in queries if 'analyzer_noteanalysis' in query['sql']]
+        self.assertEqual(len(history_sql), 1)
+        self.assertNotIn('original_text', history_sql[0])
+        self.assertNotIn('COUNT(', history_sql[0])
+    
+    def test_field_selection(self):
+        """Test ?fields= narrows list and detail responses and rejects unknown fields"""
+        response = self.client.get(reverse('analysis-history'), {'fields': 'id,tags'})
+        self.assertEqual(set(response.data['analyses'][0]), {'id', 'tags'})
+        
+        analysis_id = response.data['analyses'][0]['id']
+        detail = self.client.get(reverse('analysis-detail', args=[analysis_id]), {'fields': 'summary,quiz_questions'})
+        self.assertEqual(set(detail.data), {'summary', 'quiz_questions'})
+        
+        self.assertEqual(self.client.get(reverse('analysis-history'), {'fields': 'original_text'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('analysis-history'), {'cursor': 'not-a-cursor'}).status_code, 400)
+    
+    def test_detail_is_session_isolated(self):
+        """Test the detail endpoint returns the full analysis only to its own session"""
+        analysis = NoteAnalysis.objects.filter(session_key=self.session_key).first()
+        
+        response = self.client.get(reverse('analysis-detail', args=[analysis.id]))
+        self.assertEqual(response.data['original_text'], analysis.original_text)
+        
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(reverse('analysis-detail', args=[analysis.id])).status_code, 404)
+
+class QueryPlanTestCase(TestCase):
+    
+    def test_seeded_history_queries_use_indexes(self):
+        """Test the history, next page and detail queries are index range scans on a seeded table"""
+        call_command('seed_history', analyses=3000, sessions=20, text_chars=200, batch_size=1000, stdout=StringIO())
+        self.assertEqual(NoteAnalysis.objects.count(), 3000)
+        self.assertEqual(NoteComparison.objects.count(), 300)
+        
+        out = StringIO()
+        call_command('explain_queries', fail_on_scan=True, json=True, stdout=out)
+        report = json.loads(out.getvalue())['queries']
+        
+        self.assertIn('history_next_page', report)
+        self.assertTrue(all(not row['problems'] for row in report.values()))
+    
+    def test_full_scans_are_flagged(self):
+        """Test plans that scan a table or sort in memory are reported"""
+        from .management.commands.explain_queries import plan_problems
+        self.assertEqual(plan_problems('2 0 0 SCAN analyzer_noteanalysis', 'sqlite'), ['2 0 0 SCAN analyzer_noteanalysis'])
+        self.assertEqual(plan_problems('SEARCH analyzer_noteanalysis USING INDEX x (session_key=?)', 'sqlite'), [])
+        self.assertEqual(len(plan_problems('Sort\n  ->  Seq Scan on analyzer_noteanalysis', 'postgresql')), 2)
+
+
+class CompressedStorageTestCase(APITestCase):
+    
+    def test_large_columns_are_stored_compressed(self):
+        """Test note text and analysis JSON are compressed in the database and read back unchanged"""
+        text = 'Photosynthesis converts light energy into chemical energy. ' * 50
+        analysis = NoteAnalysis.objects.create(
+            original_text=text, summary='Summary', key_points=['Point 1', 'Point 2'], difficulty='Easy',
+            bloom_level='Remember', topic_graph=[{'id': 't1', 'label': 'Light', 'children': []}],
+            quiz_questions=[], tags=['biology']
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT original_text, key_points FROM analyzer_noteanalysis WHERE id = %s', [analysis.id])
+            stored_text, stored_points = cursor.fetchone()
+        self.assertEqual(bytes(stored_text)[0], settings.COMPRESSION_DICTIONARY)
+        self.assertLess(len(stored_text), len(text) // 10)
+        self.assertEqual(compression.decompress(stored_points), b'["Point 1","Point 2"]')
+        
+        analysis = NoteAnalysis.objects.get(id=analysis.id)
+        self.assertEqual(analysis.original_text, text)
+        self.assertEqual(analysis.topic_graph[0]['label'], 'Light')
+        self.assertEqual(analysis.learning_objectives, [])
+        
+        data = serializers.NoteAnalysisSerializer(analysis).data
+        self.assertEqual(data['key_points'], ['Point 1', 'Point 2'])
+        self.assertEqual(data['original_text'], text)
+    
+    def test_values_from_any_dictionary_stay_readable(self):
+        """Test values written without a dictionary, with another one or uncompressed all decompress"""
+        data = 'The Calvin cycle fixes carbon dioxide into sugars. '.encode('utf-8') * 20
+        with tempfile.TemporaryDirectory() as directory, \
+             mock.patch.object(compression, 'DICTIONARY_DIR', Path(directory)):
+            compression.get_dictionary.cache_clear()
+            self.addCleanup(compression.get_dictionary.cache_clear)
+            compression.dictionary_path(1).write_bytes(b'The Calvin cycle fixes carbon dioxide')
+            for dictionary_id in (compression.NO_DICTIONARY, 1):
+                value = compression.compress(data, dictionary_id)
+                self.assertEqual(value[0], dictionary_id)
+                self.assertEqual(compression.decompress(value), data)
+        self.assertEqual(compression.compress(b'ab'), bytes([compression.RAW]) + b'ab')
+        self.assertEqual(compression.decompress(memoryview(bytes([compression.RAW]) + b'ab')), b'ab')
+        with self.assertRaises(ValueError):
+            compression.decompress(bytes([200]) + b'data')
+    
+    def test_trained_dictionary_shrinks_similar_notes(self):
+        """Test a dictionary trained on notes compresses an unseen note of the same kind better"""
+        sentences = [f'Topic {n} explains how energy flows through the ecosystem and why it matters. ' for n in range(40)]
+        dictionary = compression.train_dictionary(sentences[:30], size=4096)
+        self.assertLessEqual(len(dictionary), 4096)
+        note = ''.join(sentences[30:33]).encode('utf-8')
+        plain = zlib.compressobj(6, zlib.DEFLATED, -15)
+        primed = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=dictionary)
+        self.assertLess(len(primed.compress(note) + primed.flush()), len(plain.compress(note) + plain.flush()))
+
+
+class CompressionMigrationTestCase(TransactionTestCase):
+    
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('analyzer', target)])
+        return executor.loader.project_state([('analyzer', target)]).apps
+    
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('analyzer'))
+    
+    def test_existing_rows_are_converted_both_ways(self):
+        """Test the migrations compress existing rows in batches and can decompress them again"""
+        old_apps = self.migrate('0006_postgres_tuning')
+        OldAnalysis = old_apps.get_model('analyzer', 'NoteAnalysis')
+        OldComparison = old_apps.get_model('analyzer', 'NoteComparison')
+        for number in range(3):
+            OldAnalysis.objects.create(
+                original_text=f'Note {number} ' * 100, summary='Summary', key_points=[f'Point {number}'],
+                difficulty='Easy', bloom_level='Apply', topic_graph=[], quiz_questions=[{'question': 'Q?'}],
+                tags=['a'], prerequisites=['Algebra']
+            )
+        OldComparison.objects.create(note1_text='First note', note2_text='Second note', similarity_score=40.0,
+                                     comparison_summary='Different')
+        
+        compress_migration = importlib.import_module('analyzer.migrations.0008_compress_note_columns')
+        with mock.patch.object(compress_migration, 'BATCH_SIZE', 2):
+            self.migrate('0009_drop_uncompressed_columns')
+        analyses = list(NoteAnalysis.objects.order_by('id'))
+        self.assertEqual([analysis.key_points for analysis in analyses], [['Point 0'], ['Point 1'], ['Point 2']])
+        self.assertEqual(analyses[2].original_text, 'Note 2 ' * 100)
+        self.assertEqual(analyses[0].quiz_questions, [{'question': 'Q?'}])
+        self.assertEqual(analyses[0].prerequisites, ['Algebra'])
+        self.assertEqual(NoteComparison.objects.get().note2_text, 'Second note')
+        
+        old_apps = self.migrate('0006_postgres_tuning')
+        OldAnalysis = old_apps.get_model('analyzer', 'NoteAnalysis')
+        self.assertEqual(OldAnalysis.objects.order_by('id').last().original_text, 'Note 2 ' * 100)
+        self.assertEqual(OldAnalysis.objects.order_by('id').first().key_points, ['Point 0'])
+    
+    def test_tag_index_is_filled_for_existing_analyses(self):
+        """Test analyses saved before the tag index existed get their tag rows from the migration"""
+        old_apps = self.migrate('0011_analysis_tags')
+        OldAnalysis = old_apps.get_model('analyzer', 'NoteAnalysis')
+        for number in range(3):
+            OldAnalysis.objects.create(
+                session_key='old-session', original_text='Note', summary='Summary', key_points=[], difficulty='Easy',
+                bloom_level='Apply', topic_graph=[], quiz_questions=[], tags=['Biology', ' biology ', f'Topic {number}']
+            )
+        
+        tags_migration = importlib.import_module('analyzer.migrations.0012_backfill_analysis_tags')
+        with mock.patch.object(tags_migration, 'BATCH_SIZE', 2):
+            self.migrate('0012_backfill_analysis_tags')
+        self.assertEqual(AnalysisTag.objects.filter(name='biology').count(), 3)
+        self.assertEqual(AnalysisTag.objects.count(), 6)
+        self.assertEqual(set(AnalysisTag.objects.values_list('session_key', flat=True)), {'old-session'})
+
+    
+    def test_search_index_is_filled_for_existing_analyses(self):
+        """Test the search migration indexes old analyses without using the live search module"""
+        old_apps = self.migrate('0009_drop_uncompressed_columns')
+        OldAnalysis = old_apps.get_model('analyzer', 'NoteAnalysis')
+        for number in range(3):
+            OldAnalysis.objects.create(
+                session_key='old-session', original_text=f'Chloroplast note {number}', summary='Photosynthesis',
+                key_points=[], difficulty='Easy', bloom_level='Apply', topic_graph=[], quiz_questions=[], tags=[]
+            )
+        
+        search_migration = importlib.import_module('analyzer.migrations.0010_analysis_search_index')
+        with mock.patch.object(search_migration, 'BATCH_SIZE', 2), \
+             mock.patch('analyzer.search.create_index', side_effect=AssertionError), \
+             mock.patch('analyzer.search.index_documents', side_effect=AssertionError):
+            self.migrate('0010_analysis_search_index')
+        self.assertEqual(len(search.search('chloroplast', session_key='old-session')), 3)
+
+class SearchTestCase(APITestCase):
+    
+    def create(self, session_key, summary, tags=(), key_points=(), text='Plain note'):
+        return NoteAnalysis.objects.create(
+            session_key=session_key, original_text=text, summary=summary, key_points=list(key_points),
+            difficulty='Easy', bloom_level='Remember', topic_graph=[], quiz_questions=[], tags=list(tags)
+        )
+    
+    def setUp(self):
+        self.client.get(reverse('analysis-history'))
+        self.session_key = self.client.session.session_key
+        self.tagged = self.create(self.session_key, 'Notes on plants', tags=['photosynthesis'])
+        self.in_summary = self.create(self.session_key, 'Photosynthesis turns light into sugar in chloroplasts')
+        self.in_text = self.create(self.session_key, 'Cell biology', text='The chloroplast performs photosynthesis')
+        self.create(self.session_key, 'Mitosis and the cell cycle', key_points=['Prophase comes first'])
+        self.create('another-session', 'Photosynthesis in algae', tags=['photosynthesis'])
+    
+    def test_search_ranks_session_matches_across_columns(self):
+        """Test matches in tags, summary and note are found for this session only, tags ranked first"""
+        response = self.client.get(reverse('search'), {'q': 'photosynthesis'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [result['id'] for result in response.data['results']]
+        self.assertEqual(set(ids), {self.tagged.id, self.in_summary.id, self.in_text.id})
+        self.assertEqual(ids[0], self.tagged.id)
+        ranks = [result['rank'] for result in response.data['results']]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertIn('summary_preview', response.data['results'][0])
+    
+    def test_query_syntax_and_index_updates(self):
+        """Test stemming, phrases, exclusions and that edits and deletes reach the index"""
+        search_ids = lambda q: [result['id'] for result in self.client.get(reverse('search'), {'q': q}).data['results']]
+        self.assertEqual(len(search_ids('prophases')), 1)  # Key points, stemmed
+        self.assertEqual(search_ids('"light into sugar"'), [self.in_summary.id])
+        self.assertEqual(set(search_ids('photosynthesis -chloroplasts')), {self.tagged.id})
+        
+        self.in_summary.summary = 'Respiration releases energy'
+        self.in_summary.save()
+        self.assertEqual(search_ids('respiration'), [self.in_summary.id])
+        self.in_text.delete()
+        self.assertEqual(search_ids('chloroplast'), [])
+        
+        self.assertEqual(self.client.get(reverse('search')).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(search_ids('!!!'), [])
+    
+    def test_admin_search_uses_index(self):
+        """Test the admin changelist search finds analyses by note text across sessions"""
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:analyzer_noteanalysis_changelist'), {'q': 'photosynthesis'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+
+class TagIndexTestCase(APITestCase):
+    
+    def setUp(self):
+        self.client.get(reverse('analysis-history'))
+        self.session_key = self.client.session.session_key
+        rows = [
+            (['Thermodynamics', 'physics'], 'Medium', 'Apply'),
+            (['thermodynamics', 'Entropy '], 'Medium', 'Analyze'),
+            (['thermodynamics'], 'Hard', 'Apply'),
+            (['biology'], 'Medium', 'Apply'),
+        ]
+        self.analyses = [
+            NoteAnalysis.objects.create(
+                session_key=self.session_key, original_text='Note', summary='Summary', key_points=[],
+                difficulty=difficulty, bloom_level=bloom_level, topic_graph=[], quiz_questions=[], tags=tags
+            )
+            for tags, difficulty, bloom_level in rows
+        ]
+        NoteAnalysis.objects.create(
+            session_key='another-session', original_text='Note', summary='Summary', key_points=[], difficulty='Medium',
+            bloom_level='Apply', topic_graph=[], quiz_questions=[], tags=['thermodynamics']
+        )
+    
+    def history_ids(self, **params):
+        response = self.client.get(reverse('analysis-history'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [entry['id'] for entry in response.data['analyses']]
+    
+    def test_history_filters_by_tag_difficulty_and_bloom_level(self):
+        """Test tag, difficulty and Bloom level filters combine, with tags matched case-insensitively"""
+        first, second, third, fourth = [analysis.id for analysis in self.analyses]
+        self.assertEqual(self.history_ids(tag='THERMODYNAMICS'), [third, second, first])
+        self.assertEqual(self.history_ids(tag='thermodynamics', difficulty='Medium'), [second, first])
+        self.assertEqual(self.history_ids(tag='thermodynamics', difficulty='Medium', bloom_level='Apply'), [first])
+        self.assertEqual(self.history_ids(tag=['thermodynamics', 'entropy']), [second])
+        self.assertEqual(self.history_ids(difficulty='Medium', bloom_level='Apply'), [fourth, first])
+    
+    def test_facets_count_session_tags(self):
+        """Test facet counts cover only this session and follow the filters"""
+        facets = self.client.get(reverse('analysis-facets')).data['facets']
+        self.assertEqual(facets['tags'][0], {'value': 'thermodynamics', 'count': 3})
+        self.assertEqual({row['value'] for row in facets['tags']}, {'thermodynamics', 'physics', 'entropy', 'biology'})
+        self.assertEqual(facets['difficulty'], [{'value': 'Medium', 'count': 3}, {'value': 'Hard', 'count': 1}])
+        
+        facets = self.client.get(reverse('analysis-facets'), {'difficulty': 'Medium', 'tag': 'thermodynamics'}).data['facets']
+        self.assertEqual(facets['tags'], [
+            {'value': 'thermodynamics', 'count': 2}, {'value': 'entropy', 'count': 1}, {'value': 'physics', 'count': 1}
+        ])
+        self.assertEqual(facets['bloom_level'], [{'value': 'Analyze', 'count': 1}, {'value': 'Apply', 'count': 1}])
+    
+    def test_index_follows_edits_and_backfill_rebuilds_it(self):
+        """Test saving new tags replaces the entries and the backfill command restores a lost index"""
+        analysis = self.analyses[3]
+        analysis.tags = ['Genetics']
+        analysis.save()
+        self.assertEqual(list(AnalysisTag.objects.filter(analysis=analysis).values_list('name', flat=True)), ['genetics'])
+        
+        expected = sorted(AnalysisTag.objects.values_list('analysis_id', 'name'))
+        AnalysisTag.objects.all().delete()
+        call_command('backfill_tags', batch_size=2, stdout=StringIO())
+        self.assertEqual(sorted(AnalysisTag.objects.values_list('analysis_id', 'name')), expected)
+        self.assertEqual(AnalysisTag.objects.filter(session_key='another-session').count(), 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LocalSimilarityTestCase(APITestCase):
+    
+    NOTE_A = 'Photosynthesis converts light energy into chemical energy stored in glucose in the chloroplasts.'
+    NOTE_B = 'Cellular respiration breaks glucose down in the mitochondria to release energy as ATP.'
+    
+    def setUp(self):
+        cache.clear()
+    
+    def compare(self, note1, note2, **extra):
+        response = self.client.post(reverse('compare-notes'), {'note1': note1, 'note2': note2, **extra}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def test_score_is_local_and_deterministic(self):
+        """Test scores come from the vectors without the LLM: identical notes 100, related ones in between"""
+        with mock.patch.object(GroqAIProcessor, 'summarize_comparison') as summarize:
+            related = self.compare(self.NOTE_A, self.NOTE_B, llm_summary=False)
+            identical = self.compare(self.NOTE_A, self.NOTE_A, llm_summary=False)
+        summarize.assert_not_called()
+        self.assertEqual(identical['similarity_score'], 100.0)
+        self.assertTrue(0 < related['similarity_score'] < 50)
+        self.assertIn('glucose', related['terms']['shared'])
+        self.assertIn('Note A also covers', related['comparison_summary'])
+        self.assertEqual(NoteComparison.objects.get(id=related['id']).similarity_score, related['similarity_score'])
+        
+        self.assertEqual(similarity.similarity('', self.NOTE_A), 0.0)
+        matrix = similarity.similarity_matrix([self.NOTE_A, self.NOTE_B, self.NOTE_A])
+        self.assertEqual(matrix.shape, (3, 3))
+        self.assertAlmostEqual(float(matrix[0, 2]), 1.0, places=5)
+    
+    def test_reversed_pair_is_served_from_cache(self):
+        """Test comparing B to A after A to B reuses the score and summary, with the note labels swapped"""
+        summary = 'Note A is about photosynthesis while Note B is about respiration.'
+        with mock.patch.object(GroqAIProcessor, 'summarize_comparison', return_value=summary) as summarize, \
+             mock.patch.object(similarity, 'similarity', wraps=similarity.similarity) as compute:
+            first = self.compare(self.NOTE_A, self.NOTE_B)
+            second = self.compare(self.NOTE_B, self.NOTE_A)
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(first['similarity_score'], second['similarity_score'])
+        self.assertEqual(second['terms']['first'], first['terms']['second'])
+        # Both calls use the same note order, so the LLM answer is cached under one key
+        self.assertEqual({call.args[:2] for call in summarize.call_args_list}, {tuple(sorted([self.NOTE_A, self.NOTE_B]))})
+        # NOTE_B sorts first, so the summary was written for (B, A) and relabelled for (A, B)
+        self.assertEqual(second['comparison_summary'], summary)
+        self.assertEqual(first['comparison_summary'], 'Note B is about photosynthesis while Note A is about respiration.')
+
+
+class BatchComparisonTestCase(APITestCase):
+    
+    NOTES = [
+        'Photosynthesis converts light energy into chemical energy stored in glucose in the chloroplasts.',
+        'Cellular respiration breaks glucose down in the mitochondria to release energy as ATP.',
+        'In chloroplasts photosynthesis converts light energy into glucose for the plant.',
+        'The French Revolution began in 1789 and ended the absolute monarchy of Louis XVI.',
+    ]
+    
+    def setUp(self):
+        cache.clear()
+    
+    def compare(self, expected=status.HTTP_200_OK, **data):
+        response = self.client.post(reverse('compare-batch'), data, format='json')
+        self.assertEqual(response.status_code, expected, response.data)
+        return response.data
+    
+    def test_matrix_clusters_and_nearest_reference(self):
+        """Test one request returns the symmetric matrix, clusters and each note's nearest reference"""
+        with mock.patch.object(GroqAIProcessor, 'summarize_comparison') as summarize:
+            data = self.compare(notes=self.NOTES, references=[0, 3], cluster_threshold=30, top_k=2)
+        summarize.assert_not_called()
+        matrix = data['matrix']
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([row[index] for index, row in enumerate(matrix)], [100.0] * 4)
+        self.assertEqual(matrix[1][2], matrix[2][1])
+        self.assertEqual(data['clusters'][0], [0, 2])
+        self.assertIn([3], data['clusters'])
+        self.assertEqual(
+            [(entry['index'], entry['reference']) for entry in data['nearest_reference']], [(1, 0), (2, 0)]
+        )
+        self.assertEqual([(pair['first'], pair['second']) for pair in data['top_pairs']][0], (0, 2))
+        self.assertEqual(len(data['top_pairs']), 2)
+        self.assertIn('Note A also covers', data['top_pairs'][0]['comparison_summary'])
+        self.assertFalse(NoteComparison.objects.exists())
+    
+    def test_matrix_does_not_depend_on_block_size(self):
+        """Test multiplying shared features a few columns at a time gives the same matrix"""
+        matrix = similarity.similarity_matrix(self.NOTES + [''])
+        with mock.patch.object(similarity, 'BLOCK_COLUMNS', 3):
+            blocked = similarity.similarity_matrix(self.NOTES + [''])
+        self.assertTrue(abs(matrix - blocked).max() < 1e-6)
+        self.assertEqual(float(matrix[4, 4]), 0.0)
+        self.assertAlmostEqual(float(matrix[1, 1]), 1.0, places=5)
+    
+    def test_llm_summaries_only_for_top_pairs(self):
+        """Test the LLM is asked once per top pair, in the same note order compare-notes uses"""
+        with mock.patch.object(GroqAIProcessor, 'summarize_comparison', return_value='Note A is longer.') as summarize:
+            data = self.compare(notes=self.NOTES, top_k=1, llm_summaries=True)
+        self.assertEqual(summarize.call_count, 1)
+        self.assertEqual(summarize.call_args.args[:2], tuple(sorted([self.NOTES[0], self.NOTES[2]])))
+        # NOTES[2] sorts first, so the labels are swapped back for (0, 2)
+        self.assertEqual(data['top_pairs'][0]['comparison_summary'], 'Note B is longer.')
+        
+        self.compare(status.HTTP_400_BAD_REQUEST, notes=self.NOTES, top_k=50, llm_summaries=True)
+    
+    def test_analysis_ids_are_scoped_to_session(self):
+        """Test analyses are compared by id within the session; unknown ids and bad input are rejected"""
+        session = self.client.session
+        session.save()
+        create = lambda session_key, note: NoteAnalysis.objects.create(
+            session_key=session_key, original_text=note, summary='Summary', key_points=[], difficulty='Easy',
+            bloom_level='Remember', topic_graph=[], quiz_questions=[], tags=[]
+        )
+        ids = [create(session.session_key, note).id for note in self.NOTES[:3]]
+        other = create('other-session', self.NOTES[3])
+        
+        data = self.compare(analysis_ids=ids, top_k=1)
+        self.assertEqual(data['analysis_ids'], ids)
+        self.assertEqual(len(data['matrix']), 3)
+        
+        missing = self.compare(status.HTTP_404_NOT_FOUND, analysis_ids=[ids[0], other.id])
+        self.assertEqual(missing['missing'], [other.id])
+        self.compare(status.HTTP_400_BAD_REQUEST, notes=self.NOTES[:1])
+        self.compare(status.HTTP_400_BAD_REQUEST, notes=self.NOTES, analysis_ids=ids)
+        self.compare(status.HTTP_400_BAD_REQUEST, notes=self.NOTES, references=[4])
+        
+        long_note = 'word ' * (settings.COMPARISON_BATCH_MAX_NOTE_CHARS // 5 + 1)
+        self.compare(status.HTTP_400_BAD_REQUEST, notes=[long_note, self.NOTES[0]])
+        with self.settings(COMPARISON_BATCH_MAX_TOTAL_CHARS=100):
+            self.compare(status.HTTP_400_BAD_REQUEST, notes=self.NOTES)
+            self.compare(status.HTTP_400_BAD_REQUEST, analysis_ids=ids)
@@ -3,9 +3,19 @@ from . import views
 
 urlpatterns = [
     path('health/', views.HealthCheckView.as_view(), name='health-check'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('profiles/', views.ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:artifact_id>/', views.ProfileDownloadView.as_view(), name='profile-download'),
 
     path('analyze-text/', views.AnalyzeTextView.as_view(), name='analyze-text'),
     path('analyze-file/', views.AnalyzeFileView.as_view(), name='analyze-file'),
+    path('analyze-text/stream/', views.AnalyzeTextStreamView.as_view(), name='analyze-text-stream'),
+    path('analyze-file/stream/', views.AnalyzeFileStreamView.as_view(), name='analyze-file-stream'),
     path('compare-notes/', views.CompareNotesView.as_view(), name='compare-notes'),
+    path('compare-notes/batch/', views.CompareBatchView.as_view(), name='compare-batch'),
     path('analysis-history/', views.AnalysisHistoryView.as_view(), name='analysis-history'),
+    path('analysis-history/facets/', views.AnalysisFacetsView.as_view(), name='analysis-facets'),
+    path('analysis-history/<int:analysis_id>/', views.AnalysisDetailView.as_view(), name='analysis-detail'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('jobs/<int:job_id>/', views.AnalysisJobView.as_view(), name='analysis-job'),
 ]
\ No newline at end of file
@@ -3,13 +3,125 @@
 No API keys required, works on any platform including Render
 """
 
+import hashlib
 import os
-import base64
-import requests
-import json
-from django.core.files.storage import default_storage
-from PIL import Image
-import io
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from django.conf import settings
+
+from . import metrics, result_cache
+from .file_handler import FileHandler
+from .image_preprocessing import PreparedImage, preprocess_image, perceptual_hash, hash_neighbours
+from .ocr_providers import load_providers
+
+# Bump when preprocessing or text cleaning changes, so cached OCR text is not reused
+OCR_CACHE_VERSION = 1
+
+_ocr_executor = None
+_preprocess_executor = None
+_ocr_executor_lock = threading.Lock()
+
+def get_ocr_executor():
+    """Return the process-wide thread pool that OCR provider requests race on"""
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = ThreadPoolExecutor(
+                max_workers=settings.OCR_WORKERS,
+                thread_name_prefix='ocr-provider'
+            )
+        return _ocr_executor
+
+def get_preprocess_executor():
+    """Return the process-wide thread pool that decodes and shrinks images (Pillow releases the GIL)"""
+    global _preprocess_executor
+    with _ocr_executor_lock:
+        if _preprocess_executor is None:
+            _preprocess_executor = ThreadPoolExecutor(
+                max_workers=settings.OCR_PREPROCESS_WORKERS,
+                thread_name_prefix='ocr-preprocess'
+            )
+        return _preprocess_executor
+
+class CircuitBreaker:
+    """
+    Tracks one provider's recent latency and error rate
+    Opens (skipping the provider) when too many recent calls failed, then lets a
+    single trial call through after a cooldown to see if it has recovered
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    TRIAL = 'trial'  # allow_request's answer for the half-open trial call
+    
+    def __init__(self, name):
+        self.name = name
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=settings.OCR_BREAKER_WINDOW)  # True for success
+        self.latency = None  # Exponentially weighted average, seconds
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+    
+    def allow_request(self):
+        """Whether the provider may be called now: False, True, or TRIAL for the trial call"""
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < settings.OCR_BREAKER_COOLDOWN:
+                    return False
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self.trial_running:
+                    return False
+                self.trial_running = True
+                return self.TRIAL
+            return True
+    
+    def cancel_trial(self):
+        """Let another trial through: the trial call was cancelled before it ran, so it never records"""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.trial_running = False
+    
+    def record(self, success, latency):
+        """Record the outcome of a call"""
+        with self.lock:
+            self.outcomes.append(success)
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.state == self.HALF_OPEN:
+                self.trial_running = False
+                if success:
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                else:
+                    self._open()
+            elif self.state == self.CLOSED and len(self.outcomes) >= settings.OCR_BREAKER_MIN_CALLS:
+                if self._error_rate() >= settings.OCR_BREAKER_ERROR_RATE:
+                    self._open()
+    
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+    
+    def _error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+    
+    def status(self):
+        """Snapshot for get_ocr_status"""
+        with self.lock:
+            state = self.state
+            if state == self.OPEN and time.monotonic() - self.opened_at >= settings.OCR_BREAKER_COOLDOWN:
+                state = self.HALF_OPEN  # The next request will be a trial call
+            return {
+                'available': state != self.OPEN,
+                'state': state,
+                'error_rate': round(self._error_rate(), 3),
+                'avg_latency_ms': None if self.latency is None else round(self.latency * 1000),
+                'recent_calls': len(self.outcomes),
+            }
 
 class FreeOCRExtractor:
     """
@@ -17,216 +129,197 @@ class FreeOCRExtractor:
     No paid APIs required - perfect for budget-conscious projects
     """
     
-    def __init__(self):
-        self.free_providers = [
-            self._ocr_space_free,
-            self._api_ninjas_free,
-            self._ocr_web_service,
-            self._image_to_text_free
-        ]
+    def __init__(self, providers=None):
+        # Configured in settings.OCR_PROVIDERS, ordered by priority then cost
+        self.providers = load_providers() if providers is None else list(providers)
+        self.breakers = {provider.name: CircuitBreaker(provider.name) for provider in self.providers}
     
     def extract_text_from_image(self, image_file):
         """
         Extract text from image using 100% FREE OCR services
         No API keys or payments required!
         """
-        # Save image temporarily
-        file_path = default_storage.save(f'temp/{image_file.name}', image_file)
-        full_path = default_storage.path(file_path)
+        # Work on the upload in memory (or Django's own temp file for large uploads)
+        source = FileHandler.upload_source(image_file)
         
-        try:
-            # Optimize image for better OCR results
-            optimized_path = self._optimize_image_for_ocr(full_path)
-            
-            # Try each FREE OCR provider until one succeeds
-            for provider in self.free_providers:
-                try:
-                    text = provider(optimized_path)
-                    if text and text.strip():
-                        return self._clean_ocr_text(text)
-                except Exception as e:
-                    print(f"Free OCR provider failed: {e}")
-                    continue
-            
-            raise Exception("All free OCR services are temporarily unavailable. Please try again later.")
-            
-        finally:
-            # Clean up temporary files
-            if default_storage.exists(file_path):
-                default_storage.delete(file_path)
-            if 'optimized_path' in locals() and optimized_path != full_path:
-                try:
-                    os.remove(optimized_path)
-                except:
-                    pass
-    
-    def _ocr_space_free(self, image_path):
-        """
-        OCR.space API - 100% FREE, no API key required!
-        """
-        url = 'https://api.ocr.space/parse/image'
+        # Repeat uploads of the same image skip preprocessing and OCR entirely
+        cache_keys = self._cache_keys(source) if settings.OCR_CACHE else []
+        cached = self._cached_text(cache_keys)
+        if cached is not None:
+            return cached
         
-        with open(image_path, 'rb') as f:
-            files = {'file': f}
-            data = {
-                'apikey': 'helloworld',  # Free public API key
-                'language': 'eng',
-                'isOverlayRequired': False,
-                'detectOrientation': True,
-                'scale': True,
-                'OCREngine': 2,  # Use engine 2 for better accuracy
-                'filetype': 'auto'
-            }
-            
-            response = requests.post(url, files=files, data=data, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if result.get('IsErroredOnProcessing'):
-                raise Exception(f"OCR.space error: {result.get('ErrorMessage', 'Unknown error')}")
-            
-            # Extract text from all parsed results
-            text_parts = []
-            for parsed_result in result.get('ParsedResults', []):
-                if parsed_result.get('ParsedText'):
-                    text_parts.append(parsed_result['ParsedText'])
-            
-            return '\n'.join(text_parts)
+        # Optimize image for better OCR results
+        started = time.monotonic()
+        prepared = self._optimize_image_for_ocr(source)
+        preprocessed = time.monotonic()
+        
+        report = {'bytes_sent': 0, 'provider': None}
+        text = self._race_providers(prepared, report)
+        self._report_image(prepared, report, preprocessed - started, time.monotonic() - preprocessed)
+        if text:
+            text = self._clean_ocr_text(text)
+            if cache_keys:
+                # Neighbour keys are only probed, never written
+                result_cache.set_many({key: text for key in cache_keys[:2]}, settings.OCR_CACHE_TTL)
+            return text
+        
+        raise Exception("All free OCR services are temporarily unavailable. Please try again later.")
     
-    def _api_ninjas_free(self, image_path):
+    @staticmethod
+    def _cache_keys(source):
         """
-        API Ninjas - FREE OCR service, no API key required for basic use
+        Cache keys for an image, best match first: SHA-256 of the raw bytes, then
+        (when OCR_CACHE_PERCEPTUAL is on) its perceptual hash and every hash one bit away;
+        replayed text is kept under separate keys (result_cache.namespace)
         """
-        url = 'https://api.api-ninjas.com/v1/imagetotext'
+        digest = hashlib.sha256()
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+        else:
+            digest.update(source)
+        prefix = result_cache.namespace()
+        keys = [f"{prefix}ocr:sha256:v{OCR_CACHE_VERSION}:{digest.hexdigest()}"]
         
-        with open(image_path, 'rb') as f:
-            files = {'image': f}
-            # No API key required for basic usage
-            response = requests.post(url, files=files, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                text_parts = []
-                for item in result:
-                    if isinstance(item, dict) and 'text' in item:
-                        text_parts.append(item['text'])
-                    elif isinstance(item, str):
-                        text_parts.append(item)
-                
-                return '\n'.join(text_parts)
-            else:
-                raise Exception(f"API Ninjas OCR failed: {response.status_code}")
+        if settings.OCR_CACHE_PERCEPTUAL:
+            try:
+                image_hash = perceptual_hash(source, settings.OCR_CACHE_HASH_SIZE)
+            except ValueError:
+                raise  # Decompression bombs are rejected, not hashed
+            except Exception as e:
+                print(f"Perceptual hash failed: {e}")
+                return keys
+            keys += [f"{prefix}ocr:dhash:v{OCR_CACHE_VERSION}:{h}" for h in [image_hash] + hash_neighbours(image_hash)]
+        return keys
+    
+    @staticmethod
+    def _cached_text(cache_keys):
+        """OCR text cached under the best matching key, or None"""
+        if not cache_keys:
+            return None
+        cached = result_cache.get_many(cache_keys)
+        for position, key in enumerate(cache_keys):
+            if key in cached:
+                outcome = 'exact_hit' if position == 0 else 'perceptual_hit'
+                metrics.increment('ocr_cache_total', outcome=outcome)
+                if position > 0:
+                    # Serve the next upload of these exact bytes without hashing pixels
+                    result_cache.set(cache_keys[0], cached[key], settings.OCR_CACHE_TTL)
+                return cached[key]
+        metrics.increment('ocr_cache_total', outcome='miss')
+        return None
     
-    def _ocr_web_service(self, image_path):
+    @staticmethod
+    def _report_image(prepared, report, preprocess_seconds, ocr_seconds):
+        """Record bytes sent and latency for one image"""
+        metrics.increment('ocr_images_total', provider=report['provider'] or 'none')
+        metrics.increment('ocr_bytes_received_total', prepared.original_bytes)
+        metrics.increment('ocr_bytes_sent_total', report['bytes_sent'])
+        metrics.observe('stage_seconds', preprocess_seconds, stage='ocr_preprocess')
+        metrics.observe('stage_seconds', ocr_seconds, stage='ocr_recognize')
+        print(
+            f"OCR image: {prepared.original_bytes} bytes uploaded, {report['bytes_sent']} bytes sent, "
+            f"preprocess {preprocess_seconds * 1000:.0f} ms, OCR {ocr_seconds * 1000:.0f} ms "
+            f"({report['provider'] or 'no result'})"
+        )
+    
+    def _race_providers(self, prepared, report=None):
         """
-        Free OCR Web Service - Another completely free option
+        Hedged race: start the first healthy provider, start the next one whenever
+        the last started provider's hedge delay passes without an answer (or a
+        provider fails), and return the first non-empty text. Providers with an
+        open circuit are skipped.
         """
-        url = 'https://www.freeocr.com/api/upload'
+        executor = get_ocr_executor()
+        deadline = time.monotonic() + settings.OCR_DEADLINE
+        waiting = iter(self.providers)
+        pending = {}  # Future -> provider
+        hedge_delay = settings.OCR_HEDGE_DELAY
+        report = {'bytes_sent': 0, 'provider': None} if report is None else report
+        
+        def launch_next():
+            nonlocal hedge_delay
+            for provider in waiting:
+                image_data = prepared.for_provider(provider)
+                if provider.max_bytes and len(image_data) > provider.max_bytes:
+                    print(f"Image too large for OCR provider {provider.name}, skipping")
+                    continue
+                breaker = self.breakers[provider.name]
+                allowed = breaker.allow_request()
+                if allowed:
+                    future = executor.submit(metrics.in_context(self._call_provider), provider, image_data)
+                    if allowed == CircuitBreaker.TRIAL:
+                        future.add_done_callback(lambda future: future.cancelled() and breaker.cancel_trial())
+                    pending[future] = provider
+                    report['bytes_sent'] += len(image_data)
+                    hedge_delay = provider.hedge_delay
+                    return True
+            return False
         
+        more = launch_next()
         try:
-            with open(image_path, 'rb') as f:
-                files = {'file': f}
-                data = {
-                    'language': 'eng',
-                    'output': 'txt'
-                }
-                
-                response = requests.post(url, files=files, data=data, timeout=30)
-                
-                if response.status_code == 200:
-                    # Parse the response - this service returns plain text
-                    return response.text.strip()
-                else:
-                    raise Exception(f"Free OCR Web Service failed: {response.status_code}")
-                    
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                timeout = min(hedge_delay, remaining) if more else remaining
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # The running providers are slow: hedge with the next one
+                    more = more and launch_next()
+                    continue
+                for future in done:
+                    provider = pending.pop(future)
+                    text = future.result()
+                    if text and text.strip():
+                        report['provider'] = provider.name
+                        return text
+                    more = more and launch_next()
+            return None
+        finally:
+            # Losing requests still running finish in the background (bounded by
+            # OCR_PROVIDER_TIMEOUT) and still count towards their breaker
+            for future in pending:
+                future.cancel()
+    
+    def _call_provider(self, provider, image_data):
+        """Call one provider, recording its latency and outcome; returns '' on failure"""
+        name = provider.name
+        start = time.monotonic()
+        try:
+            text = provider.extract(image_data)
         except Exception as e:
-            raise Exception(f"OCR Web Service error: {str(e)}")
+            self._record_call(name, 'error', time.monotonic() - start)
+            print(f"Free OCR provider {name} failed: {e}")
+            return ''
+        # An image without text is not the provider's fault
+        self._record_call(name, 'text' if text and text.strip() else 'empty', time.monotonic() - start)
+        return text or ''
     
-    def _image_to_text_free(self, image_path):
-        """
-        Another free OCR service as backup
-        """
-        # Convert image to base64 for web-based OCR
-        with open(image_path, 'rb') as f:
-            image_data = base64.b64encode(f.read()).decode('utf-8')
-        
-        # Use a simple OCR service that accepts base64
-        url = 'https://api.ocr.space/parse/imageurl'
-        
-        # Create a data URL
-        mime_type = 'image/jpeg'  # Default
-        if image_path.lower().endswith('.png'):
-            mime_type = 'image/png'
-        elif image_path.lower().endswith('.gif'):
-            mime_type = 'image/gif'
-        
-        data_url = f"data:{mime_type};base64,{image_data}"
-        
-        payload = {
-            'apikey': 'helloworld',
-            'url': data_url,
-            'language': 'eng',
-            'isOverlayRequired': False,
-            'OCREngine': 1  # Use engine 1 as fallback
-        }
-        
-        response = requests.post(url, data=payload, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        if result.get('IsErroredOnProcessing'):
-            raise Exception(f"Image to text OCR error: {result.get('ErrorMessage', 'Unknown error')}")
-        
-        # Extract text
-        text_parts = []
-        for parsed_result in result.get('ParsedResults', []):
-            if parsed_result.get('ParsedText'):
-                text_parts.append(parsed_result['ParsedText'])
-        
-        return '\n'.join(text_parts)
+    def _record_call(self, name, outcome, seconds):
+        """Feed one provider call to its circuit breaker and the metrics"""
+        self.breakers[name].record(outcome != 'error', seconds)
+        metrics.increment('ocr_provider_results_total', provider=name, outcome=outcome)
+        metrics.observe('ocr_provider_seconds', seconds, provider=name, outcome=outcome)
     
-    def _optimize_image_for_ocr(self, image_path):
+    def _optimize_image_for_ocr(self, source):
         """
-        Optimize image for better OCR results using PIL
-        This improves accuracy significantly!
+        Shrink and clean up the image for OCR (see image_preprocessing), off the request thread
+        Takes image bytes or a file path and returns a PreparedImage, all in memory
         """
+        formats = tuple(dict.fromkeys(fmt for provider in self.providers for fmt in provider.formats))
         try:
-            with Image.open(image_path) as img:
-                # Convert to RGB if necessary
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Resize image if too small (OCR works better on larger images)
-                width, height = img.size
-                if width < 300 or height < 300:
-                    # Scale up small images
-                    scale_factor = max(300 / width, 300 / height)
-                    new_width = int(width * scale_factor)
-                    new_height = int(height * scale_factor)
-                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # Enhance contrast and brightness for better OCR
-                from PIL import ImageEnhance
-                
-                # Enhance contrast
-                enhancer = ImageEnhance.Contrast(img)
-                img = enhancer.enhance(1.2)
-                
-                # Enhance sharpness
-                enhancer = ImageEnhance.Sharpness(img)
-                img = enhancer.enhance(1.1)
-                
-                # Save optimized image
-                optimized_path = image_path.replace('.', '_optimized.')
-                img.save(optimized_path, 'JPEG', quality=95)
-                
-                return optimized_path
-                
+            return get_preprocess_executor().submit(preprocess_image, source, formats).result()
+        except ValueError:
+            raise  # Decompression bombs are rejected, not sent on
         except Exception as e:
             print(f"Image optimization failed: {e}")
-            return image_path  # Return original if optimization fails
+            # Send the original if optimization fails
+            if isinstance(source, str):
+                with open(source, 'rb') as f:
+                    source = f.read()
+            return PreparedImage({'ORIGINAL': source}, original_bytes=len(source))
     
     def _clean_ocr_text(self, text):
         """
@@ -262,21 +355,25 @@ class FreeOCRExtractor:
         image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'}
         return os.path.splitext(filename.lower())[1] in image_extensions
     
-    @staticmethod
-    def get_ocr_status():
+    def get_ocr_status(self):
         """
-        Check OCR service availability - All services are FREE!
+        Check OCR service availability from each provider's circuit breaker - all services are FREE!
         """
+        providers = {
+            provider.name: {
+                'remote': provider.remote,
+                'priority': provider.priority,
+                'cost': provider.cost,
+                **self.breakers[provider.name].status()
+            }
+            for provider in self.providers
+        }
+        available = [name for name, provider in providers.items() if provider['available']]
         return {
-            'available': True,  # Always available - all services are free!
-            'providers': {
-                'ocr_space_free': True,
-                'api_ninjas_free': True,
-                'ocr_web_service': True,
-                'image_to_text_free': True
-            },
+            'available': bool(available),
+            'providers': providers,
             'cost': 'FREE',  # Completely free!
-            'primary': 'ocr_space_free'
+            'primary': available[0] if available else None
         }
 
 # Create a singleton instance
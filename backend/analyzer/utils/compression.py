@@ -0,0 +1,96 @@
+"""
+zlib compression of stored note text and JSON, optionally primed with a preset dictionary
+A stored value is one header byte naming the dictionary it was compressed with
+(0 for none, RAW for values kept uncompressed) followed by a raw deflate stream.
+Dictionaries are never edited once rows use them: a retrained one gets the next id
+and COMPRESSION_DICTIONARY selects which id new writes use. Only train them on real rows,
+as an id stays taken for as long as any row uses it.
+"""
+
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+DICTIONARY_DIR = Path(__file__).resolve().parent.parent / 'dictionaries'
+NO_DICTIONARY = 0
+RAW = 255  # Header of values that did not get smaller
+MAX_DICTIONARY_BYTES = 32 * 1024  # Deflate only looks back 32 KB, so the rest would never be used
+WBITS = -15  # Raw deflate: no zlib header or checksum, the header byte identifies the format
+
+
+def dictionary_path(dictionary_id):
+    return DICTIONARY_DIR / f'notes-{dictionary_id}.zdict'
+
+
+@lru_cache(maxsize=None)
+def get_dictionary(dictionary_id):
+    """Bytes of a preset dictionary; empty for NO_DICTIONARY"""
+    if dictionary_id == NO_DICTIONARY:
+        return b''
+    try:
+        return dictionary_path(dictionary_id).read_bytes()
+    except FileNotFoundError:
+        raise ValueError(f'Unknown compression dictionary {dictionary_id}')
+
+
+def compress(data, dictionary_id=None):
+    """Header byte plus data deflated with the dictionary (COMPRESSION_DICTIONARY by default)"""
+    if dictionary_id is None:
+        dictionary_id = settings.COMPRESSION_DICTIONARY
+    zdict = get_dictionary(dictionary_id)
+    options = {'zdict': zdict} if zdict else {}
+    compressor = zlib.compressobj(settings.COMPRESSION_LEVEL, zlib.DEFLATED, WBITS, **options)
+    body = compressor.compress(data) + compressor.flush()
+    if len(body) >= len(data):
+        return bytes([RAW]) + data
+    return bytes([dictionary_id]) + body
+
+
+def decompress(value):
+    """Data of a value made by compress, whichever dictionary it used"""
+    value = bytes(value)  # Postgres returns memoryview
+    if not value:
+        raise ValueError('Empty compressed value')
+    header, body = value[0], value[1:]
+    if header == RAW:
+        return body
+    zdict = get_dictionary(header)
+    options = {'zdict': zdict} if zdict else {}
+    decompressor = zlib.decompressobj(WBITS, **options)
+    return decompressor.decompress(body) + decompressor.flush()
+
+
+def train_dictionary(samples, size=MAX_DICTIONARY_BYTES, max_words=6):
+    """
+    Preset dictionary of the word sequences that recur across samples
+    Sequences are scored by the bytes they would save (samples containing them times
+    their length); the best go last, where deflate reaches them with the shortest distances.
+    """
+    counts = Counter()
+    for sample in samples:
+        words = re.findall(r'\S+\s*', sample)
+        grams = set()
+        for n in range(1, max_words + 1):
+            for start in range(len(words) - n + 1):
+                gram = ''.join(words[start:start + n])
+                if len(gram) >= 4:
+                    grams.add(gram)
+        counts.update(grams)  # Once per sample, so one long repetitive note cannot dominate
+
+    ranked = sorted(
+        ((count * len(gram.encode('utf-8')), gram) for gram, count in counts.items() if count > 1),
+        reverse=True
+    )
+    chosen, chosen_text, total = [], '', 0
+    for _, gram in ranked:
+        encoded = gram.encode('utf-8')
+        if total + len(encoded) > size or gram in chosen_text:
+            continue
+        chosen.append(encoded)
+        chosen_text += gram + '\0'
+        total += len(encoded)
+    return b''.join(reversed(chosen))
@@ -1,6 +1,22 @@
+import mmap
+import multiprocessing
 import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
-from django.core.files.storage import default_storage
+from django.conf import settings
+
+# PDF bytes or path held by each extraction worker process (set once by the pool initializer)
+_worker_pdf_source = None
+
+def _init_pdf_worker(source):
+    global _worker_pdf_source
+    _worker_pdf_source = source
+
+def _extract_page_range(first_page, last_page):
+    """Extract a range of pages inside a worker process"""
+    return list(FileHandler.iter_pdf_pages(_worker_pdf_source, first_page, last_page))
 
 class FileHandler:
     """Handle file processing for different formats"""
@@ -10,42 +26,64 @@ class FileHandler:
         """Extract text from uploaded file based on type"""
         file_extension = os.path.splitext(file.name)[1].lower()
         
-        # Save file temporarily
-        file_path = default_storage.save(f'temp/{file.name}', file)
-        full_path = default_storage.path(file_path)
-        
-        try:
-            if file_extension == '.txt':
-                return FileHandler._extract_from_txt(full_path)
-            elif file_extension == '.pdf':
-                return FileHandler._extract_from_pdf(full_path)
-            else:
-                raise ValueError(f"Unsupported file type: {file_extension}. Supported formats: PDF, TXT")
-        finally:
-            # Clean up temporary file
-            if default_storage.exists(file_path):
-                default_storage.delete(file_path)
+        if file_extension == '.txt':
+            return FileHandler._extract_from_txt(FileHandler.upload_source(file))
+        elif file_extension == '.pdf':
+            return FileHandler._extract_from_pdf(FileHandler.upload_source(file))
+        else:
+            raise ValueError(f"Unsupported file type: {file_extension}. Supported formats: PDF, TXT")
+    
+    @staticmethod
+    def upload_source(file):
+        """
+        Return the upload without copying it to storage: the path of Django's own
+        temporary file for large uploads, otherwise the in-memory bytes
+        """
+        if hasattr(file, 'temporary_file_path'):
+            return file.temporary_file_path()
+        file.seek(0)
+        return file.read()
+    
+    @staticmethod
+    def _extract_from_txt(source):
+        """Extract text from .txt bytes, or from a file path via a read-only memory map"""
+        if isinstance(source, str):
+            if os.path.getsize(source) == 0:
+                return ''
+            with open(source, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return FileHandler._decode_text(data)
+        return FileHandler._decode_text(source)
     
     @staticmethod
-    def _extract_from_txt(file_path):
-        """Extract text from .txt file"""
+    def _decode_text(data):
+        """Decode text bytes as UTF-8, falling back to latin-1"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
+            return str(data, 'utf-8')
         except UnicodeDecodeError:
             # Try with different encoding
-            with open(file_path, 'r', encoding='latin-1') as file:
-                return file.read()
+            return str(data, 'latin-1')
+    
+    @staticmethod
+    def _open_pdf(source):
+        """Open a PDF from in-memory bytes or a file path"""
+        if isinstance(source, str):
+            return fitz.open(source)
+        return fitz.open(stream=source, filetype='pdf')
     
     @staticmethod
-    def _extract_from_pdf(file_path):
-        """Extract text from PDF using PyMuPDF"""
+    def _extract_from_pdf(source):
+        """Extract text from PDF bytes or path using PyMuPDF, pages separated by form feeds"""
         try:
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
+            with FileHandler._open_pdf(source) as doc:
+                page_count = min(doc.page_count, settings.PDF_MAX_PAGES)
+            
+            if settings.PDF_EXTRACTION_PROCESSES > 1 and page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+                pages = FileHandler._iter_pdf_pages_parallel(source, page_count)
+            else:
+                pages = FileHandler.iter_pdf_pages(source, 0, page_count)
+            
+            # Stop reading pages once there is more text than will be analyzed
+            text = '\f'.join(FileHandler._take_until(pages, settings.PDF_MAX_CHARS))
             
             if not text.strip():
                 raise ValueError("No text could be extracted from PDF")
@@ -56,8 +94,51 @@ class FileHandler:
             raise ValueError(f"Unable to extract text from PDF: {str(e)}")
     
     @staticmethod
-    def clean_text(text):
-        """Clean and normalize extracted text"""
+    def iter_pdf_pages(source, first_page=0, last_page=None):
+        """Yield the text of each page in [first_page, last_page) of PDF bytes or a PDF path"""
+        doc = FileHandler._open_pdf(source)
+        try:
+            last_page = doc.page_count if last_page is None else min(last_page, doc.page_count)
+            for page_number in range(first_page, last_page):
+                yield doc.load_page(page_number).get_text()
+        finally:
+            doc.close()
+    
+    @staticmethod
+    def _iter_pdf_pages_parallel(source, page_count):
+        """Yield page texts in order while batches of pages are extracted across a process pool"""
+        # Each worker receives the bytes (or just the path) once, not per batch
+        executor = ProcessPoolExecutor(
+            max_workers=settings.PDF_EXTRACTION_PROCESSES,
+            mp_context=multiprocessing.get_context(settings.PDF_PROCESS_START_METHOD),
+            initializer=_init_pdf_worker,
+            initargs=(source,)
+        )
+        try:
+            batch = settings.PDF_PAGES_PER_TASK
+            futures = [
+                executor.submit(_extract_page_range, first_page, min(first_page + batch, page_count))
+                for first_page in range(0, page_count, batch)
+            ]
+            for future in futures:
+                yield from future.result()
+        finally:
+            # Runs on early stop too: pending batches are cancelled
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def _take_until(pages, max_chars):
+        """Yield pages until at least max_chars characters have been collected"""
+        collected = 0
+        for page in pages:
+            yield page
+            collected += len(page)
+            if collected >= max_chars:
+                return
+    
+    @staticmethod
+    def clean_text(text, max_length=10000):
+        """Clean and normalize extracted text; max_length=None disables truncation"""
         if not text:
             return ""
         
@@ -69,8 +150,46 @@ class FileHandler:
         text = text.replace('\ufffd', '')  # Remove replacement characters
         
         # Limit text length to prevent API issues
-        max_length = 10000  # Adjust based on API limits
-        if len(text) > max_length:
+        if max_length is not None and len(text) > max_length:
             text = text[:max_length] + "... [truncated]"
         
-        return text.strip()
\ No newline at end of file
+        return text.strip()
+    
+    @staticmethod
+    def split_into_chunks(text, chunk_size=10000):
+        """
+        Split raw text into cleaned chunks of at most chunk_size characters,
+        breaking on page and paragraph boundaries. A chunk ends at a paragraph whose hash
+        picks it once the chunk is half full, or where the next piece would not fit, so a
+        boundary depends on the paragraph before it and on the size accumulated since the
+        previous boundary. An edit therefore usually changes only the chunks up to the next
+        hash-picked boundary, and the later chunks (and their cached analyses) stay the same.
+        """
+        pieces = []
+        for paragraph in re.split(r'\f|\n\s*\n', text or ''):
+            paragraph = FileHandler.clean_text(paragraph, max_length=None)
+            if len(paragraph) <= chunk_size:
+                if paragraph:
+                    pieces.append(paragraph)
+                continue
+            # Over-long paragraphs are split into sentences, then hard-wrapped
+            for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+                for start in range(0, len(sentence), chunk_size):
+                    pieces.append(sentence[start:start + chunk_size])
+        
+        chunks = []
+        current = []
+        size = 0
+        for piece in pieces:
+            if current and size + 1 + len(piece) > chunk_size:
+                chunks.append(' '.join(current))
+                current, size = [], 0
+            size = size + 1 + len(piece) if current else len(piece)
+            current.append(piece)
+            # Content-defined boundary once the chunk is at least half full
+            if size >= chunk_size // 2 and zlib.crc32(piece.encode('utf-8')) % 4 == 0:
+                chunks.append(' '.join(current))
+                current, size = [], 0
+        if current:
+            chunks.append(' '.join(current))
+        return chunks
\ No newline at end of file
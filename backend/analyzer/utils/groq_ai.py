@@ -1,78 +1,408 @@
 import json
 import re
-from groq import Groq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from django.conf import settings
+from django.db import connections
+
+from . import map_reduce, metrics, result_cache
+from .groq_client import get_groq_client
+
+# Bump whenever a prompt template changes so stale cached results are ignored
+PROMPT_VERSION = 2
+
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+def get_stage_executor():
+    """Return the process-wide thread pool used to run LLM stages concurrently"""
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            _stage_executor = ThreadPoolExecutor(
+                max_workers=settings.ANALYSIS_STAGE_WORKERS,
+                thread_name_prefix='groq-stage'
+            )
+        return _stage_executor
+
+def _is_text(value):
+    return isinstance(value, str) and bool(value.strip())
+
+def _is_text_list(value):
+    return isinstance(value, list) and bool(value) and all(_is_text(item) for item in value)
+
+def _is_topic_graph(value):
+    return isinstance(value, list) and bool(value) and all(
+        isinstance(node, dict) and _is_text(node.get('id')) and _is_text(node.get('label'))
+        and isinstance(node.get('children', []), list)
+        for node in value
+    )
+
+def _is_quiz(value):
+    return isinstance(value, list) and bool(value) and all(
+        isinstance(question, dict) and _is_text(question.get('question'))
+        and _is_text_list(question.get('options')) and _is_text(question.get('correct_answer'))
+        for question in value
+    )
+
+# Schema for the combined analysis response: section name -> validator
+COMBINED_SCHEMA = {
+    'summary': _is_text,
+    'key_points': _is_text_list,
+    'difficulty': lambda value: value in ('Easy', 'Medium', 'Hard'),
+    'bloom_level': lambda value: value in ('Remember', 'Understand', 'Apply', 'Analyze', 'Evaluate', 'Create'),
+    'tags': _is_text_list,
+    'learning_objectives': _is_text_list,
+    'prerequisites': _is_text_list,
+    'applications': _is_text_list,
+    'topic_graph': _is_topic_graph,
+    'quiz_questions': _is_quiz,
+}
+
+# Sections the staged analysis reply must have (save_analysis reads them) and may have
+ANALYSIS_REQUIRED = ('summary', 'key_points', 'difficulty', 'bloom_level', 'tags')
+ANALYSIS_OPTIONAL = ('learning_objectives', 'prerequisites', 'applications')
+
+def _is_analysis(value):
+    return isinstance(value, dict) and all(
+        COMBINED_SCHEMA[section](value.get(section)) for section in ANALYSIS_REQUIRED
+    ) and all(
+        COMBINED_SCHEMA[section](value[section]) for section in ANALYSIS_OPTIONAL if section in value
+    )
+
+# Schema of each staged reply: stage -> validator. Anything else is a fallback and never cached
+STAGE_SCHEMAS = {
+    'analysis': _is_analysis,
+    'topic_graph': _is_topic_graph,
+    'quiz': _is_quiz,
+    'comparison': lambda value: isinstance(value, dict) and _is_text(value.get('comparison_summary')),
+}
+
+ANALYSIS_MODES = ('staged', 'combined')
+
+class JSONStringFieldStreamer:
+    """Incrementally decode one string field from a JSON reply that is still streaming in"""
+    
+    def __init__(self, field):
+        self.start_pattern = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self.buffer = ''
+        self.position = None  # Index of the next undecoded character of the value
+        self.done = False
+    
+    def feed(self, chunk):
+        """Add streamed text and return any newly completed part of the field value"""
+        self.buffer += chunk
+        if self.done:
+            return ''
+        if self.position is None:
+            match = self.start_pattern.search(self.buffer)
+            if not match:
+                return ''
+            self.position = match.end()
+        
+        decoded = []
+        buffer, i = self.buffer, self.position
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                break
+            if char != '\\':
+                decoded.append(char)
+                i += 1
+                continue
+            # Escape sequences are decoded only once they have fully arrived
+            length = 2
+            if buffer[i + 1:i + 2] == 'u':
+                # A high surrogate must be decoded together with its low surrogate
+                length = 12 if buffer[i + 2:i + 4].lower() in ('d8', 'd9', 'da', 'db') else 6
+            if i + length > len(buffer):
+                break
+            try:
+                decoded.append(json.loads('"' + buffer[i:i + length] + '"'))
+            except ValueError:
+                decoded.append(buffer[i + 1:i + length])
+            i += length
+        self.position = i
+        return ''.join(decoded)
+
+def _run_stage_in_thread(stage, text):
+    """Run one stage on a pool thread and release its DB connections afterwards"""
+    try:
+        return stage(text)
+    finally:
+        # The database cache backend opens per-thread connections
+        connections.close_all()
 
 class GroqAIProcessor:
     def __init__(self):
-        if not settings.GROQ_API_KEY:
+        if not settings.GROQ_API_KEY and settings.EXTERNAL_SERVICES != 'replay':
             print("Warning: GROQ_API_KEY not set. Using fallback responses.")
-            self.client = None
-        else:
-            self.client = Groq(api_key=settings.GROQ_API_KEY)
+        # Shared per process so HTTP connections and rate-limit state are reused
+        self.client = get_groq_client()
         self.model = "deepseek-r1-distill-llama-70b"
+        self.use_cache = True
+        # Token usage across every request made by this processor
+        self.usage = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        self._usage_lock = threading.Lock()
     
-    def analyze_note(self, text):
-        """Analyze note for summary, key points, difficulty, and Bloom's level"""
+    def run_analysis(self, text, mode=None):
+        """Run the analysis, topic graph and quiz stages and return all three results"""
+        mode = mode or settings.ANALYSIS_MODE
+        if mode == 'combined':
+            return self.analyze_combined(text)
+        
+        stages = [
+            (self.analyze_note, self._fallback_analysis),
+            (self.generate_topic_graph, self._fallback_graph),
+            (self.generate_quiz, self._fallback_quiz),
+        ]
+        
+        if not settings.ANALYSIS_CONCURRENT_STAGES or not self.client:
+            return tuple(stage(text) for stage, _ in stages)
+        
+        # The stages are independent, so latency is roughly that of the slowest one
+        executor = get_stage_executor()
+        futures = [
+            (executor.submit(metrics.in_context(_run_stage_in_thread), stage, text), fallback)
+            for stage, fallback in stages
+        ]
+        
+        results = []
+        for future, fallback in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Analysis stage failed: {e}")
+                results.append(fallback())
+        return tuple(results)
+    
+    def run_chunked_analysis(self, chunks, mode=None):
+        """
+        Map-reduce analysis of a long document: analyze chunks in parallel, then merge
+        Each chunk is cached on its own, so unchanged chunks of an edited document are free
+        """
+        def analyze_chunk(chunk):
+            """(analysis, topic_graph, quiz) of one chunk, with None for every part that fell back"""
+            try:
+                analysis, topic_graph, quiz = _run_stage_in_thread(partial(self.run_analysis, mode=mode), chunk)
+            except Exception as e:
+                print(f"Chunk analysis failed: {e}")
+                return None, None, None
+            fallback = self._fallback_analysis()
+            if analysis.get('summary') == fallback['summary']:
+                analysis = None
+            else:
+                # Sections missing from a combined reply are filled in from the fallback
+                analysis = {
+                    section: value for section, value in analysis.items()
+                    if section in ('difficulty', 'bloom_level') or value != fallback.get(section)
+                }
+            return (
+                analysis,
+                None if topic_graph == self._fallback_graph() else topic_graph,
+                None if quiz == self._fallback_quiz() else quiz,
+            )
+        
+        # A separate pool: chunk tasks wait on stage tasks, so they must not share one
+        with ThreadPoolExecutor(
+            max_workers=settings.ANALYSIS_CHUNK_CONCURRENCY, thread_name_prefix='groq-chunk'
+        ) as executor:
+            futures = [executor.submit(metrics.in_context(analyze_chunk), chunk) for chunk in chunks]
+            results = [future.result() for future in futures]
+        
+        # Fallback content never reaches the merge; it is only returned when every chunk failed
+        analyses = [analysis for analysis, _, _ in results if analysis is not None]
+        if analyses:
+            analysis = map_reduce.merge_analyses(analyses)
+            analysis['summary'] = self.merge_summaries([a.get('summary', '') for a in analyses])
+        else:
+            analysis = self._fallback_analysis()
+        topic_graph = map_reduce.merge_topic_graphs([graph for _, graph, _ in results if graph]) or self._fallback_graph()
+        quiz_questions = map_reduce.merge_quizzes([quiz for _, _, quiz in results if quiz]) or self._fallback_quiz()
+        return analysis, topic_graph, quiz_questions
+    
+    def merge_summaries(self, summaries):
+        """Reduce the summaries of consecutive sections into one summary of the whole document"""
+        summaries = map_reduce.dedupe([summary for summary in summaries if summary])
+        if len(summaries) <= 1 or not self.client:
+            return ' '.join(summaries)
+        
+        sections = '\n\n'.join(f"Section {index}: {summary}" for index, summary in enumerate(summaries, 1))
         prompt = f"""
-        Analyze the following note and return a comprehensive JSON response with:
-        1. An EXTENSIVE detailed summary (15-25 sentences minimum) that should include:
-           - Introduction to the main topic and its significance
-           - Historical context or background information
-           - Detailed explanation of core concepts and mechanisms
-           - Relationships between different components or ideas
-           - Current understanding and recent developments
-           - Practical implications and real-world relevance
-           - Challenges, limitations, or controversies if applicable
-           - Future directions or potential developments
-           - Connections to related fields or disciplines
-           - Conclusion emphasizing the importance and broader impact
+        The following are summaries of consecutive sections of one long document.
+        Merge them into a single EXTENSIVE summary (15-25 sentences) of the whole document that
+        covers every section, removes repetition and keeps the scholarly tone.
+
+        {sections}
+
+        Respond ONLY with valid JSON: {{"summary": "..."}}
+        """
         
-        2. 8-12 comprehensive key points (each should be 2-3 sentences explaining the concept in detail)
-        3. Difficulty level (Easy, Medium, or Hard) with justification
-        4. Bloom's Taxonomy level (Remember, Understand, Apply, Analyze, Evaluate, or Create) with reasoning
-        5. Tags (array of 8-12 relevant topic keywords including subtopics)
-        6. Learning objectives (5-8 specific, measurable learning goals)
-        7. Prerequisites (detailed concepts and knowledge needed)
-        8. Applications (comprehensive real-world uses, examples, and case studies)
+        cache_key = result_cache.make_key('merged_summary', self.model, PROMPT_VERSION, *summaries)
+        if self.use_cache:
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                self._record_outcome('merged_summary', 'cache_hit')
+                return cached
+        
+        try:
+            result = self._complete_json(prompt, 0.3, r'\{.*\}', 'merged_summary')
+            if isinstance(result, dict) and _is_text(result.get('summary')):
+                self._record_outcome('merged_summary', 'result')
+                if self.use_cache:
+                    result_cache.set(cache_key, result['summary'])
+                return result['summary']
+        except Exception as e:
+            self._record_error('merged_summary', e)
+        self._record_outcome('merged_summary', 'fallback')
+        return ' '.join(summaries)
+    
+    def analyze_combined(self, text):
+        """Get analysis, topic graph and quiz from a single structured request"""
+        if not self.client:
+            self._record_outcome('combined', 'fallback')
+            return self._split_combined({})
+        
+        cache_key = result_cache.make_key('combined', self.model, PROMPT_VERSION, text)
+        if self.use_cache:
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                self._record_outcome('combined', 'cache_hit')
+                return self._split_combined(cached)
+        
+        prompt = f"""
+        Analyze the following note and return ONE JSON object with these keys:
+        - summary: an EXTENSIVE scholarly summary (15-25 sentences) covering the main topic, background,
+          core concepts and mechanisms, current understanding, practical implications, challenges,
+          future directions and broader significance
+        - key_points: 8-12 comprehensive key points, each 2-3 sentences
+        - difficulty: "Easy", "Medium" or "Hard"
+        - bloom_level: "Remember", "Understand", "Apply", "Analyze", "Evaluate" or "Create"
+        - tags: 8-12 topic keywords including subtopics
+        - learning_objectives: 5-8 specific, measurable learning goals
+        - prerequisites: concepts and knowledge needed, each with a short explanation
+        - applications: real-world uses, examples and case studies
+        - topic_graph: mind map nodes, each {{"id": "...", "label": "...", "children": ["subtopic", ...]}}
+        - quiz_questions: 3-5 multiple choice questions, each
+          {{"question": "...", "options": ["A", "B", "C", "D"], "correct_answer": "A"}}
 
         Text: {text}
 
-        Respond ONLY with valid JSON in this exact format:
-        {{
-            "summary": "EXTENSIVE 15-25 sentence comprehensive summary that thoroughly covers the topic from introduction through historical context, detailed mechanisms, current understanding, practical implications, challenges, future directions, interdisciplinary connections, and concluding with broader significance. This should be a complete, scholarly-level overview that leaves no important aspect unexplored...",
-            "key_points": ["Comprehensive point 1 with detailed explanation spanning 2-3 sentences that fully explores this concept", "Detailed point 2 with extensive context and examples that thoroughly explains the mechanism or idea", ...],
-            "difficulty": "Easy|Medium|Hard",
-            "bloom_level": "Remember|Understand|Apply|Analyze|Evaluate|Create",
-            "tags": ["primary_topic", "subtopic1", "subtopic2", "related_field", "methodology", "application1", "application2", "concept1", ...],
-            "learning_objectives": ["Detailed objective 1 with specific measurable outcome", "Comprehensive objective 2 with clear learning target", ...],
-            "prerequisites": ["Detailed prerequisite 1 with explanation of why it's needed", "Comprehensive prerequisite 2 with context", ...],
-            "applications": ["Detailed real-world application 1 with specific examples and case studies", "Comprehensive application 2 with practical implementation details", ...]
-        }}
+        Respond ONLY with valid JSON containing exactly these keys.
         """
         
+        result = {}
+        try:
+            result = self._valid_sections(self._complete_json(prompt, 0.3, r'\{.*\}', 'combined'))
+            
+            # Re-request only the sections that are missing or invalid
+            missing = [section for section in COMBINED_SCHEMA if section not in result]
+            if missing:
+                repair_prompt = f"""
+                From the following note, return ONE JSON object with ONLY these keys: {', '.join(missing)}.
+                Use the same formats as a full note analysis:
+                topic_graph items are {{"id", "label", "children"}} and quiz_questions items are
+                {{"question", "options" (4 strings), "correct_answer"}}.
+
+                Text: {text}
+
+                Respond ONLY with valid JSON.
+                """
+                repaired = self._valid_sections(self._complete_json(repair_prompt, 0.3, r'\{.*\}', 'combined_repair'))
+                result.update({section: repaired[section] for section in missing if section in repaired})
+        except Exception as e:
+            self._record_error('combined', e)
+        
+        # Only a complete, schema-valid result is cached
+        if len(result) == len(COMBINED_SCHEMA):
+            self._record_outcome('combined', 'result')
+            if self.use_cache:
+                result_cache.set(cache_key, result)
+        else:
+            self._record_outcome('combined', 'partial' if result else 'fallback')
+        return self._split_combined(result)
+    
+    def analyze_note(self, text):
+        """Analyze note for summary, key points, difficulty, and Bloom's level"""
+        prompt = self._analysis_prompt(text)
+        
         if not self.client:
+            self._record_outcome('analysis', 'fallback')
             return self._fallback_analysis()
             
         try:
-            response = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model,
-                temperature=0.3
-            )
-            
-            content = response.choices[0].message.content.strip()
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            result = self._cached_completion('analysis', [text], prompt, 0.3, r'\{.*\}')
+            if result is not None:
+                return result
             else:
                 return self._fallback_analysis()
                 
         except Exception as e:
-            print(f"Groq API error: {e}")
+            self._record_error('analysis', e)
             return self._fallback_analysis()
     
+    def stream_analyze_note(self, text):
+        """
+        Analyze a note while streaming the summary as Groq generates it
+        Yields ('summary_delta', text) events followed by one ('analysis', dict) event
+        """
+        if not self.client:
+            self._record_outcome('analysis', 'fallback')
+            yield 'analysis', self._fallback_analysis()
+            return
+        
+        cache_key = result_cache.make_key('analysis', self.model, PROMPT_VERSION, text)
+        if self.use_cache:
+            cached = result_cache.get(cache_key)
+            if cached is not None and _is_analysis(cached):
+                self._record_outcome('analysis', 'cache_hit')
+                yield 'analysis', cached
+                return
+        
+        try:
+            started = time.perf_counter()
+            stream = self.client.chat.completions.create(
+                messages=[{"role": "user", "content": self._analysis_prompt(text)}],
+                model=self.model,
+                temperature=0.3,
+                stream=True
+            )
+            
+            extractor = JSONStringFieldStreamer('summary')
+            parts = []
+            usage = None
+            for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ''
+                parts.append(delta)
+                summary_delta = extractor.feed(delta)
+                if summary_delta:
+                    yield 'summary_delta', summary_delta
+            metrics.observe('groq_request_seconds', time.perf_counter() - started, stage='analysis_stream')
+            self._record_usage(usage, 'analysis_stream')
+            
+            with metrics.timer('stage_seconds', stage='json_parse'):
+                json_match = re.search(r'\{.*\}', ''.join(parts), re.DOTALL)
+                result = json.loads(json_match.group()) if json_match else None
+            if not _is_analysis(result):
+                self._record_outcome('analysis', 'fallback')
+                yield 'analysis', self._fallback_analysis()
+                return
+            self._record_outcome('analysis', 'result')
+            if self.use_cache:
+                result_cache.set(cache_key, result)
+            yield 'analysis', result
+            
+        except Exception as e:
+            self._record_error('analysis', e)
+            self._record_outcome('analysis', 'fallback')
+            yield 'analysis', self._fallback_analysis()
+    
     def generate_topic_graph(self, text):
         """Generate topic graph for mind mapping"""
         prompt = f"""
@@ -92,24 +422,18 @@ class GroqAIProcessor:
         """
         
         if not self.client:
+            self._record_outcome('topic_graph', 'fallback')
             return self._fallback_graph()
             
         try:
-            response = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model,
-                temperature=0.3
-            )
-            
-            content = response.choices[0].message.content.strip()
-            json_match = re.search(r'\[.*\]', content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            result = self._cached_completion('topic_graph', [text], prompt, 0.3, r'\[.*\]')
+            if result is not None:
+                return result
             else:
                 return self._fallback_graph()
                 
         except Exception as e:
-            print(f"Groq API error: {e}")
+            self._record_error('topic_graph', e)
             return self._fallback_graph()
     
     def generate_quiz(self, text):
@@ -135,32 +459,25 @@ class GroqAIProcessor:
         """
         
         if not self.client:
+            self._record_outcome('quiz', 'fallback')
             return self._fallback_quiz()
             
         try:
-            response = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model,
-                temperature=0.4
-            )
-            
-            content = response.choices[0].message.content.strip()
-            json_match = re.search(r'\[.*\]', content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            result = self._cached_completion('quiz', [text], prompt, 0.4, r'\[.*\]')
+            if result is not None:
+                return result
             else:
                 return self._fallback_quiz()
                 
         except Exception as e:
-            print(f"Groq API error: {e}")
+            self._record_error('quiz', e)
             return self._fallback_quiz()
     
-    def compare_notes(self, note1, note2):
-        """Compare two notes semantically"""
+    def summarize_comparison(self, note1, note2, similarity_score):
+        """Prose comparison of two notes, or None without an answer; the score comes from utils.similarity"""
         prompt = f"""
-        Compare these two notes and return:
-        1. Similarity score (0-100)
-        2. Comparison summary explaining similarities and differences
+        Compare these two notes and return a comparison summary explaining similarities and differences.
+        Their measured similarity is {similarity_score}% (shared wording); do not give another score.
 
         Note A: {note1}
 
@@ -168,31 +485,158 @@ class GroqAIProcessor:
 
         Respond ONLY with valid JSON:
         {{
-            "similarity_score": 85,
             "comparison_summary": "Both notes discuss... However, Note A focuses on... while Note B emphasizes..."
         }}
         """
         
         if not self.client:
-            return {"similarity_score": 50, "comparison_summary": "Comparison unavailable - API key not configured"}
+            self._record_outcome('comparison', 'fallback')
+            return None
             
         try:
+            result = self._cached_completion('comparison', [note1, note2], prompt, 0.3, r'\{.*\}')
+        except Exception as e:
+            self._record_error('comparison', e)
+            return None
+        summary = result.get('comparison_summary') if isinstance(result, dict) else None
+        return summary if isinstance(summary, str) and summary.strip() else None
+    
+    def summarize_comparisons(self, pairs):
+        """summarize_comparison of several (note1, note2, similarity_score) pairs, run in parallel like the stages"""
+        if not settings.ANALYSIS_CONCURRENT_STAGES or not self.client or len(pairs) < 2:
+            return [self.summarize_comparison(*pair) for pair in pairs]
+        executor = get_stage_executor()
+        summarize = lambda pair: self.summarize_comparison(*pair)
+        futures = [executor.submit(metrics.in_context(_run_stage_in_thread), summarize, pair) for pair in pairs]
+        return [future.result() for future in futures]
+    
+    def _analysis_prompt(self, text):
+        """Prompt for the summary/key points/metadata stage"""
+        return f"""
+        Analyze the following note and return a comprehensive JSON response with:
+        1. An EXTENSIVE detailed summary (15-25 sentences minimum) that should include:
+           - Introduction to the main topic and its significance
+           - Historical context or background information
+           - Detailed explanation of core concepts and mechanisms
+           - Relationships between different components or ideas
+           - Current understanding and recent developments
+           - Practical implications and real-world relevance
+           - Challenges, limitations, or controversies if applicable
+           - Future directions or potential developments
+           - Connections to related fields or disciplines
+           - Conclusion emphasizing the importance and broader impact
+        
+        2. 8-12 comprehensive key points (each should be 2-3 sentences explaining the concept in detail)
+        3. Difficulty level (Easy, Medium, or Hard) with justification
+        4. Bloom's Taxonomy level (Remember, Understand, Apply, Analyze, Evaluate, or Create) with reasoning
+        5. Tags (array of 8-12 relevant topic keywords including subtopics)
+        6. Learning objectives (5-8 specific, measurable learning goals)
+        7. Prerequisites (detailed concepts and knowledge needed)
+        8. Applications (comprehensive real-world uses, examples, and case studies)
+
+        Text: {text}
+
+        Respond ONLY with valid JSON in this exact format:
+        {{
+            "summary": "EXTENSIVE 15-25 sentence comprehensive summary that thoroughly covers the topic from introduction through historical context, detailed mechanisms, current understanding, practical implications, challenges, future directions, interdisciplinary connections, and concluding with broader significance. This should be a complete, scholarly-level overview that leaves no important aspect unexplored...",
+            "key_points": ["Comprehensive point 1 with detailed explanation spanning 2-3 sentences that fully explores this concept", "Detailed point 2 with extensive context and examples that thoroughly explains the mechanism or idea", ...],
+            "difficulty": "Easy|Medium|Hard",
+            "bloom_level": "Remember|Understand|Apply|Analyze|Evaluate|Create",
+            "tags": ["primary_topic", "subtopic1", "subtopic2", "related_field", "methodology", "application1", "application2", "concept1", ...],
+            "learning_objectives": ["Detailed objective 1 with specific measurable outcome", "Comprehensive objective 2 with clear learning target", ...],
+            "prerequisites": ["Detailed prerequisite 1 with explanation of why it's needed", "Comprehensive prerequisite 2 with context", ...],
+            "applications": ["Detailed real-world application 1 with specific examples and case studies", "Comprehensive application 2 with practical implementation details", ...]
+        }}
+        """
+
+    def _cached_completion(self, stage, texts, prompt, temperature, pattern):
+        """Return the parsed JSON for a stage, asking Groq only on a cache miss; None unless it fits STAGE_SCHEMAS"""
+        is_valid = STAGE_SCHEMAS[stage]
+        cache_key = result_cache.make_key(stage, self.model, PROMPT_VERSION, *texts)
+        if self.use_cache:
+            cached = result_cache.get(cache_key)
+            if cached is not None and is_valid(cached):
+                self._record_outcome(stage, 'cache_hit')
+                return cached
+        
+        try:
+            result = self._complete_json(prompt, temperature, pattern, stage)
+        except Exception:
+            self._record_outcome(stage, 'fallback')
+            raise
+        
+        if result is None or not is_valid(result):
+            if result is not None:
+                print(f"Groq reply for {stage} does not match its schema, using fallback")
+            self._record_outcome(stage, 'fallback')
+            return None
+        
+        self._record_outcome(stage, 'result')
+        # Only real model output is cached, never a fallback
+        if self.use_cache:
+            result_cache.set(cache_key, result)
+        return result
+    
+    def _record_outcome(self, stage, outcome):
+        """Count whether a stage was answered by the model, the cache or a fallback"""
+        metrics.increment('groq_stage_results_total', stage=stage, outcome=outcome)
+    
+    def _record_error(self, stage, error):
+        """Log a failed Groq call and count it by stage and exception type"""
+        print(f"Groq API error: {error}")
+        metrics.increment('groq_errors_total', stage=stage, error=type(error).__name__)
+    
+    def _complete_json(self, prompt, temperature, pattern, stage='other'):
+        """Send a prompt to Groq and parse the JSON in its reply, or return None"""
+        with metrics.timer('groq_request_seconds', stage=stage):
             response = self.client.chat.completions.create(
                 messages=[{"role": "user", "content": prompt}],
                 model=self.model,
-                temperature=0.3
+                temperature=temperature
             )
+        self._record_usage(response.usage, stage)
+        
+        content = response.choices[0].message.content.strip()
+        with metrics.timer('stage_seconds', stage='json_parse'):
+            # Extract JSON from response
+            json_match = re.search(pattern, content, re.DOTALL)
+            if not json_match:
+                return None
             
-            content = response.choices[0].message.content.strip()
-            json_match = re.search(r'\{.*\}', content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                return {"similarity_score": 50, "comparison_summary": "Unable to analyze comparison"}
-                
-        except Exception as e:
-            print(f"Groq API error: {e}")
-            return {"similarity_score": 0, "comparison_summary": "Error in comparison analysis"}
+            return json.loads(json_match.group())
+    
+    def _record_usage(self, usage, stage='other'):
+        """Add the token counts reported by Groq to this processor's totals and the metrics"""
+        with self._usage_lock:
+            self.usage['requests'] += 1
+            for field in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+                value = getattr(usage, field, 0)
+                if isinstance(value, int):
+                    self.usage[field] += value
+                    if field != 'total_tokens':
+                        metrics.increment('groq_tokens_total', value, stage=stage, type=field[:-len('_tokens')])
+    
+    @staticmethod
+    def _valid_sections(result):
+        """Keep only the combined-response sections that pass the schema"""
+        if not isinstance(result, dict):
+            return {}
+        return {
+            section: result[section]
+            for section, is_valid in COMBINED_SCHEMA.items()
+            if section in result and is_valid(result[section])
+        }
+    
+    def _split_combined(self, result):
+        """Split a combined result into (analysis, topic_graph, quiz), filling gaps with fallbacks"""
+        analysis = self._fallback_analysis()
+        analysis.update({
+            section: value for section, value in result.items()
+            if section not in ('topic_graph', 'quiz_questions')
+        })
+        topic_graph = result.get('topic_graph') or self._fallback_graph()
+        quiz_questions = result.get('quiz_questions') or self._fallback_quiz()
+        return analysis, topic_graph, quiz_questions
     
     def _fallback_analysis(self):
         """Fallback response when API fails"""
@@ -0,0 +1,210 @@
+"""
+Process-wide Groq client with connection pooling, rate limiting and retries
+"""
+
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+from groq import Groq, APIConnectionError, APIStatusError
+from django.conf import settings
+
+from . import metrics, standin
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+class RateLimitTimeout(Exception):
+    """Raised when the rate limit would delay a request past its deadline"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when too little of the deadline is left to start another attempt"""
+
+
+def parse_duration(value):
+    """Parse Groq reset headers such as '2m59.56s', '7.66s' or '120ms' into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)  # retry-after is plain seconds
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+class TokenBucket:
+    """Client-side copy of one server-side limit, resynchronised from response headers"""
+
+    def __init__(self):
+        self.capacity = None  # Unknown until the first response
+        self.level = None
+        self.refill_rate = 0.0  # Units per second
+        self.updated_at = time.monotonic()
+
+    def observe(self, limit, remaining, reset_seconds):
+        """Adopt the server's view of the bucket"""
+        if limit is None or remaining is None:
+            return
+        self.capacity = limit
+        self.level = remaining
+        if reset_seconds:
+            # Groq refills continuously; "reset" is the time until the bucket is full again
+            self.refill_rate = max(limit - remaining, 0) / reset_seconds
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.level is not None:
+            self.level = min(self.capacity, self.level + self.refill_rate * (now - self.updated_at))
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """Seconds until amount units are available"""
+        self._refill()
+        if self.level is None or self.level >= amount:
+            return 0.0
+        if self.refill_rate <= 0:
+            return float('inf')
+        return (amount - self.level) / self.refill_rate
+
+    def consume(self, amount):
+        if self.level is not None:
+            self.level -= amount
+
+
+class RateLimiter:
+    """Request and token buckets driven by Groq's x-ratelimit-* response headers"""
+
+    def __init__(self):
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self._lock = threading.Lock()
+
+    def update(self, headers):
+        """Resynchronise both buckets from a response's headers"""
+        def number(name):
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        with self._lock:
+            self.requests.observe(
+                number('x-ratelimit-limit-requests'),
+                number('x-ratelimit-remaining-requests'),
+                parse_duration(headers.get('x-ratelimit-reset-requests'))
+            )
+            self.tokens.observe(
+                number('x-ratelimit-limit-tokens'),
+                number('x-ratelimit-remaining-tokens'),
+                parse_duration(headers.get('x-ratelimit-reset-tokens'))
+            )
+
+    def acquire(self, estimated_tokens, deadline):
+        """Block until a request of about estimated_tokens fits, or raise RateLimitTimeout"""
+        while True:
+            with self._lock:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+                if wait == 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(estimated_tokens)
+                    return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"Groq rate limit would delay the request by {wait:.1f}s")
+            metrics.increment('groq_rate_limit_waits_total')
+            time.sleep(wait)
+
+
+class ResilientGroqClient:
+    """
+    Wraps a Groq client with rate limiting, jittered exponential backoff and a deadline
+    Exposes the same chat.completions.create() interface as the Groq SDK
+    """
+
+    def __init__(self, client, rate_limiter=None):
+        self._client = client
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat_completion))
+
+    def create_chat_completion(self, **kwargs):
+        """
+        Create a chat completion, retrying 429, 5xx and connection errors until the deadline
+        Each attempt's timeout is cut to the time left, so the whole call stays within GROQ_DEADLINE.
+        """
+        deadline = time.monotonic() + settings.GROQ_DEADLINE
+        # Rough token estimate (about 4 characters per token) for the token bucket
+        estimated_tokens = sum(len(message.get('content', '')) for message in kwargs.get('messages', [])) // 4
+        attempt = 0
+        error = None
+        while True:
+            attempt += 1
+            self.rate_limiter.acquire(estimated_tokens, deadline)
+            remaining = deadline - time.monotonic()
+            if remaining < settings.GROQ_MIN_ATTEMPT_SECONDS:
+                if error is not None:
+                    raise error
+                raise DeadlineExceeded(f"Only {remaining:.1f}s left of the Groq deadline")
+            try:
+                raw = self._client.chat.completions.with_raw_response.create(
+                    **{**kwargs, 'timeout': min(settings.GROQ_TIMEOUT, remaining)}
+                )
+                self.rate_limiter.update(raw.headers)
+                return raw.parse()
+            except APIStatusError as e:
+                self.rate_limiter.update(e.response.headers)
+                if e.status_code != 429 and e.status_code < 500:
+                    raise
+                error, reason = e, str(e.status_code)
+                retry_after = parse_duration(e.response.headers.get('retry-after'))
+            except APIConnectionError as e:  # Includes timeouts
+                error, reason, retry_after = e, 'connection', None
+
+            # Full jitter: sleep a random time up to the exponential backoff ceiling
+            delay = retry_after if retry_after is not None else random.uniform(
+                0, min(settings.GROQ_BACKOFF_CAP, settings.GROQ_BACKOFF_BASE * 2 ** (attempt - 1))
+            )
+            if attempt > settings.GROQ_MAX_RETRIES or time.monotonic() + delay > deadline:
+                raise error
+            metrics.increment('groq_retries_total', reason=reason)
+            time.sleep(delay)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_groq_client():
+    """Return the shared Groq client for this process, or None when no API key is configured"""
+    global _client
+    if settings.EXTERNAL_SERVICES == 'replay':
+        with _client_lock:
+            if _client is None:
+                # Recorded responses behind the same rate limiting and retries as the real client
+                _client = ResilientGroqClient(standin.ReplayGroqClient())
+            return _client
+    if not settings.GROQ_API_KEY:
+        return None
+    with _client_lock:
+        if _client is None:
+            http_client = httpx.Client(
+                timeout=settings.GROQ_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.GROQ_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GROQ_MAX_CONNECTIONS,
+                    keepalive_expiry=60
+                )
+            )
+            # Retries are handled by ResilientGroqClient, not the SDK
+            groq = Groq(api_key=settings.GROQ_API_KEY, max_retries=0, http_client=http_client)
+            if settings.EXTERNAL_SERVICES == 'record':
+                groq = standin.RecordingGroqClient(groq)
+            _client = ResilientGroqClient(groq)
+        return _client
@@ -0,0 +1,175 @@
+"""
+In-memory image preprocessing for OCR
+Shrinks photos to what OCR needs (grayscale, bounded resolution, margins cropped)
+and encodes them in the smallest format each provider accepts
+"""
+
+import io
+import math
+import os
+
+from django.conf import settings
+from PIL import Image, ImageEnhance, ImageOps
+
+
+ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+class PreparedImage:
+    """Encodings of one preprocessed image, keyed by format ('PNG', 'JPEG', ...)"""
+
+    def __init__(self, encodings, original_bytes=0, size=None):
+        self.encodings = encodings
+        self.original_bytes = original_bytes
+        self.size = size
+
+    def for_provider(self, provider):
+        """Smallest encoding the provider accepts (any encoding if none matches)"""
+        accepted = [data for fmt, data in self.encodings.items() if fmt in provider.formats]
+        return min(accepted or self.encodings.values(), key=len)
+
+
+def open_image(source):
+    """
+    Open image bytes or a path lazily and refuse decompression bombs
+    Only the header has been read when the pixel count is checked
+    """
+    try:
+        image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"Image is too large to process: {e}")
+    width, height = image.size
+    if width * height > settings.OCR_MAX_INPUT_PIXELS:
+        image.close()
+        raise ValueError(
+            f"Image is too large to process ({width}x{height} pixels). "
+            f"Maximum is {settings.OCR_MAX_INPUT_PIXELS} pixels."
+        )
+    return image
+
+
+def target_scale(image):
+    """Scale factor that fits the pixel budget and target DPI, upscaling tiny images"""
+    width, height = image.size
+    scale = min(1.0, math.sqrt(settings.OCR_MAX_PIXELS / (width * height)))
+    dpi = image.info.get('dpi')
+    if dpi and dpi[0] and dpi[0] > settings.OCR_TARGET_DPI:
+        scale = min(scale, settings.OCR_TARGET_DPI / float(dpi[0]))
+    if width < 300 or height < 300:
+        # OCR works better on larger images
+        scale = max(scale, 300 / width, 300 / height)
+    return scale
+
+
+def otsu_threshold(image):
+    """Threshold that best separates the grayscale histogram into ink and paper"""
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(level * count for level, count in enumerate(histogram))
+    sum_below = weight_below = 0
+    best_threshold, best_variance = 128, 0.0
+    for level, count in enumerate(histogram):
+        weight_below += count
+        if weight_below == 0:
+            continue
+        weight_above = total - weight_below
+        if weight_above == 0:
+            break
+        sum_below += level * count
+        mean_below = sum_below / weight_below
+        mean_above = (sum_all - sum_below) / weight_above
+        variance = weight_below * weight_above * (mean_below - mean_above) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+
+def crop_margins(image, padding=10):
+    """Crop the blank border around the text of a grayscale image"""
+    # Anything noticeably darker than the paper counts as content
+    content = ImageOps.autocontrast(image).point(lambda level: 255 if level < 200 else 0)
+    box = content.getbbox()
+    if not box:
+        return image
+    left, top, right, bottom = box
+    width, height = image.size
+    box = (max(left - padding, 0), max(top - padding, 0), min(right + padding, width), min(bottom + padding, height))
+    return image.crop(box) if box != (0, 0, width, height) else image
+
+
+def preprocess_image(source, formats=('PNG', 'JPEG')):
+    """
+    Decode, normalise and encode an image for OCR, entirely in memory
+    Returns a PreparedImage with one encoding per requested format
+    """
+    original_bytes = os.path.getsize(source) if isinstance(source, str) else len(source)
+    with open_image(source) as image:
+        orientation = image.getexif().get(ORIENTATION_TAG)
+        scale = target_scale(image)
+        size = (max(round(image.width * scale), 1), max(round(image.height * scale), 1))
+        if scale < 1:
+            # JPEG can decode straight to grayscale at a reduced size
+            image.draft('L', size)
+        if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+            # Transparent areas would turn black; put them on white paper instead
+            image = image.convert('RGBA')
+            image = Image.alpha_composite(Image.new('RGBA', image.size, 'white'), image)
+        image = image.convert('L')
+        if image.size != size:
+            image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if orientation in EXIF_TRANSPOSE:
+            # Phone photos are often stored rotated
+            image = image.transpose(EXIF_TRANSPOSE[orientation])
+
+        image = ImageOps.autocontrast(image, cutoff=1)
+        image = ImageEnhance.Sharpness(image).enhance(1.1)
+        image = crop_margins(image)
+
+        if settings.OCR_BINARIZE:
+            threshold = otsu_threshold(image)
+            image = image.point(lambda level: 255 if level > threshold else 0).convert('1')
+
+        encodings = {}
+        for fmt in formats:
+            buffer = io.BytesIO()
+            if fmt == 'JPEG':
+                image.convert('L').save(buffer, 'JPEG', quality=settings.OCR_JPEG_QUALITY)
+            else:
+                image.save(buffer, fmt)
+            encodings[fmt] = buffer.getvalue()
+        return PreparedImage(encodings, original_bytes=original_bytes, size=image.size)
+
+
+def perceptual_hash(source, hash_size=16):
+    """
+    Difference hash (dHash) of an image as a hex string
+    Each bit says whether a pixel is brighter than its right neighbour on a
+    tiny grayscale thumbnail, so re-encoded or resized copies hash the same
+    """
+    with open_image(source) as image:
+        image.draft('L', (hash_size + 1, hash_size))
+        thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = list(thumbnail.getdata())
+    bits = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            left = pixels[row * (hash_size + 1) + column]
+            right = pixels[row * (hash_size + 1) + column + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hash_neighbours(hex_hash):
+    """Every hash one bit away, so near-identical copies still match in an exact-key cache"""
+    bits = int(hex_hash, 16)
+    width = len(hex_hash)
+    return [f"{bits ^ (1 << position):0{width}x}" for position in range(width * 4)]
@@ -0,0 +1,96 @@
+"""
+Reduce step for map-reduce analysis of long documents
+Merges per-chunk analyses, topic graphs and quizzes into one result
+"""
+
+import re
+from collections import Counter
+
+DIFFICULTY_ORDER = ['Easy', 'Medium', 'Hard']
+BLOOM_ORDER = ['Remember', 'Understand', 'Apply', 'Analyze', 'Evaluate', 'Create']
+
+
+def _normalize(value):
+    """Comparison key that ignores case, punctuation and spacing"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', str(value).casefold()).split())
+
+
+def dedupe(items, limit=None):
+    """Drop near-identical strings, keeping first-seen order"""
+    seen = set()
+    unique = []
+    for item in items:
+        key = _normalize(item)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique[:limit] if limit else unique
+
+
+def _interleave(lists):
+    """Round-robin over several lists so every chunk is represented early"""
+    merged = []
+    for position in range(max((len(items) for items in lists), default=0)):
+        merged.extend(items[position] for items in lists if position < len(items))
+    return merged
+
+
+def _most_common_level(values, order):
+    """Most frequent level; ties go to the more demanding one"""
+    counts = Counter(value for value in values if value in order)
+    if not counts:
+        return None
+    return max(counts, key=lambda value: (counts[value], order.index(value)))
+
+
+def merge_tags(tag_lists, limit=12):
+    """Rank tags by how many chunks mention them"""
+    counts = Counter()
+    labels = {}
+    for tags in tag_lists:
+        for tag in dedupe(tags):
+            key = _normalize(tag)
+            counts[key] += 1
+            labels.setdefault(key, tag)
+    return [labels[key] for key, _ in counts.most_common(limit)]
+
+
+def merge_analyses(analyses):
+    """Merge per-chunk analyses (the summary is merged separately)"""
+    return {
+        'key_points': dedupe(_interleave([a.get('key_points', []) for a in analyses]), limit=15),
+        'difficulty': _most_common_level([a.get('difficulty') for a in analyses], DIFFICULTY_ORDER) or 'Medium',
+        'bloom_level': _most_common_level([a.get('bloom_level') for a in analyses], BLOOM_ORDER) or 'Understand',
+        'tags': merge_tags([a.get('tags', []) for a in analyses]),
+        'learning_objectives': dedupe(_interleave([a.get('learning_objectives', []) for a in analyses]), limit=10),
+        'prerequisites': dedupe(_interleave([a.get('prerequisites', []) for a in analyses]), limit=10),
+        'applications': dedupe(_interleave([a.get('applications', []) for a in analyses]), limit=10),
+    }
+
+
+def merge_topic_graphs(graphs):
+    """Union topic graphs, merging nodes with the same label and their children"""
+    nodes = {}
+    for graph in graphs:
+        for node in graph:
+            if not isinstance(node, dict):
+                continue
+            key = _normalize(node.get('label') or node.get('id'))
+            if not key:
+                continue
+            if key not in nodes:
+                nodes[key] = {'id': node.get('id') or key, 'label': node.get('label') or node.get('id'), 'children': []}
+            nodes[key]['children'] = dedupe(nodes[key]['children'] + list(node.get('children', [])))
+    return list(nodes.values())
+
+
+def merge_quizzes(quizzes, limit=10):
+    """Take questions from every chunk in turn, skipping duplicates"""
+    seen = set()
+    merged = []
+    for question in _interleave(quizzes):
+        key = _normalize(question.get('question', '')) if isinstance(question, dict) else ''
+        if key and key not in seen:
+            seen.add(key)
+            merged.append(question)
+    return merged[:limit]
@@ -0,0 +1,334 @@
+"""
+Lightweight metrics: labelled counters and latency histograms
+Every process keeps its own values and writes them to a file in METRICS_DIR at most
+once per METRICS_FLUSH_INTERVAL; render() adds up the files of all gunicorn workers
+(and the job worker) into the Prometheus text format served at /api/metrics/
+Files of exited processes are merged into one retired total and removed on scrape
+Inside breakdown(), observations are also added up per stage for the current request
+"""
+
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited processes' files are kept instead of merged
+    fcntl = None
+
+# Seconds, from a cache hit up to a slow LLM completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_counters = defaultdict(float)
+_histograms = {}  # key -> {'buckets': [...], 'counts': [...], 'sum': float, 'count': int}
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_process_name = None  # (pid, random suffix), so a reused PID never takes over an old file
+_breakdown = contextvars.ContextVar('metrics_breakdown', default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    """Add to a labelled counter"""
+    with _lock:
+        _counters[_key(name, labels)] += amount
+    _maybe_flush()
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Record one observation (usually seconds) in a labelled histogram"""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][index] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+    current = _breakdown.get()
+    if current is not None:
+        current.add(name, labels, value)
+    _maybe_flush()
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe how long the block takes, whether or not it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+class Breakdown:
+    """Seconds and calls per stage observed while handling one request"""
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, labels, value):
+        label = labels.get('stage') or labels.get('provider')
+        if name == 'stage_seconds':
+            stage = label
+        else:
+            stage = f"{name[:-len('_seconds')] if name.endswith('_seconds') else name}:{label}"
+        with self.lock:
+            entry = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += value
+            entry['calls'] += 1
+
+    def as_dict(self):
+        """{stage: {'ms': total, 'calls': n}}, slowest first"""
+        with self.lock:
+            items = sorted(self.stages.items(), key=lambda item: -item[1]['seconds'])
+            return {stage: {'ms': round(entry['seconds'] * 1000, 1), 'calls': entry['calls']} for stage, entry in items}
+
+
+@contextmanager
+def breakdown():
+    """Collect a per-stage Breakdown of everything observed in the block"""
+    current = Breakdown()
+    token = _breakdown.set(current)
+    try:
+        yield current
+    finally:
+        _breakdown.reset(token)
+
+
+def in_context(function):
+    """
+    Wrap a function submitted to a thread pool so its observations still count
+    towards the submitting request's breakdown (submit each call separately)
+    """
+    return partial(contextvars.copy_context().run, function)
+
+
+def get(name, **labels):
+    """Current value of a labelled counter in this process"""
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def get_histogram(name, **labels):
+    """Copy of a labelled histogram in this process, or None"""
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        return None if histogram is None else {**histogram, 'counts': list(histogram['counts'])}
+
+
+def snapshot():
+    """Copy of every counter as {(name, ((label, value), ...)): count}"""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    """Clear all counters and histograms of this process (used by tests)"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+    path = _process_file()
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def _process_file():
+    global _process_name
+    if not settings.METRICS_DIR:
+        return None
+    pid = os.getpid()
+    if _process_name is None or _process_name[0] != pid:
+        _process_name = (pid, uuid.uuid4().hex[:8])
+    return os.path.join(settings.METRICS_DIR, f'metrics-{pid}-{_process_name[1]}.json')
+
+
+def _maybe_flush():
+    if settings.METRICS_DIR and time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """Write this process's values to its file in METRICS_DIR (atomically replaced)"""
+    global _last_flush
+    path = _process_file()
+    if path is None:
+        return
+    with _flush_lock:
+        _last_flush = time.monotonic()
+        with _lock:
+            data = {
+                'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+                'histograms': [[name, labels, {**h, 'counts': list(h['counts'])}] for (name, labels), h in _histograms.items()],
+            }
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            _write(path, data)
+        except OSError as e:
+            print(f"Metrics flush failed: {e}")
+
+
+def _write(path, data):
+    """Write JSON to path through a temporary file, so readers never see half of it"""
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # Removed or being replaced
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by another user
+    return True
+
+
+def _add(counters, histograms, data):
+    """Add the values of one metrics file to the running totals"""
+    for name, labels, value in data['counters']:
+        counters[name, tuple(map(tuple, labels))] += value
+    for name, labels, histogram in data['histograms']:
+        key = name, tuple(map(tuple, labels))
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = {**histogram, 'counts': list(histogram['counts'])}
+        elif total['buckets'] == histogram['buckets']:
+            total['counts'] = [a + b for a, b in zip(total['counts'], histogram['counts'])]
+            total['sum'] += histogram['sum']
+            total['count'] += histogram['count']
+
+
+@contextmanager
+def _scrape_lock():
+    """Let one scrape at a time read METRICS_DIR, so no file is read while it is being retired"""
+    if fcntl is None:
+        yield
+        return
+    try:
+        lock = open(os.path.join(settings.METRICS_DIR, 'retired.lock'), 'a')
+    except OSError as e:
+        print(f"Metrics scrape lock unavailable: {e}")
+        yield
+        return
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _pid(path):
+    """PID in a metrics-<pid>-<suffix>.json (or older metrics-<pid>.json) file name"""
+    return int(os.path.basename(path).split('-')[1].split('.')[0])
+
+
+def _retire_exited_processes(paths):
+    """
+    Merge the files of processes that have exited into retired.json and remove them,
+    so METRICS_DIR does not grow with every worker restart and totals never go backwards;
+    returns the paths that are left
+    """
+    exited = [path for path in paths if not _is_running(_pid(path))]
+    if not exited:
+        return paths
+    retired = os.path.join(settings.METRICS_DIR, 'retired.json')
+    counters, histograms = defaultdict(float), {}
+    for path in [retired, *exited]:
+        data = _read(path)
+        if data is not None:
+            _add(counters, histograms, data)
+    _write(retired, {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, histogram] for (name, labels), histogram in histograms.items()],
+    })
+    for path in exited:
+        os.remove(path)
+    return [path for path in paths if path not in exited]
+
+
+def collect():
+    """
+    (counters, histograms) summed over every process that has written to METRICS_DIR,
+    including the retired total of processes that have exited
+    """
+    if not settings.METRICS_DIR:
+        with _lock:
+            return dict(_counters), {key: {**h, 'counts': list(h['counts'])} for key, h in _histograms.items()}
+
+    flush()
+    counters = defaultdict(float)
+    histograms = {}
+    with _scrape_lock():
+        paths = glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json'))
+        if fcntl is not None:  # Merging is only safe under the lock
+            try:
+                paths = _retire_exited_processes(paths)
+            except OSError as e:
+                print(f"Merging metrics of exited processes failed: {e}")
+        for path in [os.path.join(settings.METRICS_DIR, 'retired.json'), *paths]:
+            data = _read(path)
+            if data is not None:
+                _add(counters, histograms, data)
+    return dict(counters), histograms
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{label}="{escape(value)}"' for label, value in pairs) + '}'
+
+
+def render():
+    """All workers' metrics in the Prometheus text exposition format"""
+    counters, histograms = collect()
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {name} counter')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {histogram["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(histogram["sum"])}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
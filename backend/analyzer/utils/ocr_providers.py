@@ -0,0 +1,254 @@
+"""
+OCR provider registry
+Providers are configured in settings.OCR_PROVIDERS and tried in order of
+priority, then cost: the local engine first, free web services as a fallback
+"""
+
+import base64
+import multiprocessing
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import standin
+
+
+def image_mime_type(image_data):
+    """Detect the image format from its leading bytes"""
+    if image_data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if image_data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if image_data[:4] == b'GIF8':
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+def upload_file(image_data):
+    """Multipart (filename, content, content type) tuple for in-memory image bytes"""
+    mime_type = image_mime_type(image_data)
+    extension = mime_type.split('/')[-1] if mime_type.startswith('image/') else 'bin'
+    return (f'image.{extension}', image_data, mime_type)
+
+
+def parsed_text(result):
+    """Join the text of every OCR.space parsed result"""
+    text_parts = []
+    for parsed_result in result.get('ParsedResults', []):
+        if parsed_result.get('ParsedText'):
+            text_parts.append(parsed_result['ParsedText'])
+    return '\n'.join(text_parts)
+
+
+class OCRProvider:
+    """
+    Base class for OCR providers
+    priority orders providers (lower first); cost breaks ties and is reported in the status
+    hedge_delay is how long the race waits on this provider before starting the next one
+    formats are the image encodings it accepts; max_bytes is its upload size limit
+    """
+
+    remote = True
+    formats = ('PNG', 'JPEG')
+    max_bytes = None
+
+    def __init__(self, name, priority=100, cost=0, hedge_delay=None, timeout=None, **options):
+        self.name = name
+        self.priority = priority
+        self.cost = cost
+        self.hedge_delay = settings.OCR_HEDGE_DELAY if hedge_delay is None else hedge_delay
+        self.timeout = settings.OCR_PROVIDER_TIMEOUT if timeout is None else timeout
+        self.options = options
+
+    def is_available(self):
+        """Whether the provider can run on this host at all"""
+        return True
+
+    def extract(self, image_data):
+        """Return the text found in the image bytes"""
+        raise NotImplementedError
+
+
+class OCRSpaceProvider(OCRProvider):
+    """OCR.space API - 100% FREE, no API key required!"""
+
+    max_bytes = 1024 * 1024  # Free tier limit
+
+    def extract(self, image_data):
+        url = 'https://api.ocr.space/parse/image'
+
+        files = {'file': upload_file(image_data)}
+        data = {
+            'apikey': 'helloworld',  # Free public API key
+            'language': 'eng',
+            'isOverlayRequired': False,
+            'detectOrientation': True,
+            'scale': True,
+            'OCREngine': 2,  # Use engine 2 for better accuracy
+            'filetype': 'auto'
+        }
+
+        response = standin.http_post(url, files=files, data=data, timeout=self.timeout)
+        response.raise_for_status()
+
+        result = response.json()
+
+        if result.get('IsErroredOnProcessing'):
+            raise Exception(f"OCR.space error: {result.get('ErrorMessage', 'Unknown error')}")
+
+        return parsed_text(result)
+
+
+class APINinjasProvider(OCRProvider):
+    """API Ninjas - FREE OCR service, no API key required for basic use"""
+
+    def extract(self, image_data):
+        url = 'https://api.api-ninjas.com/v1/imagetotext'
+
+        files = {'image': upload_file(image_data)}
+        # No API key required for basic usage
+        response = standin.http_post(url, files=files, timeout=self.timeout)
+
+        if response.status_code == 200:
+            result = response.json()
+            text_parts = []
+            for item in result:
+                if isinstance(item, dict) and 'text' in item:
+                    text_parts.append(item['text'])
+                elif isinstance(item, str):
+                    text_parts.append(item)
+
+            return '\n'.join(text_parts)
+        else:
+            raise Exception(f"API Ninjas OCR failed: {response.status_code}")
+
+
+class FreeOCRWebProvider(OCRProvider):
+    """Free OCR Web Service - Another completely free option"""
+
+    def extract(self, image_data):
+        url = 'https://www.freeocr.com/api/upload'
+
+        try:
+            files = {'file': upload_file(image_data)}
+            data = {
+                'language': 'eng',
+                'output': 'txt'
+            }
+
+            response = standin.http_post(url, files=files, data=data, timeout=self.timeout)
+
+            if response.status_code == 200:
+                # Parse the response - this service returns plain text
+                return response.text.strip()
+            else:
+                raise Exception(f"Free OCR Web Service failed: {response.status_code}")
+
+        except Exception as e:
+            raise Exception(f"OCR Web Service error: {str(e)}")
+
+
+class OCRSpaceDataURLProvider(OCRProvider):
+    """OCR.space with the image sent as a base64 data URL, using its other engine as a backup"""
+
+    max_bytes = 1024 * 1024 * 3 // 4  # Free tier limit applies after base64 encoding
+
+    def extract(self, image_data):
+        # Convert image to base64 for web-based OCR
+        encoded = base64.b64encode(image_data).decode('utf-8')
+
+        # Use a simple OCR service that accepts base64
+        url = 'https://api.ocr.space/parse/imageurl'
+
+        # Create a data URL
+        data_url = f"data:{image_mime_type(image_data)};base64,{encoded}"
+
+        payload = {
+            'apikey': 'helloworld',
+            'url': data_url,
+            'language': 'eng',
+            'isOverlayRequired': False,
+            'OCREngine': 1  # Use engine 1 as fallback
+        }
+
+        response = standin.http_post(url, data=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+        result = response.json()
+
+        if result.get('IsErroredOnProcessing'):
+            raise Exception(f"Image to text OCR error: {result.get('ErrorMessage', 'Unknown error')}")
+
+        return parsed_text(result)
+
+
+_local_executor = None
+_local_executor_lock = threading.Lock()
+
+
+def get_local_ocr_executor():
+    """Return the process pool that runs the local OCR engine, sized to the CPUs it may use"""
+    global _local_executor
+    with _local_executor_lock:
+        if _local_executor is None:
+            _local_executor = ProcessPoolExecutor(
+                max_workers=settings.OCR_LOCAL_PROCESSES,
+                mp_context=multiprocessing.get_context(settings.PDF_PROCESS_START_METHOD)
+            )
+        return _local_executor
+
+
+def run_tesseract(command, image_data, language, timeout):
+    """Run the tesseract binary on image bytes (stdin to stdout) inside a pool process"""
+    completed = subprocess.run(
+        [command, 'stdin', 'stdout', '-l', language],
+        input=image_data,
+        capture_output=True,
+        timeout=timeout
+    )
+    if completed.returncode != 0:
+        raise Exception(f"tesseract failed: {completed.stderr.decode('utf-8', 'replace').strip()[:200]}")
+    return completed.stdout.decode('utf-8', 'replace')
+
+
+class TesseractProvider(OCRProvider):
+    """
+    Local, offline OCR with the tesseract binary already installed on the host
+    No upload over the internet; pool processes bound how many images are recognised at once
+    """
+
+    remote = False
+
+    def __init__(self, name, command='tesseract', language='eng', **kwargs):
+        super().__init__(name, **kwargs)
+        self.command = command
+        self.language = language
+
+    def is_available(self):
+        return shutil.which(self.command) is not None
+
+    def extract(self, image_data):
+        future = get_local_ocr_executor().submit(
+            run_tesseract, self.command, image_data, self.language, self.timeout
+        )
+        return future.result(timeout=self.timeout + 5)
+
+
+def load_providers(config=None):
+    """Instantiate the enabled, available providers from settings, best first"""
+    providers = []
+    for entry in settings.OCR_PROVIDERS if config is None else config:
+        entry = dict(entry)
+        if not entry.pop('ENABLED', True):
+            continue
+        provider_class = import_string(entry.pop('BACKEND'))
+        provider = provider_class(**{key.lower(): value for key, value in entry.items()})
+        if provider.is_available():
+            providers.append(provider)
+        else:
+            print(f"OCR provider {provider.name} is not available on this host, skipping")
+    return sorted(providers, key=lambda provider: (provider.priority, provider.cost))
@@ -0,0 +1,245 @@
+"""
+On-demand request profiling
+A request is profiled when it carries the X-Profile header (set to PROFILING_TOKEN, or
+sent by a logged-in staff user) or is picked by PROFILING_SAMPLE_RATE. The profile, the
+SQL queries and the per-stage breakdown are saved to PROFILING_DIR and can be downloaded
+from /api/profiles/
+"""
+
+import cProfile
+import hmac
+import json
+import marshal
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+HEADER = 'X-Profile'
+ARTIFACT_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# Only one cProfile session can be active per process (Python 3.12+ raises on a second one)
+_cprofile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised by start() when another request is already being profiled with cProfile"""
+
+
+def is_admin(request):
+    """Staff users, or requests that present PROFILING_TOKEN in the X-Profile header"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    token = settings.PROFILING_TOKEN
+    return bool(token) and hmac.compare_digest(request.headers.get(HEADER, ''), token)
+
+
+def should_profile(request):
+    """'header', 'sampled' or None"""
+    if HEADER in request.headers and is_admin(request):
+        return 'header'
+    if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return 'sampled'
+    return None
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Sampling profiler: records the stack of the thread that called start() every
+    interval seconds, so concurrent requests do not end up in each other's profile.
+    Output is in the collapsed-stack format read by flamegraph.pl and speedscope
+    """
+
+    extension = 'folded'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.target = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self.target = threading.get_ident()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def data(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode('utf-8')
+
+    def top(self, limit=15):
+        """Functions most often on top of a stack"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [{'function': function, 'samples': count} for function, count in leaves.most_common(limit)]
+
+
+class DeterministicProfiler:
+    """cProfile of the request thread; the output loads with pstats or snakeviz"""
+
+    extension = 'prof'
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            raise ProfilerBusy('Another request is being profiled')
+        try:
+            self.profiler.enable()
+        except ValueError as e:  # Another profiling tool, such as a debugger, is active
+            _cprofile_lock.release()
+            raise ProfilerBusy(str(e))
+
+    def stop(self):
+        self.profiler.disable()
+        _cprofile_lock.release()
+
+    def data(self):
+        self.profiler.create_stats()
+        return marshal.dumps(self.profiler.stats)
+
+    def top(self, limit=15):
+        """Functions with the most cumulative time"""
+        stats = pstats.Stats(self.profiler).stats
+        rows = sorted(stats.items(), key=lambda item: -item[1][3])[:limit]
+        return [
+            {
+                'function': f"{function} ({os.path.basename(filename)}:{line})",
+                'calls': calls,
+                'total_ms': round(total * 1000, 1),
+                'cumulative_ms': round(cumulative * 1000, 1),
+            }
+            for (filename, line, function), (_, calls, total, cumulative, _) in rows
+        ]
+
+
+def get_profiler():
+    if settings.PROFILING_MODE == 'cprofile':
+        return DeterministicProfiler()
+    return StackSampler(settings.PROFILING_SAMPLE_INTERVAL)
+
+
+class QueryLog:
+    """Database execute wrapper that times every SQL statement of the request thread"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def summary(self, limit=5):
+        repeated = Counter(sql for sql, _ in self.queries)
+        return {
+            'count': len(self.queries),
+            'ms': round(sum(seconds for _, seconds in self.queries) * 1000, 1),
+            'slowest': [
+                {'sql': sql[:500], 'ms': round(seconds * 1000, 2)}
+                for sql, seconds in sorted(self.queries, key=lambda query: -query[1])[:limit]
+            ],
+            'repeated': [{'sql': sql[:500], 'count': count} for sql, count in repeated.most_common(limit) if count > 1],
+        }
+
+
+@contextmanager
+def record_queries(query_log):
+    """Send every query on this thread's connections through query_log"""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(query_log))
+        yield query_log
+
+
+def save_artifact(record, profiler):
+    """Write the profile and its JSON record to PROFILING_DIR and return the artifact id"""
+    artifact_id = uuid.uuid4().hex
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    filename = f'{artifact_id}.{profiler.extension}'
+    with open(os.path.join(directory, filename), 'wb') as f:
+        f.write(profiler.data())
+    record = {'id': artifact_id, 'created_at': timezone.now().isoformat(), 'file': filename, **record}
+    with open(os.path.join(directory, f'{artifact_id}.json'), 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=2)
+    _prune(directory)
+    return artifact_id
+
+
+def _prune(directory):
+    """Keep only the newest PROFILING_MAX_ARTIFACTS artifacts"""
+    records = sorted(
+        (name for name in os.listdir(directory) if name.endswith('.json')),
+        key=lambda name: os.path.getmtime(os.path.join(directory, name)),
+        reverse=True
+    )
+    for name in records[settings.PROFILING_MAX_ARTIFACTS:]:
+        artifact_id = name[:-len('.json')]
+        for leftover in os.listdir(directory):
+            if leftover.startswith(artifact_id):
+                try:
+                    os.remove(os.path.join(directory, leftover))
+                except FileNotFoundError:
+                    pass  # Pruned by another worker
+
+
+def list_artifacts():
+    """Saved profile records, newest first"""
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    records = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Pruned or still being written
+    return sorted(records, key=lambda record: record['created_at'], reverse=True)
+
+
+def get_artifact(artifact_id):
+    """(record, profile path) of a saved artifact, or None"""
+    if not ARTIFACT_ID.match(artifact_id):
+        return None
+    path = os.path.join(settings.PROFILING_DIR, f'{artifact_id}.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return record, os.path.join(settings.PROFILING_DIR, record['file'])
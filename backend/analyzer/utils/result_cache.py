@@ -0,0 +1,66 @@
+"""
+Content-addressed cache for Groq analysis and OCR results
+Identical notes and images are served from the shared Django cache instead of the network
+"""
+
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from . import metrics
+
+
+def namespace():
+    """
+    Key prefix for the current EXTERNAL_SERVICES mode: canned responses served in replay mode
+    are cached apart, so switching back to live never serves them for real notes or images
+    """
+    return 'replay:' if settings.EXTERNAL_SERVICES == 'replay' else ''
+
+
+def make_key(stage, model, prompt_version, *texts):
+    """Build a cache key from the service mode, stage, model, prompt version and input texts"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode('utf-8'))
+        digest.update(b'\x00')  # Keep ("ab", "c") and ("a", "bc") apart
+    return f"{namespace()}groq:{stage}:v{prompt_version}:{model}:{digest.hexdigest()}"
+
+
+def get(key):
+    """Return a cached result, or None on a miss or cache failure"""
+    try:
+        return cache.get(key)
+    except Exception as e:
+        print(f"Result cache read failed: {e}")
+        metrics.increment('result_cache_errors_total', operation='read')
+        return None
+
+
+def get_many(keys):
+    """Return {key: result} for the keys that are cached (one round trip)"""
+    try:
+        return cache.get_many(keys)
+    except Exception as e:
+        print(f"Result cache read failed: {e}")
+        metrics.increment('result_cache_errors_total', operation='read')
+        return {}
+
+
+def set(key, value, timeout=DEFAULT_TIMEOUT):
+    """Store a result using the cache backend's TTL and eviction settings"""
+    try:
+        cache.set(key, value, timeout)
+    except Exception as e:
+        print(f"Result cache write failed: {e}")
+        metrics.increment('result_cache_errors_total', operation='write')
+
+
+def set_many(values, timeout=DEFAULT_TIMEOUT):
+    """Store several results at once"""
+    try:
+        cache.set_many(values, timeout)
+    except Exception as e:
+        print(f"Result cache write failed: {e}")
+        metrics.increment('result_cache_errors_total', operation='write')
@@ -0,0 +1,160 @@
+"""
+Local note similarity: hashed word n-gram vectors compared by cosine with NumPy
+Deterministic and a few milliseconds per pair, so the LLM is only needed for prose.
+Words and bigrams are hashed with CRC32 instead of kept in a vocabulary; each batch
+of texts is vectorized over the hashes it contains, so the matrix stays compact.
+"""
+
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+ENGINE = 'hashed-ngrams'
+VERSION = 1  # Bump when the features or weights change, so cached scores are recomputed
+BLOCK_COLUMNS = 4096  # Shared features multiplied at once by similarity_matrix
+
+WORD = re.compile(r"[^\W\d_]{2,}|\d+")
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have having
+he her here hers herself him himself his how however i if in into is it its itself just may me might more
+most much must my myself no nor not now of off on once only or other our ours ourselves out over own same
+she should so some such than that the their theirs them themselves then there these they this those
+through to too under until up upon us very was we were what when where which while who whom why will with
+within without would you your yours yourself yourselves
+""".split())
+
+
+def words(text):
+    """Lowercase words of a text without stopwords"""
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def features(text):
+    """CRC32 hashes of the words and word bigrams of a text, one per occurrence"""
+    tokens = words(text)
+    grams = tokens + [f'{first} {second}' for first, second in zip(tokens, tokens[1:])]
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint32, count=len(grams))
+
+
+def vectorize(texts, idf=False):
+    """
+    Sparse L2-normalised rows of sublinear term frequencies (1 + log tf), one per text,
+    as (rows, columns, values) arrays of the non-zero entries; columns index the distinct
+    hashes of the batch. With idf, features are also weighted by their smoothed inverse
+    document frequency across texts, which only means something for three or more texts.
+    Memory grows with the words in the texts, not with texts times vocabulary.
+    """
+    rows, hashes, counts = [], [], []
+    for row, text in enumerate(texts):
+        unique, count = np.unique(features(text), return_counts=True)
+        rows.append(np.full(len(unique), row, dtype=np.int32))
+        hashes.append(unique)
+        counts.append(count)
+    rows = np.concatenate(rows or [np.empty(0, dtype=np.int32)])
+    hashes = np.concatenate(hashes or [np.empty(0, dtype=np.uint32)])
+    values = 1 + np.log(np.concatenate(counts or [np.empty(0)]).astype(np.float32))
+    _, columns = np.unique(hashes, return_inverse=True)
+    columns = columns.reshape(-1)
+
+    if idf:
+        document_frequency = np.bincount(columns)
+        values *= (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)[columns]
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(texts)))
+    norms[norms == 0] = 1
+    return rows, columns, (values / norms[rows]).astype(np.float32)
+
+
+def similarity_matrix(texts, idf=True):
+    """
+    Pairwise cosine similarities (0-1) of texts. Only features at least two texts share add
+    to the off-diagonal, so just those are multiplied, BLOCK_COLUMNS of them at a time.
+    """
+    rows, columns, values = vectorize(texts, idf=idf)
+    matrix = np.zeros((len(texts), len(texts)), dtype=np.float32)
+    non_empty = np.bincount(rows, minlength=len(texts)) > 0
+    shared = np.bincount(columns)[columns] > 1 if len(columns) else np.zeros(0, dtype=bool)
+    rows, columns, values = rows[shared], columns[shared], values[shared]
+    _, columns = np.unique(columns, return_inverse=True)
+    order = np.argsort(columns, kind='stable')
+    rows, columns, values = rows[order], columns.reshape(-1)[order], values[order]
+    
+    width = int(columns[-1]) + 1 if len(columns) else 0
+    for first in range(0, width, BLOCK_COLUMNS):
+        start, stop = np.searchsorted(columns, [first, first + BLOCK_COLUMNS])
+        block = np.zeros((len(texts), min(BLOCK_COLUMNS, width - first)), dtype=np.float32)
+        block[rows[start:stop], columns[start:stop] - first] = values[start:stop]
+        matrix += block @ block.T
+    
+    # Every non-empty row has unit length, so it is identical to itself
+    np.fill_diagonal(matrix, non_empty.astype(np.float32))
+    return np.clip(matrix, 0.0, 1.0)
+
+
+def similarity(text1, text2):
+    """Cosine similarity (0-1) of two texts"""
+    return float(similarity_matrix([text1, text2], idf=False)[0, 1])
+
+
+def score(similarity_value):
+    """A 0-1 similarity as the 0-100 similarity_score the API returns"""
+    return round(float(similarity_value) * 100, 1)
+
+
+def key_terms(text1, text2, limit=8):
+    """Most frequent words both texts share, and those only in the first or second"""
+    counts1, counts2 = Counter(words(text1)), Counter(words(text2))
+    shared = sorted(counts1.keys() & counts2.keys(), key=lambda word: (-min(counts1[word], counts2[word]), word))
+    only = lambda counts, other: [word for word, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0])) if word not in other]
+    return {'shared': shared[:limit], 'first': only(counts1, counts2)[:limit], 'second': only(counts2, counts1)[:limit]}
+
+
+def describe(similarity_score, terms):
+    """Plain summary of a comparison from its score and key_terms, used when the LLM is not"""
+    parts = [f"The notes are {similarity_score}% similar by shared wording."]
+    if terms['shared']:
+        parts.append(f"Both discuss {', '.join(terms['shared'][:5])}.")
+    if terms['first']:
+        parts.append(f"Note A also covers {', '.join(terms['first'][:5])}.")
+    if terms['second']:
+        parts.append(f"Note B also covers {', '.join(terms['second'][:5])}.")
+    return ' '.join(parts)
+
+
+def clusters(matrix, threshold):
+    """Groups of texts joined by chains of pairs at least threshold similar (single linkage), largest first"""
+    parent = list(range(len(matrix)))
+    
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+    
+    for first, second in zip(*np.nonzero(np.triu(matrix >= threshold, k=1))):
+        parent[root(int(first))] = root(int(second))
+    groups = {}
+    for index in range(len(matrix)):
+        groups.setdefault(root(index), []).append(index)
+    return sorted(groups.values(), key=lambda group: (-len(group), group[0]))
+
+
+def nearest_references(matrix, references):
+    """(index, nearest reference, similarity) for every text that is not one of the references"""
+    references = np.asarray(sorted(set(references)), dtype=int)
+    others = [index for index in range(len(matrix)) if index not in set(references.tolist())]
+    if not others or not len(references):
+        return []
+    block = matrix[np.ix_(others, references)]
+    best = block.argmax(axis=1)
+    return [(index, int(references[column]), float(block[row, column])) for row, (index, column) in enumerate(zip(others, best))]
+
+
+def top_pairs(matrix, k):
+    """The k most similar pairs (i < j) as (i, j, similarity), best first, ties by index"""
+    first, second = np.triu_indices(len(matrix), k=1)
+    values = matrix[first, second]
+    order = np.lexsort((second, first, -values))[:k]
+    return [(int(first[position]), int(second[position]), float(values[position])) for position in order]
@@ -0,0 +1,356 @@
+"""
+Offline record/replay stand-in for Groq and the OCR web services
+settings.EXTERNAL_SERVICES selects "live" (the real network), "record" (the real
+network, appending every exchange to STANDIN_RECORDINGS_DIR) or "replay" (recorded
+responses served locally with simulated latency and errors, no network or API key)
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import httpx
+import requests
+from django.conf import settings
+from groq import APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+
+GROQ_URL = 'https://api.groq.com/openai/v1/chat/completions'
+PREFIX_CHARS = 300  # Prompt characters compared when no recording matches exactly
+
+
+def fingerprint(value):
+    """Stable SHA-256 of a JSON-serialisable request description"""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def prompt_prefix(messages):
+    """Whitespace-normalised start of the first message, which identifies the prompt template"""
+    content = messages[0].get('content', '') if messages else ''
+    return ' '.join(content.split())[:PREFIX_CHARS]
+
+
+def common_prefix_length(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class RecordingStore:
+    """Recorded exchanges of one service, kept in a JSON-lines file"""
+
+    def __init__(self, service):
+        self.service = service
+        self.path = os.path.join(settings.STANDIN_RECORDINGS_DIR, f'{service}.jsonl')
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is None:
+            self.entries = []
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = [json.loads(line) for line in f if line.strip()]
+        return self.entries
+
+    def append(self, entry):
+        with self.lock:
+            self._load().append(entry)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def find(self, key, similar=None):
+        """
+        The recording made for exactly this request, otherwise the best match
+        by similar(entry) (higher is better, None excludes the entry)
+        """
+        with self.lock:
+            entries = self._load()
+        for entry in entries:
+            if entry['key'] == key:
+                return entry
+        if similar is None:
+            return None
+        scored = [(score, entry) for entry in entries if (score := similar(entry)) is not None]
+        if not scored:
+            return None
+        best = max(score for score, _ in scored)
+        candidates = [entry for score, entry in scored if score == best]
+        # Deterministic choice among equally good recordings
+        return candidates[int(key, 16) % len(candidates)]
+
+
+class Simulation:
+    """
+    Latency and failure model for one service, from settings.STANDIN[service]
+    Each request draws from its own generator seeded by the request and how many
+    times it has been seen, so results do not depend on thread scheduling
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.seen = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def config(self):
+        return settings.STANDIN[self.service]
+
+    def random_for(self, key):
+        with self.lock:
+            self.seen[key] += 1
+            occurrence = self.seen[key]
+        return random.Random(f"{settings.STANDIN_SEED}:{self.service}:{key}:{occurrence}")
+
+    def latency(self, rng, recorded):
+        """Seconds the simulated call takes"""
+        config = self.config
+        distribution = config['LATENCY']
+        median = config['MEDIAN_MS'] / 1000
+        if distribution == 'none':
+            return 0.0
+        if distribution == 'fixed':
+            return median
+        if distribution == 'uniform':
+            return rng.uniform(0, 2 * median)
+        if distribution == 'lognormal':
+            # Median-preserving lognormal: a realistic long tail
+            return rng.lognormvariate(math.log(median), config['SIGMA']) if median > 0 else 0.0
+        return (recorded or 0.0) * config['SCALE']  # 'recorded'
+
+    def outcome(self, rng):
+        """'ok', 'error' or 'timeout'"""
+        draw = rng.random()
+        if draw < self.config['ERROR_RATE']:
+            return 'error'
+        if draw < self.config['ERROR_RATE'] + self.config['TIMEOUT_RATE']:
+            return 'timeout'
+        return 'ok'
+
+
+_stores = {}
+_simulations = {}
+_registry_lock = threading.Lock()
+
+
+def get_store(service):
+    with _registry_lock:
+        if service not in _stores:
+            _stores[service] = RecordingStore(service)
+        return _stores[service]
+
+
+def get_simulation(service):
+    with _registry_lock:
+        if service not in _simulations:
+            _simulations[service] = Simulation(service)
+        return _simulations[service]
+
+
+def reset():
+    """Forget loaded recordings and request counts (used by tests)"""
+    with _registry_lock:
+        _stores.clear()
+        _simulations.clear()
+
+
+# Groq
+
+def groq_request_key(kwargs):
+    return fingerprint({
+        'model': kwargs.get('model'),
+        'messages': kwargs.get('messages'),
+        'temperature': kwargs.get('temperature'),
+    })
+
+
+def completion(content, usage):
+    """Non-streaming chat completion shaped like the SDK's"""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason='stop')],
+        usage=SimpleNamespace(**usage)
+    )
+
+
+def completion_chunks(content, usage, latency, chunk_chars=24):
+    """Streamed chat completion: the first chunk after a fifth of the latency, the rest spread over the remainder"""
+    pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)] or ['']
+    time.sleep(latency * 0.2)
+    gap = latency * 0.8 / len(pieces)
+    for index, piece in enumerate(pieces):
+        time.sleep(gap)
+        last = index == len(pieces) - 1
+        yield SimpleNamespace(
+            choices=[SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason='stop' if last else None)],
+            usage=None,
+            x_groq=SimpleNamespace(usage=SimpleNamespace(**usage)) if last else None
+        )
+
+
+class RawResponse:
+    """Stand-in for the SDK's with_raw_response result"""
+
+    def __init__(self, parsed, headers=None):
+        self._parsed = parsed
+        self.headers = httpx.Headers(headers or {})
+
+    def parse(self):
+        return self._parsed
+
+
+class ReplayGroqClient:
+    """Serves recorded Groq completions; wrap it in ResilientGroqClient like the real client"""
+
+    def __init__(self):
+        self.store = get_store('groq')
+        self.simulation = get_simulation('groq')
+        create = self.create_raw
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: create(**kwargs).parse(),
+            with_raw_response=SimpleNamespace(create=create)
+        ))
+
+    def create_raw(self, **kwargs):
+        key = groq_request_key(kwargs)
+        prefix = prompt_prefix(kwargs.get('messages'))
+        entry = self.store.find(key, lambda entry: common_prefix_length(prefix, entry.get('prefix', '')))
+        if entry is None:
+            raise InternalServerError('No recorded Groq response', response=self._http_response(500), body=None)
+
+        rng = self.simulation.random_for(key)
+        latency = self.simulation.latency(rng, entry.get('latency'))
+        outcome = self.simulation.outcome(rng)
+        if outcome == 'timeout':
+            time.sleep(kwargs.get('timeout') or settings.GROQ_TIMEOUT)
+            raise APITimeoutError(request=httpx.Request('POST', GROQ_URL))
+        if outcome == 'error':
+            time.sleep(latency * 0.1)
+            # Alternate between the two retryable failures Groq returns under load
+            if rng.random() < 0.5:
+                raise RateLimitError('Rate limited', response=self._http_response(429, {'retry-after': '1'}), body=None)
+            raise InternalServerError('Service unavailable', response=self._http_response(503), body=None)
+
+        usage = entry.get('usage') or {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        if kwargs.get('stream'):
+            return RawResponse(completion_chunks(entry['content'], usage, latency))
+        time.sleep(latency)
+        return RawResponse(completion(entry['content'], usage))
+
+    @staticmethod
+    def _http_response(status_code, headers=None):
+        return httpx.Response(status_code, headers=headers or {}, request=httpx.Request('POST', GROQ_URL))
+
+
+class RecordingGroqClient:
+    """Wraps the real Groq client and records every completion it returns"""
+
+    def __init__(self, client):
+        self._client = client
+        self.store = get_store('groq')
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: self.create_raw(**kwargs).parse(),
+            with_raw_response=SimpleNamespace(create=self.create_raw)
+        ))
+
+    def create_raw(self, **kwargs):
+        start = time.monotonic()
+        raw = self._client.chat.completions.with_raw_response.create(**kwargs)
+        entry = {
+            'key': groq_request_key(kwargs),
+            'model': kwargs.get('model'),
+            'prefix': prompt_prefix(kwargs.get('messages')),
+        }
+        if kwargs.get('stream'):
+            return RawResponse(self._record_stream(raw.parse(), entry, start), raw.headers)
+        parsed = raw.parse()
+        usage = parsed.usage
+        self.store.append({
+            **entry,
+            'content': parsed.choices[0].message.content,
+            'usage': {field: getattr(usage, field, 0) for field in ('prompt_tokens', 'completion_tokens', 'total_tokens')},
+            'latency': round(time.monotonic() - start, 3),
+        })
+        return RawResponse(parsed, raw.headers)
+
+    def _record_stream(self, stream, entry, start):
+        parts = []
+        usage = None
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+            if chunk.choices:
+                parts.append(chunk.choices[0].delta.content or '')
+            yield chunk
+        self.store.append({
+            **entry,
+            'content': ''.join(parts),
+            'usage': {field: getattr(usage, field, 0) for field in ('prompt_tokens', 'completion_tokens', 'total_tokens')},
+            'latency': round(time.monotonic() - start, 3),
+        })
+
+
+# OCR web services
+
+def ocr_request_key(url, files=None, data=None):
+    """Identify an OCR request by URL and the content it uploads"""
+    body = {name: hashlib.sha256(upload[1]).hexdigest() for name, upload in (files or {}).items()}
+    for name, value in (data or {}).items():
+        body[name] = hashlib.sha256(str(value).encode('utf-8')).hexdigest() if len(str(value)) > 200 else value
+    return fingerprint({'url': url, 'body': body})
+
+
+def http_response(url, status_code, body, content_type):
+    """requests.Response carrying a recorded body"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = 'OK' if status_code < 400 else 'Error'
+    response.url = url
+    response.headers['Content-Type'] = content_type
+    response._content = body.encode('utf-8')
+    response.encoding = 'utf-8'
+    return response
+
+
+def http_post(url, files=None, data=None, timeout=None, **kwargs):
+    """POST to an OCR web service, or its recording, depending on settings.EXTERNAL_SERVICES"""
+    mode = settings.EXTERNAL_SERVICES
+    if mode == 'replay':
+        return _replay_post(url, files, data, timeout)
+    start = time.monotonic()
+    response = requests.post(url, files=files, data=data, timeout=timeout, **kwargs)
+    if mode == 'record':
+        get_store('ocr').append({
+            'key': ocr_request_key(url, files, data),
+            'url': url,
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type', 'text/plain'),
+            'body': response.text,
+            'latency': round(time.monotonic() - start, 3),
+        })
+    return response
+
+
+def _replay_post(url, files, data, timeout):
+    key = ocr_request_key(url, files, data)
+    entry = get_store('ocr').find(key, lambda entry: 0 if entry['url'] == url else None)
+    if entry is None:
+        raise requests.ConnectionError(f"No recorded response for {url}")
+    simulation = get_simulation('ocr')
+    rng = simulation.random_for(key)
+    latency = simulation.latency(rng, entry.get('latency'))
+    outcome = simulation.outcome(rng)
+    if outcome == 'timeout':
+        time.sleep(timeout or 0)
+        raise requests.Timeout(f"Read timed out ({url})")
+    time.sleep(latency)
+    if outcome == 'error':
+        return http_response(url, 503, 'Service Unavailable', 'text/plain')
+    return http_response(url, entry['status'], entry['body'], entry['content_type'])
@@ -1,29 +1,136 @@
+import hmac
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.conf import settings
+from django.urls import reverse
 
-from .models import NoteAnalysis, NoteComparison
+from . import jobs, search, tagging
+from .models import NoteAnalysis, NoteComparison, AnalysisJob
+from .pagination import InvalidCursor, keyset_page
 from .serializers import (
-    NoteAnalysisSerializer, NoteComparisonSerializer,
-    TextInputSerializer, FileUploadSerializer, ComparisonInputSerializer
+    NoteAnalysisSerializer, NoteAnalysisListSerializer, NoteComparisonListSerializer, AnalysisJobSerializer,
+    TextInputSerializer, FileUploadSerializer, ComparisonInputSerializer, BatchComparisonInputSerializer
+)
+from .services import (
+    analysis_history, analysis_response, compare_batch, compare_notes, comparison_history, create_analysis,
+    extract_text, is_too_long_for_request
 )
-from .utils.groq_ai import GroqAIProcessor
+from .streaming import stream_analysis, event_stream_response
+from .utils.cloud_ocr import free_ocr
 from .utils.file_handler import FileHandler
+from .utils import metrics, profiling
+
+def runs_in_background(validated_data, text=None):
+    """
+    Whether to queue the analysis; requests fall back to the ANALYSIS_BACKGROUND_JOBS default,
+    and text too long to analyze within a request is queued as well (see ANALYSIS_SYNC_MAX_CHARS)
+    """
+    background = validated_data.get('background')
+    if background is not None:
+        return background
+    return settings.ANALYSIS_BACKGROUND_JOBS or (text is not None and is_too_long_for_request(text))
+
+def job_accepted_response(request, job):
+    """202 response pointing the client at the job status endpoint"""
+    return Response({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': request.build_absolute_uri(reverse('analysis-job', args=[job.id]))
+    }, status=status.HTTP_202_ACCEPTED)
+
+class InvalidQuery(ValueError):
+    pass
+
+def requested_fields(request, allowed, default=...):
+    """Fields named in ?fields=a,b (all of allowed when absent, or default if given)"""
+    value = request.query_params.get('fields')
+    if not value:
+        return list(allowed) if default is ... else default
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise InvalidQuery(f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(allowed)}")
+    return fields
+
+def page_size(request, parameter, default):
+    """Positive page size from the query string, capped at HISTORY_MAX_PAGE_SIZE"""
+    value = request.query_params.get(parameter)
+    if value is None:
+        return default
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise InvalidQuery(f"{parameter} must be a positive integer")
+    return min(size, settings.HISTORY_MAX_PAGE_SIZE)
+
+def history_filters(request):
+    """Filters for tagging.filter_analyses from ?tag= (repeatable, all must match), ?difficulty= and ?bloom_level="""
+    return {
+        'tags': [tag for tag in request.query_params.getlist('tag') if tag.strip()],
+        'difficulty': request.query_params.get('difficulty'),
+        'bloom_level': request.query_params.get('bloom_level'),
+    }
 
 class HealthCheckView(APIView):
     """Health check endpoint - minimal and bulletproof"""
     
     def get(self, request):
         # Always return 200 OK - no exceptions allowed
+        try:
+            ocr_status = free_ocr.get_ocr_status()
+        except Exception as e:
+            print(f"OCR status check failed: {e}")
+            ocr_status = {'available': False, 'error': 'OCR status unavailable'}
         return Response({
             'status': 'healthy',
             'message': 'Smart Note Analyzer API is running',
-            'version': '1.0.0'
+            'version': '1.0.0',
+            'ocr': ocr_status
         }, status=status.HTTP_200_OK)
 
+class MetricsView(APIView):
+    """Prometheus metrics of every worker process"""
+    
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        if not token and not settings.DEBUG:
+            return Response({'error': 'Set METRICS_TOKEN to enable metrics'}, status=status.HTTP_403_FORBIDDEN)
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response({'error': 'Invalid metrics token'}, status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class ProfileListView(APIView):
+    """Request profiles saved by ProfilingMiddleware (admin only)"""
+    
+    def get(self, request):
+        if not profiling.is_admin(request):
+            return Response({'error': 'Profiles are only available to admins'}, status=status.HTTP_403_FORBIDDEN)
+        profiles = [
+            {**record, 'download_url': request.build_absolute_uri(reverse('profile-download', args=[record['id']]))}
+            for record in profiling.list_artifacts()
+        ]
+        return Response({'profiles': profiles}, status=status.HTTP_200_OK)
+
+class ProfileDownloadView(APIView):
+    """Download one saved profile (admin only)"""
+    
+    def get(self, request, artifact_id):
+        if not profiling.is_admin(request):
+            return Response({'error': 'Profiles are only available to admins'}, status=status.HTTP_403_FORBIDDEN)
+        artifact = profiling.get_artifact(artifact_id)
+        if artifact is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        record, path = artifact
+        try:
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=record['file'])
+        except FileNotFoundError:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
 class AnalyzeTextView(APIView):
@@ -44,51 +151,21 @@ class AnalyzeTextView(APIView):
             )
         
         try:
-            # Initialize AI processor
-            ai_processor = GroqAIProcessor()
-            
-            # Get analysis
-            analysis = ai_processor.analyze_note(cleaned_text)
-            topic_graph = ai_processor.generate_topic_graph(cleaned_text)
-            quiz_questions = ai_processor.generate_quiz(cleaned_text)
-            
             # Ensure session exists
             if not request.session.session_key:
                 request.session.create()
             
-            # Save to database with session isolation
-            note_analysis = NoteAnalysis.objects.create(
-                session_key=request.session.session_key,
-                original_text=cleaned_text,
-                summary=analysis['summary'],
-                key_points=analysis['key_points'],
-                difficulty=analysis['difficulty'],
-                bloom_level=analysis['bloom_level'],
-                topic_graph=topic_graph,
-                quiz_questions=quiz_questions,
-                tags=analysis['tags'],
-                learning_objectives=analysis.get('learning_objectives', []),
-                prerequisites=analysis.get('prerequisites', []),
-                applications=analysis.get('applications', [])
-            )
+            mode = serializer.validated_data.get('mode')
+            if runs_in_background(serializer.validated_data, text):
+                job = jobs.enqueue_text(request.session.session_key, text, mode=mode)
+                return job_accepted_response(request, job)
             
-            # Return response
-            response_data = {
-                'id': note_analysis.id,
-                'summary': analysis['summary'],
-                'key_points': analysis['key_points'],
-                'difficulty': analysis['difficulty'],
-                'bloom_level': analysis['bloom_level'],
-                'topic_graph': topic_graph,
-                'quiz_questions': quiz_questions,
-                'tags': analysis['tags'],
-                'learning_objectives': analysis.get('learning_objectives', []),
-                'prerequisites': analysis.get('prerequisites', []),
-                'applications': analysis.get('applications', []),
-                'created_at': note_analysis.created_at
-            }
+            # Analyze (stages run concurrently, long texts in chunks) and save with session isolation
+            note_analysis = create_analysis(
+                request.session.session_key, text, mode=mode, max_chars=settings.ANALYSIS_SYNC_MAX_CHARS
+            )
             
-            return Response(response_data, status=status.HTTP_200_OK)
+            return Response(analysis_response(note_analysis), status=status.HTTP_200_OK)
             
         except Exception as e:
             return Response(
@@ -101,23 +178,27 @@ class AnalyzeFileView(APIView):
     parser_classes = [MultiPartParser, FormParser]
     
     def post(self, request):
-        serializer = FileUploadSerializer(data=request.data)
+        with metrics.timer('stage_seconds', stage='upload_parse'):
+            data = request.data  # The multipart body is parsed on first access
+        serializer = FileUploadSerializer(data=data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         uploaded_file = serializer.validated_data['file']
         
         try:
-            # Extract text based on file type
-            from .utils.cloud_ocr import free_ocr
+            # Ensure session exists
+            if not request.session.session_key:
+                request.session.create()
             
-            if free_ocr.is_image_file(uploaded_file.name):
-                # Use FREE OCR for images - no cost!
-                text = free_ocr.extract_text_from_image(uploaded_file)
-            else:
-                # Use file handler for PDF/TXT
-                text = FileHandler.extract_text_from_file(uploaded_file)
+            mode = serializer.validated_data.get('mode')
+            if runs_in_background(serializer.validated_data):
+                # Extraction (including OCR) also happens in the worker
+                job = jobs.enqueue_file(request.session.session_key, uploaded_file, mode=mode)
+                return job_accepted_response(request, job)
             
+            # Extract text based on file type
+            text = extract_text(uploaded_file)
             cleaned_text = FileHandler.clean_text(text)
             
             if not cleaned_text:
@@ -126,50 +207,17 @@ class AnalyzeFileView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Process with AI (same as text analysis)
-            ai_processor = GroqAIProcessor()
-            
-            analysis = ai_processor.analyze_note(cleaned_text)
-            topic_graph = ai_processor.generate_topic_graph(cleaned_text)
-            quiz_questions = ai_processor.generate_quiz(cleaned_text)
-            
-            # Ensure session exists
-            if not request.session.session_key:
-                request.session.create()
+            if runs_in_background(serializer.validated_data, text):
+                # Too long to analyze within the request: the worker analyzes the extracted text
+                job = jobs.enqueue_text(request.session.session_key, text, mode=mode)
+                return job_accepted_response(request, job)
             
-            # Save to database with session isolation
-            note_analysis = NoteAnalysis.objects.create(
-                session_key=request.session.session_key,
-                original_text=cleaned_text,
-                summary=analysis['summary'],
-                key_points=analysis['key_points'],
-                difficulty=analysis['difficulty'],
-                bloom_level=analysis['bloom_level'],
-                topic_graph=topic_graph,
-                quiz_questions=quiz_questions,
-                tags=analysis['tags'],
-                learning_objectives=analysis.get('learning_objectives', []),
-                prerequisites=analysis.get('prerequisites', []),
-                applications=analysis.get('applications', [])
+            # Process with AI (same as text analysis)
+            note_analysis = create_analysis(
+                request.session.session_key, text, mode=mode, max_chars=settings.ANALYSIS_SYNC_MAX_CHARS
             )
             
-            response_data = {
-                'id': note_analysis.id,
-                'summary': analysis['summary'],
-                'key_points': analysis['key_points'],
-                'difficulty': analysis['difficulty'],
-                'bloom_level': analysis['bloom_level'],
-                'topic_graph': topic_graph,
-                'quiz_questions': quiz_questions,
-                'tags': analysis['tags'],
-                'learning_objectives': analysis.get('learning_objectives', []),
-                'prerequisites': analysis.get('prerequisites', []),
-                'applications': analysis.get('applications', []),
-                'created_at': note_analysis.created_at,
-                'extracted_text': cleaned_text[:500] + '...' if len(cleaned_text) > 500 else cleaned_text
-            }
-            
-            return Response(response_data, status=status.HTTP_200_OK)
+            return Response(analysis_response(note_analysis, extracted_text=cleaned_text), status=status.HTTP_200_OK)
             
         except Exception as e:
             error_message = str(e)
@@ -184,6 +232,11 @@ class AnalyzeFileView(APIView):
                     }, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            elif 'Image is too large to process' in error_message:
+                return Response(
+                    {'error': 'Image is too large.', 'message': error_message},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             elif 'OCR services are temporarily unavailable' in error_message:
                 return Response(
                     {
@@ -199,8 +252,54 @@ class AnalyzeFileView(APIView):
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
 
+class AnalyzeTextStreamView(APIView):
+    """Analyze text input, streaming results as Server-Sent Events"""
+    
+    def post(self, request):
+        serializer = TextInputSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        text = serializer.validated_data['text']
+        if not FileHandler.clean_text(text):
+            return Response(
+                {'error': 'No valid text provided'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # The session cookie must be set before the stream starts
+        if not request.session.session_key:
+            request.session.create()
+        
+        return event_stream_response(stream_analysis(
+            request.session.session_key,
+            text=text,
+            mode=serializer.validated_data.get('mode')
+        ))
+
+class AnalyzeFileStreamView(APIView):
+    """Analyze uploaded file, streaming results as Server-Sent Events"""
+    parser_classes = [MultiPartParser, FormParser]
+    
+    def post(self, request):
+        with metrics.timer('stage_seconds', stage='upload_parse'):
+            data = request.data  # The multipart body is parsed on first access
+        serializer = FileUploadSerializer(data=data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not request.session.session_key:
+            request.session.create()
+        
+        # Extraction runs inside the stream so the client hears back immediately
+        return event_stream_response(stream_analysis(
+            request.session.session_key,
+            uploaded_file=serializer.validated_data['file'],
+            mode=serializer.validated_data.get('mode')
+        ))
+
 class CompareNotesView(APIView):
-    """Compare two notes semantically"""
+    """Compare two notes: a local similarity score, and an LLM summary unless llm_summary is false"""
     
     def post(self, request):
         serializer = ComparisonInputSerializer(data=request.data)
@@ -217,26 +316,27 @@ class CompareNotesView(APIView):
             )
         
         try:
-            ai_processor = GroqAIProcessor()
-            comparison = ai_processor.compare_notes(note1, note2)
+            comparison = compare_notes(note1, note2, serializer.validated_data.get('llm_summary'))
             
             # Ensure session exists
             if not request.session.session_key:
                 request.session.create()
             
             # Save comparison to database with session isolation
-            note_comparison = NoteComparison.objects.create(
-                session_key=request.session.session_key,
-                note1_text=note1,
-                note2_text=note2,
-                similarity_score=comparison['similarity_score'],
-                comparison_summary=comparison['comparison_summary']
-            )
+            with metrics.timer('stage_seconds', stage='save_comparison'):
+                note_comparison = NoteComparison.objects.create(
+                    session_key=request.session.session_key,
+                    note1_text=note1,
+                    note2_text=note2,
+                    similarity_score=comparison['similarity_score'],
+                    comparison_summary=comparison['comparison_summary']
+                )
             
             response_data = {
                 'id': note_comparison.id,
                 'similarity_score': comparison['similarity_score'],
                 'comparison_summary': comparison['comparison_summary'],
+                'terms': comparison['terms'],
                 'created_at': note_comparison.created_at
             }
             
@@ -248,39 +348,182 @@ class CompareNotesView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class CompareBatchView(APIView):
+    """
+    Compare N notes (or N of the session's analyses) against each other at once
+    Returns the pairwise similarity matrix, clusters, each note's nearest reference when
+    references are given, and the top_k most similar pairs with summaries. Nothing is saved.
+    """
+    
+    def post(self, request):
+        serializer = BatchComparisonInputSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        if 'analysis_ids' in data:
+            texts = dict(
+                NoteAnalysis.objects.filter(session_key=request.session.session_key, id__in=data['analysis_ids'])
+                .values_list('id', 'original_text')
+            ) if request.session.session_key else {}
+            missing = [analysis_id for analysis_id in data['analysis_ids'] if analysis_id not in texts]
+            if missing:
+                return Response({'error': 'Analyses not found', 'missing': missing}, status=status.HTTP_404_NOT_FOUND)
+            notes = [FileHandler.clean_text(texts[analysis_id]) for analysis_id in data['analysis_ids']]
+        else:
+            notes = [FileHandler.clean_text(note) for note in data['notes']]
+        
+        # Notes sent as text were limited by the serializer; stored analyses can be longer
+        if sum(len(note) for note in notes) > settings.COMPARISON_BATCH_MAX_TOTAL_CHARS:
+            return Response(
+                {'error': f'At most {settings.COMPARISON_BATCH_MAX_TOTAL_CHARS} characters of notes in total'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        empty = [index for index, note in enumerate(notes) if not note]
+        if empty:
+            return Response(
+                {'error': 'Every note must contain valid text', 'empty': empty},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            comparison = compare_batch(
+                notes,
+                references=data['references'],
+                cluster_threshold=data.get('cluster_threshold'),
+                top_k=data['top_k'],
+                summarize=data['llm_summaries'],
+            )
+        except Exception as e:
+            return Response(
+                {'error': f'Comparison failed: {str(e)}'}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        response_data = {'count': len(notes)}
+        if 'analysis_ids' in data:
+            response_data['analysis_ids'] = data['analysis_ids']
+        response_data.update(comparison)
+        return Response(response_data, status=status.HTTP_200_OK)
+
 class AnalysisHistoryView(APIView):
-    """Get analysis history for current session"""
+    """
+    Get analysis history for current session, newest first, one page at a time
+    Entries are compact (see NoteAnalysisListSerializer); ?fields= picks a subset of them,
+    ?limit= sets the page size and the returned next_cursor fetches the following page.
+    ?tag=, ?difficulty= and ?bloom_level= filter the analyses (see history_filters).
+    Comparisons page the same way with comparison_limit and comparison_cursor.
+    """
     
     def get(self, request):
         try:
             # Ensure session exists
             if not request.session.session_key:
                 request.session.create()
+            session_key = request.session.session_key
             
-            # Get recent analyses for this session only
-            analyses = NoteAnalysis.objects.filter(
-                session_key=request.session.session_key
-            ).order_by('-created_at')[:20]
+            fields = requested_fields(request, NoteAnalysisListSerializer.Meta.fields)
+            limit = page_size(request, 'limit', settings.HISTORY_PAGE_SIZE)
+            comparison_limit = page_size(request, 'comparison_limit', settings.HISTORY_COMPARISON_PAGE_SIZE)
             
-            comparisons = NoteComparison.objects.filter(
-                session_key=request.session.session_key
-            ).order_by('-created_at')[:10]
-            
-            analyses_data = NoteAnalysisSerializer(analyses, many=True).data
-            comparisons_data = NoteComparisonSerializer(comparisons, many=True).data
+            analyses = tagging.filter_analyses(analysis_history(session_key, fields), session_key, **history_filters(request))
+            analyses, next_cursor = keyset_page(analyses, request.query_params.get('cursor'), limit)
+            comparisons, next_comparison_cursor = keyset_page(
+                comparison_history(session_key), request.query_params.get('comparison_cursor'), comparison_limit
+            )
             
             return Response({
-                'analyses': analyses_data,
-                'comparisons': comparisons_data,
+                'analyses': NoteAnalysisListSerializer(analyses, many=True, fields=fields).data,
+                'comparisons': NoteComparisonListSerializer(comparisons, many=True).data,
+                'next_cursor': next_cursor,
+                'next_comparison_cursor': next_comparison_cursor,
                 'session_info': {
-                    'session_key': request.session.session_key,
-                    'total_analyses': analyses.count(),
-                    'total_comparisons': comparisons.count()
+                    'session_key': session_key,
+                    # Sizes of these pages, not of the whole history
+                    'total_analyses': len(analyses),
+                    'total_comparisons': len(comparisons)
                 }
             }, status=status.HTTP_200_OK)
             
+        except (InvalidCursor, InvalidQuery) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': f'Failed to fetch history: {str(e)}'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+class AnalysisFacetsView(APIView):
+    """Tag, difficulty and Bloom level counts of the current session's analyses, with the history filters applied"""
+    
+    def get(self, request):
+        session_key = request.session.session_key or ''
+        filters = history_filters(request)
+        analyses = tagging.filter_analyses(NoteAnalysis.objects.filter(session_key=session_key), session_key, **filters)
+        return Response(
+            {'facets': tagging.facets(analyses, session_key, filtered=any(filters.values()))},
+            status=status.HTTP_200_OK
+        )
+
+class AnalysisDetailView(APIView):
+    """Get one analysis of the current session in full, or only the ?fields= asked for"""
+    
+    def get(self, request, analysis_id):
+        try:
+            fields = requested_fields(request, [field.name for field in NoteAnalysis._meta.concrete_fields], default=None)
+        except InvalidQuery as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        analyses = NoteAnalysis.objects.filter(session_key=request.session.session_key or '')
+        if fields is not None:
+            analyses = analyses.only('id', *fields)
+        note_analysis = analyses.filter(id=analysis_id).first()
+        if note_analysis is None:
+            return Response({'error': 'Analysis not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(NoteAnalysisSerializer(note_analysis, fields=fields).data, status=status.HTTP_200_OK)
+
+class SearchView(APIView):
+    """
+    Full-text search of the current session's analyses (tags, summary, key points and note), best first
+    ?q= takes words, "quoted phrases" and -excluded words; ?limit= and ?fields= work as in the history
+    """
+    
+    def get(self, request):
+        try:
+            query = request.query_params.get('q', '').strip()
+            if not query:
+                raise InvalidQuery('q is required')
+            fields = requested_fields(request, NoteAnalysisListSerializer.Meta.fields)
+            limit = page_size(request, 'limit', settings.HISTORY_PAGE_SIZE)
+        except InvalidQuery as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        session_key = request.session.session_key
+        if not session_key:
+            return Response({'query': query, 'results': []}, status=status.HTTP_200_OK)
+        
+        with metrics.timer('stage_seconds', stage='search'):
+            ranks = dict(search.search(query, session_key, limit))
+        analyses = analysis_history(session_key, fields).filter(id__in=ranks)
+        analyses = sorted(analyses, key=lambda analysis: ranks[analysis.id], reverse=True)
+        results = NoteAnalysisListSerializer(analyses, many=True, fields=fields).data
+        for result, analysis in zip(results, analyses):
+            result['rank'] = round(ranks[analysis.id], 6)
+        return Response({'query': query, 'results': results}, status=status.HTTP_200_OK)
+
+class AnalysisJobView(APIView):
+    """Poll a background analysis job for the current session"""
+    
+    def get(self, request, job_id):
+        try:
+            job = AnalysisJob.objects.select_related('analysis').defer('file_data', 'input_text').get(
+                id=job_id, session_key=request.session.session_key or ''
+            )
+        except AnalysisJob.DoesNotExist:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        response_data = AnalysisJobSerializer(job).data
+        if job.status == AnalysisJob.STATUS_DONE and job.analysis:
+            response_data['result'] = analysis_response(job.analysis)
+        return Response(response_data, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -33,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analyzer.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
@@ -40,6 +42,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'analyzer.middleware.ProfilingMiddleware',  # Needs request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -72,9 +75,39 @@ DATABASES = {
 }
 
 # Use PostgreSQL in production
+# Connections are kept open for DB_CONN_MAX_AGE seconds instead of one per request, and
+# checked before reuse so a server restart or idle timeout does not fail the next request
 import dj_database_url
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 600))
 if 'DATABASE_URL' in os.environ:
-    DATABASES['default'] = dj_database_url.parse(os.environ['DATABASE_URL'])
+    DATABASES['default'] = dj_database_url.parse(
+        os.environ['DATABASE_URL'],
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=True
+    )
+
+# Shared cache for analysis results. The database backend works across
+# gunicorn workers with no extra service; run `manage.py createcachetable`.
+# MAX_ENTRIES bounds its size and TIMEOUT is the per-entry TTL.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'analyzer_cache',
+        'TIMEOUT': int(os.getenv('ANALYSIS_CACHE_TTL', 60 * 60 * 24 * 7)),  # 7 days
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 5000)),
+            'CULL_FREQUENCY': 4,  # Drop a quarter of the entries when full
+        },
+    }
+}
+
+# Use Redis when available (configure maxmemory-policy allkeys-lru for LRU eviction)
+if 'REDIS_URL' in os.environ:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+        'TIMEOUT': CACHES['default']['TIMEOUT'],
+    }
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -145,8 +178,166 @@ REST_FRAMEWORK = {
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# PDF extraction: large documents are split across a process pool
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 1000))
+PDF_MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', 400000))  # Stop extracting once this much text is collected
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 100))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 25))
+PDF_EXTRACTION_PROCESSES = int(os.getenv('PDF_EXTRACTION_PROCESSES', min(4, os.cpu_count() or 1)))
+PDF_PROCESS_START_METHOD = os.getenv('PDF_PROCESS_START_METHOD', 'spawn')  # Safe in threaded workers
+
 # Groq API settings
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', 60))  # Seconds per HTTP attempt
+GROQ_DEADLINE = float(os.getenv('GROQ_DEADLINE', 100))  # Seconds for all attempts, below gunicorn's --timeout
+GROQ_MIN_ATTEMPT_SECONDS = float(os.getenv('GROQ_MIN_ATTEMPT_SECONDS', 5))  # No attempt starts with less left
+GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', 4))
+GROQ_BACKOFF_BASE = float(os.getenv('GROQ_BACKOFF_BASE', 0.5))  # Seconds, doubled per retry
+GROQ_BACKOFF_CAP = float(os.getenv('GROQ_BACKOFF_CAP', 8))
+GROQ_MAX_CONNECTIONS = int(os.getenv('GROQ_MAX_CONNECTIONS', 10))  # Keep-alive pool per process
+
+# Image OCR: providers are raced, hedging to the next one after OCR_HEDGE_DELAY seconds
+OCR_HEDGE_DELAY = float(os.getenv('OCR_HEDGE_DELAY', 2))
+OCR_PROVIDER_TIMEOUT = float(os.getenv('OCR_PROVIDER_TIMEOUT', 20))  # Seconds per provider request
+OCR_DEADLINE = float(os.getenv('OCR_DEADLINE', 30))  # Seconds for the whole race
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', 8))  # Shared per process
+OCR_BREAKER_WINDOW = int(os.getenv('OCR_BREAKER_WINDOW', 20))  # Recent calls tracked per provider
+OCR_BREAKER_MIN_CALLS = int(os.getenv('OCR_BREAKER_MIN_CALLS', 3))
+OCR_BREAKER_ERROR_RATE = float(os.getenv('OCR_BREAKER_ERROR_RATE', 0.5))  # Opens the circuit
+OCR_BREAKER_COOLDOWN = float(os.getenv('OCR_BREAKER_COOLDOWN', 60))  # Seconds before a trial call
+
+# OCR image preprocessing (grayscale, margins cropped, resized to what OCR needs)
+OCR_MAX_PIXELS = int(os.getenv('OCR_MAX_PIXELS', 4_000_000))  # Pixel budget after downsampling
+OCR_TARGET_DPI = int(os.getenv('OCR_TARGET_DPI', 300))  # Scans above this resolution are downsampled
+OCR_MAX_INPUT_PIXELS = int(os.getenv('OCR_MAX_INPUT_PIXELS', 80_000_000))  # Larger images are rejected
+OCR_BINARIZE = os.getenv('OCR_BINARIZE', 'False').lower() == 'true'  # Black and white instead of grayscale
+OCR_JPEG_QUALITY = int(os.getenv('OCR_JPEG_QUALITY', 85))
+OCR_PREPROCESS_WORKERS = int(os.getenv('OCR_PREPROCESS_WORKERS', 2))  # Shared per process
+
+# OCR results are cached in the shared Django cache (CACHES) by image content
+OCR_CACHE = os.getenv('OCR_CACHE', 'True').lower() == 'true'
+OCR_CACHE_TTL = int(os.getenv('OCR_CACHE_TTL', 86400 * 30))  # Seconds
+# Also match re-encoded or resized copies by perceptual hash; very similar slides could share a hash
+OCR_CACHE_PERCEPTUAL = os.getenv('OCR_CACHE_PERCEPTUAL', 'False').lower() == 'true'
+OCR_CACHE_HASH_SIZE = int(os.getenv('OCR_CACHE_HASH_SIZE', 16))  # Hash is HASH_SIZE squared bits
+
+# OCR providers, tried in order of PRIORITY then COST (relative cost per image)
+# The local engine is skipped automatically when its binary is not installed
+OCR_LOCAL_ENGINE = os.getenv('OCR_LOCAL_ENGINE', 'True').lower() == 'true'
+OCR_LOCAL_PROCESSES = int(os.getenv('OCR_LOCAL_PROCESSES', min(2, os.cpu_count() or 1)))
+OCR_PROVIDERS = [
+    {
+        'NAME': 'tesseract',
+        'BACKEND': 'analyzer.utils.ocr_providers.TesseractProvider',
+        'ENABLED': OCR_LOCAL_ENGINE,
+        'PRIORITY': 0,
+        'COST': 0,
+        'HEDGE_DELAY': float(os.getenv('OCR_LOCAL_HEDGE_DELAY', 8)),  # Give the local engine time before going remote
+        'COMMAND': os.getenv('TESSERACT_COMMAND', 'tesseract'),
+        'LANGUAGE': os.getenv('TESSERACT_LANGUAGE', 'eng'),
+    },
+    {'NAME': 'ocr_space_free', 'BACKEND': 'analyzer.utils.ocr_providers.OCRSpaceProvider', 'PRIORITY': 10, 'COST': 1},
+    {'NAME': 'api_ninjas_free', 'BACKEND': 'analyzer.utils.ocr_providers.APINinjasProvider', 'PRIORITY': 20, 'COST': 1},
+    {'NAME': 'ocr_web_service', 'BACKEND': 'analyzer.utils.ocr_providers.FreeOCRWebProvider', 'PRIORITY': 30, 'COST': 1},
+    {'NAME': 'image_to_text_free', 'BACKEND': 'analyzer.utils.ocr_providers.OCRSpaceDataURLProvider', 'PRIORITY': 40, 'COST': 2},
+]
+
+# Groq and the OCR web services: "live", "record" (live, saving every exchange to
+# STANDIN_RECORDINGS_DIR) or "replay" (recorded responses served offline, no API key needed)
+EXTERNAL_SERVICES = os.getenv('EXTERNAL_SERVICES', 'live')
+STANDIN_RECORDINGS_DIR = os.getenv('STANDIN_RECORDINGS_DIR', str(BASE_DIR / 'recordings'))
+STANDIN_SEED = os.getenv('STANDIN_SEED', '0')  # Same seed, same simulated latencies and failures
+
+
+def standin_service(prefix, median_ms):
+    """Simulated latency (recorded, none, fixed, uniform or lognormal) and failure rates for replay"""
+    return {
+        'LATENCY': os.getenv(f'{prefix}_LATENCY', 'recorded'),
+        'SCALE': float(os.getenv(f'{prefix}_LATENCY_SCALE', 1)),  # Multiplies recorded latencies
+        'MEDIAN_MS': float(os.getenv(f'{prefix}_LATENCY_MEDIAN_MS', median_ms)),
+        'SIGMA': float(os.getenv(f'{prefix}_LATENCY_SIGMA', 0.5)),  # Lognormal spread
+        'ERROR_RATE': float(os.getenv(f'{prefix}_ERROR_RATE', 0)),  # 429/503 responses
+        'TIMEOUT_RATE': float(os.getenv(f'{prefix}_TIMEOUT_RATE', 0)),  # Requests that hang until their timeout
+    }
+
+
+STANDIN = {
+    'groq': standin_service('STANDIN_GROQ', 2500),
+    'ocr': standin_service('STANDIN_OCR', 1500),
+}
+
+# Long documents are analyzed in chunks (map) whose results are merged (reduce)
+ANALYSIS_CHUNK_SIZE = int(os.getenv('ANALYSIS_CHUNK_SIZE', 10000))  # Characters per chunk
+ANALYSIS_CHUNK_CONCURRENCY = int(os.getenv('ANALYSIS_CHUNK_CONCURRENCY', 3))
+ANALYSIS_MAX_DOCUMENT_CHARS = int(os.getenv('ANALYSIS_MAX_DOCUMENT_CHARS', 200000))  # In the job worker
+# Analyses run inside a request stop at ANALYSIS_SYNC_MAX_CHARS: three chunks analyzed in one
+# concurrent round plus the merge fit gunicorn's 120 s timeout; only the first part of a longer
+# document is analyzed. With ANALYSIS_QUEUE_LONG_DOCUMENTS on (needs a running job worker, and a
+# client that handles 202), longer documents are queued instead unless the request sends "background": false.
+ANALYSIS_SYNC_MAX_CHARS = int(os.getenv('ANALYSIS_SYNC_MAX_CHARS', 30000))
+ANALYSIS_QUEUE_LONG_DOCUMENTS = os.getenv('ANALYSIS_QUEUE_LONG_DOCUMENTS', 'False').lower() == 'true'
+
+# Metrics served at /api/metrics/ in the Prometheus format. Each process (gunicorn worker,
+# job worker) writes its values to METRICS_DIR and a scrape adds them up; empty keeps them
+# in-process only. Clear the directory when deploying to start counting from zero.
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'smart_note_analyzer_metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))  # Seconds between writes per process
+# Scrapes need "Authorization: Bearer <token>"; without a token metrics are only served when DEBUG
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Request profiling: requests with the X-Profile header (set to PROFILING_TOKEN, or from a staff
+# user) or picked at PROFILING_SAMPLE_RATE are profiled; artifacts are listed at /api/profiles/
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))  # Fraction of all requests
+PROFILING_MODE = os.getenv('PROFILING_MODE', 'sampling')  # "sampling" or "cprofile", both of the request thread
+PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', 0.005))  # Seconds between stack samples
+PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'smart_note_analyzer_profiles'))
+PROFILING_MAX_ARTIFACTS = int(os.getenv('PROFILING_MAX_ARTIFACTS', 50))
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 10))  # Slower requests are logged with a stage breakdown
+
+# History endpoint: cursor pages of compact entries
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+HISTORY_COMPARISON_PAGE_SIZE = int(os.getenv('HISTORY_COMPARISON_PAGE_SIZE', 10))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 100))
+HISTORY_SUMMARY_PREVIEW_CHARS = int(os.getenv('HISTORY_SUMMARY_PREVIEW_CHARS', 300))
+TAG_FACET_LIMIT = int(os.getenv('TAG_FACET_LIMIT', 50))  # Most common tags returned as facets
+
+# Note texts and analysis JSON are stored zlib-compressed, by default without a preset
+# dictionary (0). Train one on real rows with `manage.py train_compression_dictionary --source db`,
+# commit it to analyzer/dictionaries and set its id here; older dictionaries stay readable.
+COMPRESSION_DICTIONARY = int(os.getenv('COMPRESSION_DICTIONARY', 0))
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 6))  # zlib level, 1 (fastest) to 9 (smallest)
+
+# Full-text search at /api/search/ and in the admin (Postgres tsvector, SQLite FTS5)
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'english')  # Postgres text search configuration
+SEARCH_ADMIN_LIMIT = int(os.getenv('SEARCH_ADMIN_LIMIT', 1000))  # Best matches listed by an admin search
+
+# Note comparisons: the similarity score is computed locally; the LLM only writes the
+# prose summary, and only when this is on and the request does not send llm_summary=false
+COMPARISON_LLM_SUMMARY = os.getenv('COMPARISON_LLM_SUMMARY', 'True').lower() == 'true'
+COMPARISON_BATCH_MAX_NOTES = int(os.getenv('COMPARISON_BATCH_MAX_NOTES', 200))  # Notes per batch comparison
+COMPARISON_BATCH_MAX_NOTE_CHARS = int(os.getenv('COMPARISON_BATCH_MAX_NOTE_CHARS', 50000))  # Per note sent as text
+COMPARISON_BATCH_MAX_TOTAL_CHARS = int(os.getenv('COMPARISON_BATCH_MAX_TOTAL_CHARS', 1000000))  # All notes of a batch
+COMPARISON_BATCH_MAX_SUMMARIES = int(os.getenv('COMPARISON_BATCH_MAX_SUMMARIES', 10))  # LLM summaries per batch
+COMPARISON_CLUSTER_THRESHOLD = float(os.getenv('COMPARISON_CLUSTER_THRESHOLD', 50))  # Score joining two notes' clusters
+
+# Idle seconds before a keep-alive comment is sent on streaming analysis responses
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 10))
+
+# "staged" sends one request per stage, "combined" asks for everything in one request
+ANALYSIS_MODE = os.getenv('ANALYSIS_MODE', 'staged')
+
+# Run the independent analysis stages (summary, topic graph, quiz) in parallel
+ANALYSIS_CONCURRENT_STAGES = os.getenv('ANALYSIS_CONCURRENT_STAGES', 'True').lower() == 'true'
+ANALYSIS_STAGE_WORKERS = int(os.getenv('ANALYSIS_STAGE_WORKERS', 6))  # Shared per process
+
+# Background analysis jobs (processed by `manage.py process_analysis_jobs`)
+ANALYSIS_BACKGROUND_JOBS = os.getenv('ANALYSIS_BACKGROUND_JOBS', 'False').lower() == 'true'  # Default for requests
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', 3))
+ANALYSIS_JOB_CONCURRENCY = int(os.getenv('ANALYSIS_JOB_CONCURRENCY', 2))
+# Seconds a job stays claimed without a heartbeat; running jobs renew it every third of this
+ANALYSIS_JOB_VISIBILITY_TIMEOUT = int(os.getenv('ANALYSIS_JOB_VISIBILITY_TIMEOUT', 300))
+ANALYSIS_JOB_RETRY_DELAY = int(os.getenv('ANALYSIS_JOB_RETRY_DELAY', 10))  # Seconds, doubles per attempt
 
 # Session settings for user isolation
 SESSION_COOKIE_AGE = 86400 * 7  # 7 days
@@ -12,8 +12,11 @@ def api_root(request):
             'health': '/api/health/',
             'analyze_text': '/api/analyze-text/',
             'analyze_file': '/api/analyze-file/',
+            'analyze_text_stream': '/api/analyze-text/stream/',
+            'analyze_file_stream': '/api/analyze-file/stream/',
             'compare_notes': '/api/compare-notes/',
             'analysis_history': '/api/analysis-history/',
+            'analysis_job': '/api/jobs/<job_id>/',
         }
     })
 
@@ -1,13 +1,14 @@
 import React, { useState, useEffect } from 'react';
 import { Clock, FileText, GitCompare, Trash2, Eye } from 'lucide-react';
 import toast from 'react-hot-toast';
-import { getAnalysisHistory } from '../services/api';
+import { getAnalysis, getAnalysisHistory } from '../services/api';
 
 const HistoryView = () => {
   const [history, setHistory] = useState({ analyses: [], comparisons: [] });
   const [loading, setLoading] = useState(true);
   const [activeTab, setActiveTab] = useState('analyses');
   const [selectedItem, setSelectedItem] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchHistory();
@@ -24,6 +25,31 @@ const HistoryView = () => {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const data = await getAnalysisHistory(history.next_cursor);
+      setHistory((current) => ({
+        ...current,
+        analyses: [...current.analyses, ...data.analyses],
+        next_cursor: data.next_cursor,
+      }));
+    } catch (error) {
+      toast.error('Failed to load more history');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // History entries are compact; the full analysis is fetched when opened
+  const openAnalysis = async (analysis) => {
+    try {
+      setSelectedItem(await getAnalysis(analysis.id));
+    } catch (error) {
+      toast.error('Failed to load analysis');
+    }
+  };
+
   const formatDate = (dateString) => {
     return new Date(dateString).toLocaleDateString('en-US', {
       year: 'numeric',
@@ -126,7 +152,7 @@ const HistoryView = () => {
                       </div>
                     </div>
                     <p className="text-gray-700 dark:text-gray-300 mb-3">
-                      {analysis.summary}
+                      {analysis.summary_preview}
                     </p>
                     {analysis.tags && analysis.tags.length > 0 && (
                       <div className="flex flex-wrap gap-2">
@@ -139,7 +165,7 @@ const HistoryView = () => {
                     )}
                   </div>
                   <button
-                    onClick={() => setSelectedItem(analysis)}
+                    onClick={() => openAnalysis(analysis)}
                     className="ml-4 p-2 text-gray-400 hover:text-gray-600 dark:hover:text-gray-300 transition-colors"
                   >
                     <Eye className="h-5 w-5" />
@@ -148,6 +174,17 @@ const HistoryView = () => {
               </div>
             ))
           )}
+          {history.next_cursor && (
+            <div className="text-center">
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="px-4 py-2 rounded-md bg-gray-100 dark:bg-gray-800 text-gray-700 dark:text-gray-300 hover:bg-gray-200 dark:hover:bg-gray-700 transition-colors disabled:opacity-50"
+              >
+                {loadingMore ? 'Loading...' : 'Load more'}
+              </button>
+            </div>
+          )}
         </div>
       )}
 
@@ -86,9 +86,9 @@ export const compareNotes = async (note1, note2) => {
   }
 };
 
-export const getAnalysisHistory = async () => {
+export const getAnalysisHistory = async (cursor = null) => {
   try {
-    const response = await api.get('/analysis-history/');
+    const response = await api.get('/analysis-history/', { params: cursor ? { cursor } : {} });
     return response.data;
   } catch (error) {
     console.error('History fetch error:', error);
@@ -96,4 +96,14 @@ export const getAnalysisHistory = async () => {
   }
 };
 
+export const getAnalysis = async (id) => {
+  try {
+    const response = await api.get(`/analysis-history/${id}/`);
+    return response.data;
+  } catch (error) {
+    console.error('Analysis fetch error:', error);
+    throw error;
+  }
+};
+
 export default api;
\ No newline at end of file